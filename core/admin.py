@@ -1,8 +1,13 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from django.http import HttpResponseRedirect
+from django.urls import reverse
 from .models import (
     Categoria, Despesa, Conta, CartaoDeCredito, Receita, CategoriaReceita,
-    MetaFinanceira, Familia, Perfil, Investimento, AporteInvestimento, Plano, Assinatura
+    MetaFinanceira, Familia, Perfil, Investimento, AporteInvestimento, Plano, Assinatura, TarefaExclusao
 )
+from .services.exclusao import agendar_exclusao
 
 # ... (todos os outros registros: admin.site.register(Categoria), etc.)
 admin.site.register(Categoria)
@@ -12,7 +17,6 @@ admin.site.register(CartaoDeCredito)
 admin.site.register(Receita)
 admin.site.register(CategoriaReceita)
 admin.site.register(MetaFinanceira)
-admin.site.register(Familia)
 admin.site.register(Perfil)
 
 # Adicione estas duas linhas
@@ -20,4 +24,50 @@ admin.site.register(Investimento)
 admin.site.register(AporteInvestimento)
 
 admin.site.register(Plano)
-admin.site.register(Assinatura)
\ No newline at end of file
+admin.site.register(Assinatura)
+
+class ExclusaoEmLotesAdmin(admin.ModelAdmin):
+    """
+    Exclui pelo mesmo caminho em lotes e em segundo plano do restante do sistema
+    (core/services/exclusao.py), em vez do delete() em cascata dentro da requisição.
+    A confirmação também não percorre os objetos relacionados, que podem ser milhares.
+    """
+    alvo_exclusao = None
+
+    def get_deleted_objects(self, objs, request):
+        return [str(obj) for obj in objs], {}, set(), []
+
+    def delete_model(self, request, obj):
+        agendar_exclusao(self.alvo_exclusao, obj, solicitado_por=request.user)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.delete_model(request, obj)
+
+    def response_delete(self, request, obj_display, obj_id):
+        self.message_user(
+            request, f'A exclusão de "{obj_display}" foi iniciada; acompanhe em Tarefas de exclusão.', messages.SUCCESS
+        )
+        return HttpResponseRedirect(reverse(
+            f'admin:{self.opts.app_label}_{self.opts.model_name}_changelist', current_app=self.admin_site.name
+        ))
+
+
+@admin.register(Familia)
+class FamiliaAdmin(ExclusaoEmLotesAdmin):
+    alvo_exclusao = TarefaExclusao.Alvo.FAMILIA
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class UsuarioAdmin(ExclusaoEmLotesAdmin, UserAdmin):
+    alvo_exclusao = TarefaExclusao.Alvo.USUARIO
+
+
+# Exclusões em lotes: só acompanhamento, as tarefas são criadas pelo sistema\[email protected](TarefaExclusao)
+class TarefaExclusaoAdmin(admin.ModelAdmin):
+    list_display = ('alvo', 'descricao', 'status', 'etapa', 'removidos', 'total', 'criado_em', 'concluido_em')
+    list_filter = ('alvo', 'status')
+    readonly_fields = [campo.name for campo in TarefaExclusao._meta.fields]
@@ -1,46 +1,166 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator, fields_for_model
+from django.urls import reverse_lazy
 from datetime import date
 from .models import (
     Despesa, Receita, MetaFinanceira, Categoria, CategoriaReceita,
     Conta, CartaoDeCredito, Investimento, AporteInvestimento
 )
+from .services.opcoes import consulta_opcoes, opcoes_familia
+
+# --- Campos de escolha alimentados pelo cache de opções da família ---
+
+class OpcoesEmCacheIterator(ModelChoiceIterator):
+    """Gera as opções a partir da lista em cache, sem consultar o queryset."""
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self.field.objetos:
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.objetos) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.objetos)
+
+class ModelChoiceFieldEmCache(forms.ModelChoiceField):
+    """
+    ModelChoiceField que renderiza e valida contra uma lista de objetos já carregada.
+    Uma escolha fora da lista (criada depois que ela foi para o cache) é procurada no
+    queryset do campo.
+    """
+    iterator = OpcoesEmCacheIterator
+
+    def __init__(self, objetos, **kwargs):
+        self.objetos = objetos
+        super().__init__(**kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        chave = str(value.pk if isinstance(value, self.queryset.model) else value)
+        for obj in self.objetos:
+            if str(obj.pk) == chave:
+                return obj
+        try:
+            return self.queryset.get(pk=chave)
+        except (ValueError, TypeError, self.queryset.model.DoesNotExist):
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+
+class OpcoesFamiliaMixin:
+    """
+    Troca os campos de chave estrangeira listados em 'campos_em_cache' (campo -> lista
+    em opcoes_familia) por campos alimentados pelo cache da família. O campo garante
+    que o objeto escolhido pertence à família; nos ModelForm, a validação do modelo
+    ainda confirma que ele existe (a lista em cache pode ter um objeto já excluído).
+    """
+    campos_em_cache = {}
+
+    def _usar_opcoes_da_familia(self, familia, opcoes=None):
+        if opcoes is None:
+            opcoes = opcoes_familia(familia.id) if familia else {}
+        for nome, lista in self.campos_em_cache.items():
+            original = self.fields[nome]
+            self.fields[nome] = ModelChoiceFieldEmCache(
+                opcoes.get(lista, []),
+                queryset=consulta_opcoes(familia.id, lista) if familia else original.queryset.none(),
+                required=original.required, label=original.label, help_text=original.help_text,
+                widget=original.widget, empty_label=original.empty_label, initial=original.initial,
+            )
+
+def _familia_do_usuario(user):
+    if user and hasattr(user, 'perfil'):
+        return user.perfil.familia
+    return None
 
 class CustomUserCreationForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         fields = UserCreationForm.Meta.fields + ('email',)
 
 # ... (todos os formulários de Despesa, Receita, Recorrentes, etc., sem alteração) ...
-class DespesaForm(forms.ModelForm):
-    numero_parcelas = forms.IntegerField(label='Número de Parcelas', min_value=1, initial=1, required=True)
+class DespesaForm(OpcoesFamiliaMixin, forms.ModelForm):
+    numero_parcelas = forms.IntegerField(label='Número de Parcelas', min_value=1, max_value=120, initial=1, required=True, help_text='Com mais de uma parcela, o valor informado é o total da compra.')
+    campos_em_cache = {'categoria': 'categorias', 'conta': 'contas', 'cartao': 'cartoes'}
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        if user and hasattr(user, 'perfil') and user.perfil.familia:
-            familia = user.perfil.familia
-            self.fields['categoria'].queryset = Categoria.objects.filter(familia=familia)
-            self.fields['conta'].queryset = Conta.objects.filter(familia=familia)
-            self.fields['cartao'].queryset = CartaoDeCredito.objects.filter(familia=familia)
-        else:
-            self.fields['categoria'].queryset = Categoria.objects.none()
-            self.fields['conta'].queryset = Conta.objects.none()
-            self.fields['cartao'].queryset = CartaoDeCredito.objects.none()
+        self._usar_opcoes_da_familia(_familia_do_usuario(user))
     class Meta:
         model = Despesa
         exclude = ['user', 'parcelada', 'parcela_atual', 'parcelas_totais', 'id_compra_parcelada', 'recorrente', 'id_recorrencia']
-        widgets = {'data': forms.DateInput(attrs={'type': 'date'})}
+        widgets = {
+            'data': forms.DateInput(attrs={'type': 'date'}),
+            # Sugere a categoria (via HTMX) a partir da descrição digitada
+            'descricao': forms.TextInput(attrs={
+                'hx-get': reverse_lazy('sugerir_categoria_despesa'),
+                'hx-trigger': 'keyup changed delay:300ms',
+                'hx-include': 'closest form',
+                'hx-target': '#id_categoria',
+                'hx-swap': 'outerHTML',
+            }),
+        }
+
+# --- Lançamento de várias despesas de uma vez (grade) ---
+
+LIMITE_LOTE = 200
+
+class DespesaLoteForm(OpcoesFamiliaMixin, forms.Form):
+    """
+    Uma linha da grade. As opções da família chegam prontas, lidas uma vez por envio.
+    Os campos vêm do modelo, mas a linha não é um ModelForm: a existência das opções
+    escolhidas é confirmada pelo formset, numa consulta por campo para todas as linhas,
+    em vez de uma por linha na validação do modelo.
+    """
+    campos_em_cache = {'categoria': 'categorias', 'conta': 'contas', 'cartao': 'cartoes'}
+    def __init__(self, *args, **kwargs):
+        familia = kwargs.pop('familia', None)
+        opcoes = kwargs.pop('opcoes', None)
+        super().__init__(*args, **kwargs)
+        self._usar_opcoes_da_familia(familia, opcoes)
+        for campo in self.fields.values():
+            campo.widget.attrs['class'] = 'form-select form-select-sm' if isinstance(campo.widget, forms.Select) else 'form-control form-control-sm'
 
-class ReceitaForm(forms.ModelForm):
+DespesaLoteForm.base_fields = fields_for_model(
+    Despesa, fields=['descricao', 'valor', 'data', 'categoria', 'conta', 'cartao'],
+    widgets={'data': forms.DateInput(attrs={'type': 'date'})},
+)
+
+class BaseDespesaLoteFormSet(forms.BaseFormSet):
+    def __init__(self, *args, user=None, **kwargs):
+        familia = _familia_do_usuario(user)
+        kwargs['form_kwargs'] = {'familia': familia, 'opcoes': opcoes_familia(familia.id) if familia else {}}
+        super().__init__(*args, **kwargs)
+
+    def clean(self):
+        super().clean()
+        # As listas em cache podem ter opções já excluídas (em outro worker, por exemplo)
+        for nome in DespesaLoteForm.campos_em_cache:
+            escolhidas = [(form, form.cleaned_data[nome]) for form in self.forms if getattr(form, 'cleaned_data', {}).get(nome)]
+            if not escolhidas:
+                continue
+            campo = self.forms[0].fields[nome]
+            existentes = set(campo.queryset.model.objects.filter(
+                pk__in={obj.pk for _, obj in escolhidas}
+            ).values_list('pk', flat=True))
+            for form, obj in escolhidas:
+                if obj.pk not in existentes:
+                    form.add_error(nome, ValidationError(
+                        campo.error_messages['invalid_choice'], code='invalid_choice', params={'value': obj.pk}
+                    ))
+
+DespesaLoteFormSet = forms.formset_factory(
+    DespesaLoteForm, formset=BaseDespesaLoteFormSet, extra=10, max_num=LIMITE_LOTE, absolute_max=LIMITE_LOTE, validate_max=True,
+)
+
+class ReceitaForm(OpcoesFamiliaMixin, forms.ModelForm):
+    campos_em_cache = {'categoria': 'categorias_receita', 'conta': 'contas'}
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        if user and hasattr(user, 'perfil') and user.perfil.familia:
-            familia = user.perfil.familia
-            self.fields['categoria'].queryset = CategoriaReceita.objects.filter(familia=familia)
-            self.fields['conta'].queryset = Conta.objects.filter(familia=familia)
-        else:
-            self.fields['categoria'].queryset = CategoriaReceita.objects.none()
-            self.fields['conta'].queryset = Conta.objects.none()
+        self._usar_opcoes_da_familia(_familia_do_usuario(user))
     class Meta:
         model = Receita
         exclude = ['user', 'recorrente', 'id_recorrencia']
@@ -51,60 +171,43 @@ FREQUENCIA_CHOICES = [
     ('trimestral', 'Trimestral'), ('semestral', 'Semestral'), ('anual', 'Anual'),
 ]
 
-class RecorrenteDespesaForm(forms.ModelForm):
+class RecorrenteDespesaForm(OpcoesFamiliaMixin, forms.ModelForm):
     data_inicio = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
     frequencia = forms.ChoiceField(choices=FREQUENCIA_CHOICES)
     repeticoes = forms.IntegerField(min_value=2, label="Número de Repetições")
+    campos_em_cache = {'categoria': 'categorias', 'conta': 'contas', 'cartao': 'cartoes'}
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        if user and hasattr(user, 'perfil') and user.perfil.familia:
-            familia = user.perfil.familia
-            self.fields['categoria'].queryset = Categoria.objects.filter(familia=familia)
-            self.fields['conta'].queryset = Conta.objects.filter(familia=familia)
-            self.fields['cartao'].queryset = CartaoDeCredito.objects.filter(familia=familia)
-        else:
-            self.fields['categoria'].queryset = Categoria.objects.none()
-            self.fields['conta'].queryset = Conta.objects.none()
-            self.fields['cartao'].queryset = CartaoDeCredito.objects.none()
+        self._usar_opcoes_da_familia(_familia_do_usuario(user))
     class Meta:
         model = Despesa
         fields = ['descricao', 'valor', 'categoria', 'conta', 'cartao']
 
-class RecorrenteReceitaForm(forms.ModelForm):
+class RecorrenteReceitaForm(OpcoesFamiliaMixin, forms.ModelForm):
     data_inicio = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
     frequencia = forms.ChoiceField(choices=FREQUENCIA_CHOICES)
     repeticoes = forms.IntegerField(min_value=2, label="Número de Repetições")
+    campos_em_cache = {'categoria': 'categorias_receita', 'conta': 'contas'}
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        if user and hasattr(user, 'perfil') and user.perfil.familia:
-            familia = user.perfil.familia
-            self.fields['categoria'].queryset = CategoriaReceita.objects.filter(familia=familia)
-            self.fields['conta'].queryset = Conta.objects.filter(familia=familia)
-        else:
-            self.fields['categoria'].queryset = CategoriaReceita.objects.none()
-            self.fields['conta'].queryset = Conta.objects.none()
+        self._usar_opcoes_da_familia(_familia_do_usuario(user))
     class Meta:
         model = Receita
         fields = ['descricao', 'valor', 'categoria', 'conta']
 
-class CategoriaForm(forms.ModelForm):
+class CategoriaForm(OpcoesFamiliaMixin, forms.ModelForm):
+    # Apenas as categorias principais da família podem ser "categoria_mae"
+    campos_em_cache = {'categoria_mae': 'categorias_principais'}
     class Meta:
         model = Categoria
-        fields = ['nome', 'orcamento_mensal', 'categoria_mae']
+        fields = ['nome', 'orcamento_mensal', 'acumular_sobra', 'categoria_mae', 'macro_categoria']
 
     def __init__(self, *args, **kwargs):
-        # Pega a família que a view vai passar
         familia = kwargs.pop('familia', None)
         super().__init__(*args, **kwargs)
-
-        if familia:
-            # Mostra apenas as categorias principais da família como opções para "categoria_mae"
-            self.fields['categoria_mae'].queryset = Categoria.objects.filter(
-                familia=familia, 
-                categoria_mae__isnull=True
-            )
+        self._usar_opcoes_da_familia(familia)
 
 class CategoriaReceitaForm(forms.ModelForm):
     class Meta:
@@ -130,58 +233,52 @@ class MetaFinanceiraForm(forms.ModelForm):
 class EntrarFamiliaForm(forms.Form):
     codigo_convite = forms.UUIDField(label="Código de Convite da Família")
 
+class MesclarForm(forms.Form):
+    """Escolha do registro que recebe as transações de uma categoria ou conta (core/services/mesclagem.py)."""
+    destino = forms.ModelChoiceField(queryset=Conta.objects.none(), label="Mover tudo para")
+
+    def __init__(self, *args, **kwargs):
+        origem = kwargs.pop('origem')
+        super().__init__(*args, **kwargs)
+        queryset = type(origem).objects.filter(familia_id=origem.familia_id).exclude(id=origem.id)
+        if isinstance(origem, Categoria):
+            queryset = queryset.select_related('categoria_mae')
+        self.fields['destino'].queryset = queryset
+
 class InvestimentoForm(forms.ModelForm):
     class Meta:
         model = Investimento
         fields = ['nome', 'tipo', 'valor_atual', 'taxa_rendimento_anual']
 
-class AporteInvestimentoForm(forms.ModelForm):
+class AporteInvestimentoForm(OpcoesFamiliaMixin, forms.ModelForm):
+    campos_em_cache = {'conta_origem': 'contas'}
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        if user and hasattr(user, 'perfil') and user.perfil.familia:
-            self.fields['conta_origem'].queryset = Conta.objects.filter(familia=user.perfil.familia)
-        else:
-            self.fields['conta_origem'].queryset = Conta.objects.none()
+        self._usar_opcoes_da_familia(_familia_do_usuario(user))
     class Meta:
         model = AporteInvestimento
         fields = ['valor', 'data', 'conta_origem']
         widgets = {'data': forms.DateInput(attrs={'type': 'date'})}
 
-class PagamentoFaturaForm(forms.Form):
+class PagamentoFaturaForm(OpcoesFamiliaMixin, forms.Form):
     conta_pagamento = forms.ModelChoiceField(queryset=Conta.objects.all(), label="Pagar com a conta", widget=forms.Select(attrs={'class': 'form-select'}))
     data_pagamento = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}), initial=date.today, label="Data do Pagamento")
+    campos_em_cache = {'conta_pagamento': 'contas'}
     def __init__(self, *args, **kwargs):
         familia = kwargs.pop('familia', None)
         super().__init__(*args, **kwargs)
-        if familia:
-            self.fields['conta_pagamento'].queryset = Conta.objects.filter(familia=familia)
+        self._usar_opcoes_da_familia(familia)
 
 
 # --- APORTEFORM ATUALIZADO ---
-class AporteForm(forms.Form):
+class AporteForm(OpcoesFamiliaMixin, forms.Form):
     valor = forms.DecimalField(max_digits=15, decimal_places=2, label="Valor do Aporte")
     conta_origem = forms.ModelChoiceField(queryset=Conta.objects.all(), label="Conta de Origem")
+    campos_em_cache = {'conta_origem': 'contas'}
 
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        if user and hasattr(user, 'perfil') and user.perfil.familia:
-            self.fields['conta_origem'].queryset = Conta.objects.filter(familia=user.perfil.familia)
-        else:
-            self.fields['conta_origem'].queryset = Conta.objects.none()
-            
-class CategoriaForm(forms.ModelForm):
-    class Meta:
-        model = Categoria
-        # Adicione o novo campo ao formulário
-        fields = ['nome', 'orcamento_mensal', 'categoria_mae', 'macro_categoria']
+        self._usar_opcoes_da_familia(_familia_do_usuario(user))
 
-    def __init__(self, *args, **kwargs):
-        familia = kwargs.pop('familia', None)
-        super().__init__(*args, **kwargs)
-        if familia:
-            self.fields['categoria_mae'].queryset = Categoria.objects.filter(
-                familia=familia, 
-                categoria_mae__isnull=True
-            )
\ No newline at end of file
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.arquivo import arquivar_ano
+
+
+class Command(BaseCommand):
+    help = "Move as despesas e receitas de um ano encerrado para o arquivo, deixando resumos mensais."
+
+    def add_arguments(self, parser):
+        parser.add_argument('ano', type=int)
+        parser.add_argument('--familia', type=int, help="Arquiva apenas os usuários desta família (id).")
+
+    def handle(self, *args, **options):
+        try:
+            movidas = arquivar_ano(options['ano'], familia_id=options['familia'])
+        except ValueError as erro:
+            raise CommandError(erro)
+        for modelo, quantidade in movidas.items():
+            self.stdout.write(self.style.SUCCESS(f"{modelo}: {quantidade} lançamentos arquivados."))
@@ -0,0 +1,37 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Familia, Investimento, TarefaExclusao
+from core.services.exclusao import criar_tarefa, executar_exclusao, tarefas_a_retomar
+
+MODELOS = {
+    TarefaExclusao.Alvo.FAMILIA: Familia,
+    TarefaExclusao.Alvo.USUARIO: User,
+    TarefaExclusao.Alvo.INVESTIMENTO: Investimento,
+}
+
+
+class Command(BaseCommand):
+    help = "Exclui em lotes uma família, usuário ou investimento, ou retoma as exclusões interrompidas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('alvo', nargs='?', choices=TarefaExclusao.Alvo.values)
+        parser.add_argument('id', nargs='?', type=int)
+        parser.add_argument('--retomar', action='store_true', help="Retoma as tarefas não concluídas.")
+
+    def handle(self, *args, **options):
+        if options['retomar']:
+            tarefas = list(tarefas_a_retomar())
+        elif options['alvo'] and options['id']:
+            objeto = MODELOS[options['alvo']].objects.filter(pk=options['id']).first()
+            if objeto is None:
+                raise CommandError(f"{options['alvo']} {options['id']} não encontrado.")
+            # Se o objeto já tem uma exclusão não concluída, ela é retomada
+            tarefa, _ = criar_tarefa(options['alvo'], objeto)
+            tarefas = [tarefa]
+        else:
+            raise CommandError("Informe o alvo e o id, ou use --retomar.")
+
+        for tarefa in tarefas:
+            executar_exclusao(tarefa)
+            self.stdout.write(self.style.SUCCESS(f"{tarefa}: {tarefa.removidos} linhas removidas."))
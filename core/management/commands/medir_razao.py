@@ -0,0 +1,57 @@
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+
+from core.models import Conta, Despesa, Familia, Receita
+from core.services.razao import movimento_arquivado, saldos_contas
+
+
+class Command(BaseCommand):
+    help = "Compara o tempo dos saldos das contas lidos das tabelas de despesas e receitas com o do razão."
+
+    def add_arguments(self, parser):
+        parser.add_argument('familia', type=int)
+        parser.add_argument('--repeticoes', type=int, default=20)
+
+    def handle(self, *args, **options):
+        familia = Familia.objects.filter(id=options['familia']).first()
+        if familia is None:
+            raise CommandError(f"Família {options['familia']} não encontrada.")
+        contas = list(Conta.objects.filter(familia=familia))
+        usuarios = list(User.objects.filter(perfil__familia=familia))
+        user_ids = [u.id for u in usuarios]
+        conta_ids = [c.id for c in contas]
+        hoje = date.today()
+
+        def por_conta(modelo):
+            return dict(modelo.objects.filter(
+                conta_id__in=conta_ids, user_id__in=user_ids, data__lte=hoje
+            ).values('conta_id').annotate(total=Sum('valor')).order_by().values_list('conta_id', 'total'))
+
+        def duas_tabelas():
+            # O mesmo cálculo de saldos_contas sem o razão: receitas e despesas agrupadas
+            # por conta, uma consulta em cada tabela, mais os resumos arquivados
+            receitas, despesas = por_conta(Receita), por_conta(Despesa)
+            arquivados = movimento_arquivado(conta_ids, user_ids, hoje)
+            return {
+                c.id: c.saldo_inicial + (receitas.get(c.id) or Decimal('0.00')) - (despesas.get(c.id) or Decimal('0.00'))
+                + (arquivados.get(c.id) or Decimal('0.00'))
+                for c in contas
+            }
+
+        def razao():
+            return saldos_contas(contas, usuarios, hoje)
+
+        if duas_tabelas() != razao():
+            raise CommandError("Os dois cálculos deram saldos diferentes.")
+        for nome, funcao in (('Despesas + receitas', duas_tabelas), ('Razão', razao)):
+            funcao()  # aquece o cache do banco
+            inicio = time.perf_counter()
+            for _ in range(options['repeticoes']):
+                funcao()
+            media = (time.perf_counter() - inicio) / options['repeticoes'] * 1000
+            self.stdout.write(f"{nome}: {media:.2f} ms por cálculo ({len(contas)} contas)")
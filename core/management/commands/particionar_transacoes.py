@@ -0,0 +1,104 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import Despesa, Receita
+from core.services.razao import instalar_razao
+
+# --- Particionamento anual (somente PostgreSQL) ---
+# Converte core_despesa e core_receita em tabelas particionadas por faixa de 'data',
+# uma partição por ano e uma partição DEFAULT para o que cair fora delas. Consultas
+# com filtro de data (listas, faturas, relatórios) passam a ler só as partições do
+# período. Rodar de novo apenas cria as partições dos anos seguintes, então o comando
+# pode ficar agendado perto da virada do ano.
+#
+# Em tabelas particionadas toda chave única precisa conter a coluna de partição, por
+# isso a chave primária passa a ser (id, data); o id continua vindo de uma sequência.
+
+
+def _q(nome):
+    return connection.ops.quote_name(nome)
+
+
+class Command(BaseCommand):
+    help = "Particiona as tabelas de despesas e receitas por ano (PostgreSQL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anos-a-frente', type=int, default=1,
+                            help="Quantos anos futuros devem ter partição criada (padrão: 1).")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("O particionamento só é suportado no PostgreSQL.")
+
+        ultimo_ano = date.today().year + options['anos_a_frente']
+        for modelo in (Despesa, Receita):
+            tabela = modelo._meta.db_table
+            with transaction.atomic(), connection.cursor() as cursor:
+                if not self._particionada(cursor, tabela):
+                    self._converter(cursor, tabela)
+                    self.stdout.write(f"{tabela}: convertida para tabela particionada.")
+                criadas = self._criar_particoes(cursor, tabela, ultimo_ano)
+            self.stdout.write(self.style.SUCCESS(f"{tabela}: {criadas} partições anuais criadas."))
+
+    def _particionada(self, cursor, tabela):
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [tabela])
+        return cursor.fetchone()[0] == 'p'
+
+    def _converter(self, cursor, tabela):
+        legado = f"{tabela}_legado"
+        sequencia = f"{tabela}_id_part_seq"
+
+        # Guarda índices (exceto a chave primária) e chaves estrangeiras para recriar depois
+        cursor.execute("""
+            SELECT indexdef FROM pg_indexes i
+            WHERE i.tablename = %s AND i.indexname NOT IN (
+                SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'
+            )""", [tabela, tabela])
+        indices = [linha[0] for linha in cursor.fetchall()]
+        cursor.execute("""
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'""", [tabela])
+        chaves_estrangeiras = cursor.fetchall()
+
+        cursor.execute(f"LOCK TABLE {_q(tabela)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"ALTER TABLE {_q(tabela)} RENAME TO {_q(legado)}")
+        cursor.execute(f"""
+            CREATE TABLE {_q(tabela)} (LIKE {_q(legado)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE (data)""")
+        cursor.execute(f"ALTER TABLE {_q(tabela)} ADD PRIMARY KEY (id, data)")
+        cursor.execute(f"CREATE SEQUENCE {_q(sequencia)} OWNED BY {_q(tabela)}.id")
+        cursor.execute(f"ALTER TABLE {_q(tabela)} ALTER COLUMN id SET DEFAULT nextval('{sequencia}')")
+
+        cursor.execute(f"SELECT EXTRACT(YEAR FROM MIN(data))::int FROM {_q(legado)}")
+        primeiro_ano = cursor.fetchone()[0] or date.today().year
+        self._criar_particoes(cursor, tabela, date.today().year, primeiro_ano)
+        cursor.execute(f"CREATE TABLE {_q(tabela + '_padrao')} PARTITION OF {_q(tabela)} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {_q(tabela)} SELECT * FROM {_q(legado)}")
+        cursor.execute(f"SELECT setval('{sequencia}', COALESCE((SELECT MAX(id) FROM {_q(tabela)}), 0) + 1, false)")
+        cursor.execute(f"DROP TABLE {_q(legado)}")
+
+        for definicao in indices:
+            cursor.execute(definicao)
+        for nome, definicao in chaves_estrangeiras:
+            cursor.execute(f"ALTER TABLE {_q(tabela)} ADD CONSTRAINT {_q(nome)} {definicao}")
+        # Os triggers do razão ficaram na tabela antiga; a cópia acima não passou por eles
+        instalar_razao(connection)
+
+    def _criar_particoes(self, cursor, tabela, ultimo_ano, primeiro_ano=None):
+        if primeiro_ano is None:
+            primeiro_ano = date.today().year
+        criadas = 0
+        for ano in range(primeiro_ano, ultimo_ano + 1):
+            particao = f"{tabela}_{ano}"
+            cursor.execute("SELECT to_regclass(%s)", [particao])
+            if cursor.fetchone()[0]:
+                continue
+            cursor.execute(
+                f"CREATE TABLE {_q(particao)} PARTITION OF {_q(tabela)} "
+                f"FOR VALUES FROM ('{date(ano, 1, 1)}') TO ('{date(ano + 1, 1, 1)}')"
+            )
+            criadas += 1
+        return criadas
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.services.arquivo import restaurar_ano
+
+
+class Command(BaseCommand):
+    help = "Devolve as despesas e receitas arquivadas de um ano às tabelas principais."
+
+    def add_arguments(self, parser):
+        parser.add_argument('ano', type=int)
+        parser.add_argument('--familia', type=int, help="Restaura apenas os usuários desta família (id).")
+
+    def handle(self, *args, **options):
+        restauradas = restaurar_ano(options['ano'], familia_id=options['familia'])
+        for modelo, quantidade in restauradas.items():
+            self.stdout.write(self.style.SUCCESS(f"{modelo}: {quantidade} lançamentos restaurados."))
@@ -0,0 +1,299 @@
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from math import inf
+
+from django.conf import settings
+from django.db import connections
+
+# --- Métricas no formato do Prometheus ---
+# Cada processo agrega suas métricas na memória (contadores e histogramas, sem
+# dependências externas). Com vários workers do gunicorn, cada um grava de tempos em
+# tempos um arquivo próprio em METRICAS_DIR (metricas_<pid>.json, com escrita
+# atômica), e o /metrics soma os arquivos de todos os processos, do mesmo jeito que
+# o "multiprocess mode" do prometheus_client. Sem METRICAS_DIR, vale só o processo
+# que atende o /metrics (o bastante para o runserver e os testes).
+#
+# Os arquivos de workers que já terminaram continuam sendo somados, para os
+# contadores nunca voltarem atrás; só o RSS (um valor do momento) é mostrado apenas
+# para processos vivos. Limpe o diretório ao reiniciar o serviço.
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+BUCKETS_ATRASO = (1, 5, 15, 30, 60, 300, 900, 3600)
+
+# nome: (tipo, ajuda, buckets)
+METRICAS = {
+    'http_requisicoes_total': ('counter', "Requisições atendidas, por view e status.", None),
+    'http_requisicao_segundos': ('histogram', "Tempo de resposta das requisições, por view.", BUCKETS_SEGUNDOS),
+    'db_consultas_por_requisicao': ('histogram', "Consultas ao banco feitas em cada requisição, por view.", BUCKETS_CONSULTAS),
+    'db_consulta_segundos': ('histogram', "Tempo de cada consulta ao banco, por alias.", BUCKETS_SEGUNDOS),
+    'webhook_atraso_segundos': ('histogram', "Tempo entre a criação do evento no Stripe e o seu processamento.", BUCKETS_ATRASO),
+    'cache_eventos_total': ('counter', "Eventos de obter_ou_calcular (acertos, falhas, vencidos, esperas), por cache.", None),
+}
+
+_trava = threading.Lock()
+_contadores = {}
+_histogramas = {}
+_ultima_gravacao = 0.0
+
+
+def _rotulos(rotulos):
+    return tuple(sorted(rotulos.items()))
+
+
+def contar(nome, valor=1, **rotulos):
+    chave = (nome, _rotulos(rotulos))
+    with _trava:
+        _contadores[chave] = _contadores.get(chave, 0) + valor
+
+
+def valor_contador(nome, **rotulos):
+    """Valor atual do contador neste processo."""
+    with _trava:
+        return _contadores.get((nome, _rotulos(rotulos)), 0)
+
+
+def observar(nome, valor, **rotulos):
+    """Registra uma observação no histograma 'nome' (ver METRICAS)."""
+    buckets = METRICAS[nome][2]
+    chave = (nome, _rotulos(rotulos))
+    with _trava:
+        dados = _histogramas.get(chave)
+        if dados is None:
+            dados = _histogramas[chave] = {'buckets': [0] * len(buckets), 'soma': 0.0, 'contagem': 0}
+        for i, limite in enumerate(buckets):
+            if valor <= limite:
+                dados['buckets'][i] += 1
+        dados['soma'] += valor
+        dados['contagem'] += 1
+
+
+def rss_bytes():
+    """Memória residente do processo atual."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Sem /proc (macOS): o pico, em bytes no macOS e em KiB no Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# --- Arquivos por processo ---
+
+def _estado():
+    with _trava:
+        return {
+            'pid': os.getpid(),
+            'rss': rss_bytes(),
+            'contadores': [[nome, rotulos, valor] for (nome, rotulos), valor in _contadores.items()],
+            'histogramas': [
+                [nome, rotulos, dict(dados, buckets=list(dados['buckets']))] for (nome, rotulos), dados in _histogramas.items()
+            ],
+        }
+
+
+def gravar_arquivo(forcar=False):
+    """Grava o estado deste processo em METRICAS_DIR, no máximo a cada METRICAS_INTERVALO_GRAVACAO segundos."""
+    global _ultima_gravacao
+    diretorio = settings.METRICAS_DIR
+    agora = time.monotonic()
+    if not diretorio or (not forcar and agora - _ultima_gravacao < settings.METRICAS_INTERVALO_GRAVACAO):
+        return
+    _ultima_gravacao = agora
+    os.makedirs(diretorio, exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, suffix='.tmp')
+    with os.fdopen(descritor, 'w') as arquivo:
+        json.dump(_estado(), arquivo)
+    os.replace(temporario, os.path.join(diretorio, f'metricas_{os.getpid()}.json'))
+
+
+def _processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _estados():
+    """Estado de todos os processos: o deste, da memória, e os dos outros, dos arquivos."""
+    estados = [_estado()]
+    diretorio = settings.METRICAS_DIR
+    if not diretorio or not os.path.isdir(diretorio):
+        return estados
+    for nome in os.listdir(diretorio):
+        if not (nome.startswith('metricas_') and nome.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(diretorio, nome)) as arquivo:
+                estado = json.load(arquivo)
+        except (OSError, ValueError):
+            continue
+        if estado['pid'] != os.getpid():
+            estados.append(estado)
+    return estados
+
+
+# --- Exposição ---
+
+def _formatar_rotulos(rotulos, extra=()):
+    pares = [(str(k), str(v)) for k, v in rotulos] + list(extra)
+    if not pares:
+        return ''
+    texto = ','.join(
+        '{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pares
+    )
+    return '{' + texto + '}'
+
+
+def _numero(valor):
+    if valor == inf:
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _cabecalho(linhas, nome, tipo, ajuda):
+    linhas.append(f"# HELP {nome} {ajuda}")
+    linhas.append(f"# TYPE {nome} {tipo}")
+
+
+def _somar(estados):
+    """Soma os contadores e histogramas de todos os processos, por nome e rótulos."""
+    contadores = {}
+    histogramas = {}
+    for estado in estados:
+        for nome, rotulos, valor in estado['contadores']:
+            chave = (nome, tuple(map(tuple, rotulos)))
+            contadores[chave] = contadores.get(chave, 0) + valor
+        for nome, rotulos, dados in estado['histogramas']:
+            chave = (nome, tuple(map(tuple, rotulos)))
+            soma = histogramas.setdefault(chave, {'buckets': [0] * len(METRICAS[nome][2]), 'soma': 0.0, 'contagem': 0})
+            soma['buckets'] = [a + b for a, b in zip(soma['buckets'], dados['buckets'])]
+            soma['soma'] += dados['soma']
+            soma['contagem'] += dados['contagem']
+    return contadores, histogramas
+
+
+def _linhas_do_registro(contadores, histogramas):
+    linhas = []
+    for nome, (tipo, ajuda, buckets) in METRICAS.items():
+        _cabecalho(linhas, nome, tipo, ajuda)
+        if tipo == 'counter':
+            for (nome_serie, rotulos), valor in sorted(contadores.items()):
+                if nome_serie == nome:
+                    linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {_numero(valor)}")
+            continue
+        for (nome_serie, rotulos), dados in sorted(histogramas.items()):
+            if nome_serie != nome:
+                continue
+            for limite, quantidade in zip((*buckets, inf), (*dados['buckets'], dados['contagem'])):
+                linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos, [('le', _numero(limite))])} {quantidade}")
+            linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {_numero(dados['soma'])}")
+            linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {dados['contagem']}")
+    return linhas
+
+
+def _linhas_dos_processos(estados):
+    linhas = []
+    _cabecalho(linhas, 'processo_rss_bytes', 'gauge', "Memória residente de cada processo vivo.")
+    for estado in sorted(estados, key=lambda e: e['pid']):
+        if estado['pid'] == os.getpid() or _processo_vivo(estado['pid']):
+            linhas.append(f"processo_rss_bytes{_formatar_rotulos((('pid', estado['pid']),))} {estado['rss']}")
+    return linhas
+
+
+def _linhas_do_cache(contadores):
+    eventos = {}
+    for (nome_serie, rotulos), valor in contadores.items():
+        if nome_serie == 'cache_eventos_total':
+            rotulos = dict(rotulos)
+            eventos.setdefault(rotulos['cache'], {})[rotulos['evento']] = valor
+
+    linhas = []
+    _cabecalho(linhas, 'cache_taxa_acerto', 'gauge', "Fração das leituras do cache atendidas sem recalcular, por cache.")
+    for nome, valores in sorted(eventos.items()):
+        acertos = valores.get('acertos', 0)
+        leituras = acertos + valores.get('falhas', 0)
+        if leituras:
+            linhas.append(f"cache_taxa_acerto{_formatar_rotulos((('cache', nome),))} {_numero(acertos / leituras)}")
+    return linhas
+
+
+def _linhas_das_tarefas():
+    from django.db.models import Count, Min
+    from django.utils import timezone
+
+    from core.models import TarefaExclusao
+
+    linhas = []
+    abertas = (TarefaExclusao.Status.PENDENTE, TarefaExclusao.Status.EXECUTANDO, TarefaExclusao.Status.ERRO)
+    por_status = {
+        item['status']: item for item in TarefaExclusao.objects.filter(status__in=abertas).values('status').annotate(
+            quantidade=Count('id'), mais_antiga=Min('criado_em')
+        ).order_by()
+    }
+    agora = timezone.now()
+    _cabecalho(linhas, 'tarefas_exclusao', 'gauge', "Exclusões em lotes ainda não concluídas, por status.")
+    for status in abertas:
+        quantidade = por_status.get(status, {}).get('quantidade', 0)
+        linhas.append(f"tarefas_exclusao{_formatar_rotulos((('status', status),))} {quantidade}")
+    _cabecalho(linhas, 'tarefas_exclusao_idade_segundos', 'gauge', "Idade da exclusão não concluída mais antiga, por status.")
+    for status in abertas:
+        item = por_status.get(status)
+        idade = (agora - item['mais_antiga']).total_seconds() if item else 0
+        linhas.append(f"tarefas_exclusao_idade_segundos{_formatar_rotulos((('status', status),))} {_numero(float(idade))}")
+    return linhas
+
+
+def exportar():
+    """Texto no formato de exposição do Prometheus (text/plain; version=0.0.4)."""
+    estados = _estados()
+    contadores, histogramas = _somar(estados)
+    linhas = (
+        _linhas_do_registro(contadores, histogramas) + _linhas_dos_processos(estados)
+        + _linhas_do_cache(contadores) + _linhas_das_tarefas()
+    )
+    return '\n'.join(linhas) + '\n'
+
+
+# --- Coleta nas requisições ---
+
+class MetricasMiddleware:
+    """Mede o tempo de cada requisição e o número e o tempo das consultas feitas nela."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        consultas = [0]
+
+        def medir_consulta(execute, sql, params, many, context):
+            inicio = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                consultas[0] += 1
+                observar('db_consulta_segundos', time.perf_counter() - inicio, banco=context['connection'].alias)
+
+        inicio = time.perf_counter()
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(medir_consulta))
+            response = self.get_response(request)
+        duracao = time.perf_counter() - inicio
+
+        # Rótulo pelo nome da rota, nunca pela URL, para não criar uma série por id
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'nao_encontrada'
+        contar('http_requisicoes_total', view=view, metodo=request.method, status=response.status_code)
+        observar('http_requisicao_segundos', duracao, view=view)
+        observar('db_consultas_por_requisicao', consultas[0], view=view)
+        gravar_arquivo()
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_plano_alter_perfil_etapa_onboarding_assinatura'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='despesa',
+            index=models.Index(fields=['user', '-data', '-id'], name='despesa_user_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receita',
+            index=models.Index(fields=['user', '-data', '-id'], name='receita_user_data_idx'),
+        ),
+    ]
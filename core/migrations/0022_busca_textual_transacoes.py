@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def instalar(apps, schema_editor):
+    from core.services.busca import instalar_busca
+    instalar_busca(schema_editor.connection, reconstruir=True)
+
+
+def remover(apps, schema_editor):
+    from core.services.busca import remover_busca
+    remover_busca(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_despesa_despesa_user_data_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(instalar, remover),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_busca_textual_transacoes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DespesaArquivada',
+            fields=[
+                ('descricao', models.CharField(max_length=255)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('data', models.DateField()),
+                ('fatura_paga', models.BooleanField(default=False, help_text='Indica se a despesa de cartão já foi paga na fatura')),
+                ('parcelada', models.BooleanField(default=False)),
+                ('parcela_atual', models.IntegerField(default=1)),
+                ('parcelas_totais', models.IntegerField(default=1)),
+                ('id_compra_parcelada', models.UUIDField(blank=True, null=True)),
+                ('recorrente', models.BooleanField(default=False)),
+                ('id_recorrencia', models.UUIDField(blank=True, null=True)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('cartao', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.cartaodecredito')),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='core.categoria')),
+                ('conta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.conta')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ReceitaArquivada',
+            fields=[
+                ('descricao', models.CharField(max_length=255)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('data', models.DateField()),
+                ('recorrente', models.BooleanField(default=False)),
+                ('id_recorrencia', models.UUIDField(blank=True, null=True)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='core.categoriareceita')),
+                ('conta', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='core.conta')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumoMensalArquivado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('D', 'Despesa'), ('R', 'Receita')], max_length=1)),
+                ('mes', models.DateField(help_text='Primeiro dia do mês')),
+                ('total', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('quantidade', models.IntegerField()),
+                ('cartao', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.cartaodecredito')),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.categoria')),
+                ('categoria_receita', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.categoriareceita')),
+                ('conta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.conta')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['conta', 'mes'], name='resumo_conta_mes_idx'), models.Index(fields=['user', 'mes'], name='resumo_user_mes_idx')],
+            },
+        ),
+    ]
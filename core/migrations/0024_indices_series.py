@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_arquivo_transacoes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='despesa',
+            index=models.Index(fields=['id_recorrencia'], name='despesa_recorrencia_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despesa',
+            index=models.Index(fields=['id_compra_parcelada'], name='despesa_compra_parcelada_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receita',
+            index=models.Index(fields=['id_recorrencia'], name='receita_recorrencia_idx'),
+        ),
+    ]
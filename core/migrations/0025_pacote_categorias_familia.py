@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+def marcar_familias_existentes(apps, schema_editor):
+    # As famílias anteriores foram criadas com o conteúdo da versão 1 do pacote 'padrao'
+    Familia = apps.get_model('core', 'Familia')
+    Familia.objects.update(pacote_categorias='padrao', versao_pacote=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_indices_series'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='familia',
+            name='pacote_categorias',
+            field=models.CharField(blank=True, default='', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='familia',
+            name='versao_pacote',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(marcar_familias_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:43
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def registrar_orcamentos_atuais(apps, schema_editor):
+    # Sem histórico anterior, o orçamento atual passa a valer para todos os meses passados
+    Categoria = apps.get_model('core', 'Categoria')
+    HistoricoOrcamento = apps.get_model('core', 'HistoricoOrcamento')
+    HistoricoOrcamento.objects.bulk_create([
+        HistoricoOrcamento(categoria_id=categoria_id, mes=datetime.date(2000, 1, 1), valor=valor)
+        for categoria_id, valor in Categoria.objects.filter(orcamento_mensal__gt=0).values_list('id', 'orcamento_mensal')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_pacote_categorias_familia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoria',
+            name='acumular_sobra',
+            field=models.BooleanField(default=False, help_text='Leva o valor não gasto do orçamento para o mês seguinte (dentro do mesmo ano).'),
+        ),
+        migrations.CreateModel(
+            name='HistoricoOrcamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primeiro dia do mês')),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historico_orcamento', to='core.categoria')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('categoria', 'mes'), name='historico_orcamento_categoria_mes_unico')],
+            },
+        ),
+        migrations.RunPython(registrar_orcamentos_atuais, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def instalar(apps, schema_editor):
+    from core.services.razao import instalar_razao
+    instalar_razao(schema_editor.connection, reconstruir=True)
+
+
+def remover(apps, schema_editor):
+    from core.services.razao import remover_razao
+    remover_razao(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_tarefa_exclusao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lancamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('D', 'Despesa'), ('R', 'Receita')], max_length=1)),
+                ('objeto_id', models.BigIntegerField(help_text='Id da despesa ou receita de origem')),
+                ('data', models.DateField()),
+                ('descricao', models.CharField(max_length=255)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('parcela_atual', models.IntegerField(null=True)),
+                ('parcelas_totais', models.IntegerField(null=True)),
+                ('cartao', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.cartaodecredito')),
+                ('categoria', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.categoria')),
+                ('categoria_receita', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.categoriareceita')),
+                ('conta', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.conta')),
+                ('familia', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.familia')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['familia', 'conta', 'data', 'user', 'valor'], name='lancamento_familia_conta_idx'), models.Index(fields=['user', 'data'], name='lancamento_user_data_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'objeto_id'), name='lancamento_origem_unica')],
+            },
+        ),
+        migrations.RunPython(instalar, remover),
+    ]
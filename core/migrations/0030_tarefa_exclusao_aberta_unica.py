@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_razao_lancamentos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='tarefaexclusao',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'concluida'), _negated=True), fields=('alvo', 'objeto_id'), name='tarefa_exclusao_aberta_unica'),
+        ),
+    ]
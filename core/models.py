@@ -12,6 +12,9 @@ from decimal import Decimal
 class Familia(models.Model):
     nome = models.CharField(max_length=100)
     codigo_convite = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    # Pacote de categorias iniciais (core.services.provisionamento) e versão aplicada
+    pacote_categorias = models.CharField(max_length=30, blank=True, default='')
+    versao_pacote = models.PositiveSmallIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.nome
@@ -57,12 +60,35 @@ class Categoria(models.Model):
         choices=MacroCategoria.choices,
         default=MacroCategoria.NAO_CLASSIFICADO
     )
+    acumular_sobra = models.BooleanField(
+        default=False,
+        help_text="Leva o valor não gasto do orçamento para o mês seguinte (dentro do mesmo ano)."
+    )
+    # Preenchido a cada save; usado pela sincronização (core/services/sincronizacao.py)
+    atualizado_em = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         if self.categoria_mae:
             return f"{self.categoria_mae.nome} -> {self.nome}"
         return self.nome
 
+class HistoricoOrcamento(models.Model):
+    """
+    Valor do orçamento de uma categoria a partir de um mês. Vale até o próximo registro,
+    para que meses passados sejam comparados com o orçamento da época.
+    """
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='historico_orcamento')
+    mes = models.DateField(help_text="Primeiro dia do mês")
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['categoria', 'mes'], name='historico_orcamento_categoria_mes_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.categoria.nome} - {self.mes:%m/%Y}: {self.valor}"
+
 class CategoriaReceita(models.Model):
     """Categorias de receita, compartilhadas pela família."""
     familia = models.ForeignKey(Familia, on_delete=models.CASCADE)
@@ -80,6 +106,7 @@ class Conta(models.Model):
     nome = models.CharField(max_length=100)
     tipo = models.CharField(max_length=2, choices=TipoConta.choices, default=TipoConta.CONTA_CORRENTE)
     saldo_inicial = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+    atualizado_em = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.nome
@@ -93,11 +120,17 @@ class Conta(models.Model):
         
         filtro_data = models.Q(data__lte=data_base)
 
-        # CORRIGIDO: usa or Decimal('0.00') para manter o tipo consistente
-        receitas = Receita.objects.filter(filtro_data, user_id__in=user_ids, conta=self).aggregate(total=Sum('valor'))['total'] or Decimal('0.00')
-        despesas = Despesa.objects.filter(filtro_data, user_id__in=user_ids, conta=self).aggregate(total=Sum('valor'))['total'] or Decimal('0.00')
-        
-        return (self.saldo_inicial + receitas) - despesas
+        # Receitas e despesas numa só leitura do razão (valores já com sinal)
+        movimento = Lancamento.objects.filter(
+            filtro_data, familia_id=self.familia_id, conta=self, user_id__in=user_ids
+        ).aggregate(total=Sum('valor'))['total'] or Decimal('0.00')
+
+        # Anos arquivados entram pelos resumos mensais
+        arquivado = ResumoMensalArquivado.objects.filter(mes__lte=data_base, user_id__in=user_ids, conta=self).aggregate(
+            total=Sum(models.Case(models.When(tipo='R', then='total'), default=-models.F('total')))
+        )['total'] or Decimal('0.00')
+
+        return self.saldo_inicial + movimento + arquivado
 
 class CartaoDeCredito(models.Model):
     """Cartões de crédito, compartilhados pela família."""
@@ -106,6 +139,7 @@ class CartaoDeCredito(models.Model):
     limite = models.DecimalField(max_digits=10, decimal_places=2)
     dia_fechamento = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(31)])
     dia_vencimento = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(31)])
+    atualizado_em = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.nome
@@ -154,8 +188,8 @@ class CartaoDeCredito(models.Model):
 
 # --- Modelos de Transação (Pertencem a um Usuário Individual) ---
 
-class Despesa(models.Model):
-    """Representa uma despesa individual, feita por um usuário específico."""
+class DespesaBase(models.Model):
+    """Campos comuns à despesa ativa e à arquivada."""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     descricao = models.CharField(max_length=255)
     valor = models.DecimalField(max_digits=10, decimal_places=2)
@@ -170,7 +204,11 @@ class Despesa(models.Model):
     id_compra_parcelada = models.UUIDField(null=True, blank=True)
     recorrente = models.BooleanField(default=False)
     id_recorrencia = models.UUIDField(null=True, blank=True)
-    
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
     def __str__(self):
         if self.parcelada:
             return f"{self.descricao} ({self.parcela_atual}/{self.parcelas_totais})"
@@ -178,8 +216,20 @@ class Despesa(models.Model):
             return f"{self.descricao} 🔁"
         return self.descricao
 
-class Receita(models.Model):
-    """Representa uma receita individual, recebida por um usuário específico."""
+class Despesa(DespesaBase):
+    """Representa uma despesa individual, feita por um usuário específico."""
+
+    class Meta:
+        indexes = [
+            # Atende a paginação por cursor das listas: filtra por usuário e ordena por (data, id)
+            models.Index(fields=['user', '-data', '-id'], name='despesa_user_data_idx'),
+            # Operações em série (editar/excluir todas as ocorrências)
+            models.Index(fields=['id_recorrencia'], name='despesa_recorrencia_idx'),
+            models.Index(fields=['id_compra_parcelada'], name='despesa_compra_parcelada_idx'),
+        ]
+
+class ReceitaBase(models.Model):
+    """Campos comuns à receita ativa e à arquivada."""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     descricao = models.CharField(max_length=255)
     valor = models.DecimalField(max_digits=10, decimal_places=2)
@@ -188,12 +238,116 @@ class Receita(models.Model):
     conta = models.ForeignKey(Conta, on_delete=models.PROTECT)
     recorrente = models.BooleanField(default=False)
     id_recorrencia = models.UUIDField(null=True, blank=True)
-    
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
     def __str__(self):
         if self.recorrente:
             return f"{self.descricao} 🔁"
         return self.descricao
 
+class Receita(ReceitaBase):
+    """Representa uma receita individual, recebida por um usuário específico."""
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-data', '-id'], name='receita_user_data_idx'),
+            models.Index(fields=['id_recorrencia'], name='receita_recorrencia_idx'),
+        ]
+
+# --- Arquivo de Transações de Anos Fechados (ver core/services/arquivo.py) ---
+
+class DespesaArquivada(DespesaBase):
+    """Despesa de um ano fechado, movida para fora da tabela principal. Mantém o id original."""
+    id = models.BigIntegerField(primary_key=True)
+
+class ReceitaArquivada(ReceitaBase):
+    """Receita de um ano fechado, movida para fora da tabela principal. Mantém o id original."""
+    id = models.BigIntegerField(primary_key=True)
+
+class ResumoMensalArquivado(models.Model):
+    """
+    Totais mensais deixados no lugar das transações arquivadas, para que saldos,
+    projeções e gráficos continuem corretos (com resolução mensal) sem ler o arquivo.
+    """
+    class Tipo(models.TextChoices):
+        DESPESA = 'D', 'Despesa'
+        RECEITA = 'R', 'Receita'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=1, choices=Tipo.choices)
+    mes = models.DateField(help_text="Primeiro dia do mês")
+    conta = models.ForeignKey(Conta, on_delete=models.PROTECT, null=True, blank=True)
+    cartao = models.ForeignKey(CartaoDeCredito, on_delete=models.PROTECT, null=True, blank=True)
+    categoria = models.ForeignKey(Categoria, on_delete=models.PROTECT, null=True, blank=True)
+    categoria_receita = models.ForeignKey(CategoriaReceita, on_delete=models.PROTECT, null=True, blank=True)
+    total = models.DecimalField(max_digits=15, decimal_places=2)
+    quantidade = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conta', 'mes'], name='resumo_conta_mes_idx'),
+            models.Index(fields=['user', 'mes'], name='resumo_user_mes_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.mes:%m/%Y}: {self.total}"
+
+# --- Razão unificado de receitas e despesas (ver core/services/razao.py) ---
+
+class Lancamento(models.Model):
+    """
+    Espelho de Despesa e Receita numa única tabela, com o valor já com sinal
+    (receitas positivas, despesas negativas). É mantido por triggers no banco:
+    nunca grave aqui pelo ORM.
+    """
+    class Tipo(models.TextChoices):
+        DESPESA = 'D', 'Despesa'
+        RECEITA = 'R', 'Receita'
+
+    tipo = models.CharField(max_length=1, choices=Tipo.choices)
+    objeto_id = models.BigIntegerField(help_text="Id da despesa ou receita de origem")
+    # Família dona da categoria; as chaves estrangeiras não têm constraint porque
+    # quem mantém a tabela são os triggers, não o ORM
+    familia = models.ForeignKey(Familia, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    conta = models.ForeignKey(Conta, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    cartao = models.ForeignKey(CartaoDeCredito, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    categoria = models.ForeignKey(Categoria, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    categoria_receita = models.ForeignKey(CategoriaReceita, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    data = models.DateField()
+    descricao = models.CharField(max_length=255)
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+    parcela_atual = models.IntegerField(null=True)
+    parcelas_totais = models.IntegerField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'objeto_id'], name='lancamento_origem_unica'),
+        ]
+        indexes = [
+            # Saldos e extratos por conta. user e valor no fim tornam o índice "de
+            # cobertura": o saldo é somado só com o índice, sem ler a tabela
+            models.Index(fields=['familia', 'conta', 'data', 'user', 'valor'], name='lancamento_familia_conta_idx'),
+            # Relatórios por período
+            models.Index(fields=['user', 'data'], name='lancamento_user_data_idx'),
+        ]
+
+    def __str__(self):
+        if self.parcelas_totais and self.parcelas_totais > 1:
+            return f"{self.descricao} ({self.parcela_atual}/{self.parcelas_totais})"
+        return self.descricao
+
+    @property
+    def categoria_exibida(self):
+        return self.categoria if self.tipo == self.Tipo.DESPESA else self.categoria_receita
+
+    @property
+    def valor_absoluto(self):
+        return abs(self.valor)
+
 # --- Modelos de Planejamento e Ativos (Compartilhados pela Família) ---
 
 class MetaFinanceira(models.Model):
@@ -227,6 +381,7 @@ class Investimento(models.Model):
     valor_atual = models.DecimalField(max_digits=15, decimal_places=2, default=0.00, help_text="Valor de mercado atual de todo o montante investido.")
     taxa_rendimento_anual = models.DecimalField(max_digits=5, decimal_places=2, help_text="Para Renda Fixa, a taxa contratada. Para Renda Variável, uma estimativa.")
     data_criacao = models.DateField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.nome} ({self.get_tipo_display()})"
@@ -242,6 +397,85 @@ class AporteInvestimento(models.Model):
     def __str__(self):
         return f"Aporte de R$ {self.valor} em {self.investimento.nome} por {self.user.username}"
     
+# --- Sincronização com o aplicativo (ver core/services/sincronizacao.py) ---
+
+class AlteracaoSincronizacao(models.Model):
+    """
+    Uma linha por gravação ou exclusão de um registro sincronizado. O id é a
+    sequência: o cliente guarda o último id recebido e pede só o que veio depois.
+    """
+    # Sem constraint no banco: ao excluir uma família, os sinais das contas e
+    # categorias apagadas em cascata ainda registram alterações dela.
+    familia = models.ForeignKey(Familia, on_delete=models.CASCADE, db_constraint=False, related_name='+')
+    modelo = models.CharField(max_length=20)
+    objeto_id = models.BigIntegerField()
+    excluido = models.BooleanField(default=False)
+    momento = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['familia', 'id'], name='alteracao_familia_seq_idx'),
+            # Descobrir se um registro teve alteração mais recente
+            models.Index(fields=['familia', 'modelo', 'objeto_id', 'id'], name='alteracao_objeto_idx'),
+        ]
+
+class TokenSincronizacao(models.Model):
+    """Token de acesso do aplicativo. Só o hash SHA-256 da chave fica no banco."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tokens_sincronizacao')
+    chave_hash = models.CharField(max_length=64, unique=True)
+    nome = models.CharField(max_length=100, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    ultimo_uso = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.nome or 'aplicativo'}"
+
+# --- Exclusões grandes em segundo plano (ver core/services/exclusao.py) ---
+
+class TarefaExclusao(models.Model):
+    """Exclusão de uma família, usuário ou investimento, feita em lotes e com progresso."""
+    class Alvo(models.TextChoices):
+        FAMILIA = 'familia', 'Família'
+        USUARIO = 'usuario', 'Usuário'
+        INVESTIMENTO = 'investimento', 'Investimento'
+
+    class Status(models.TextChoices):
+        PENDENTE = 'pendente', 'Pendente'
+        EXECUTANDO = 'executando', 'Executando'
+        CONCLUIDA = 'concluida', 'Concluída'
+        ERRO = 'erro', 'Erro'
+
+    alvo = models.CharField(max_length=20, choices=Alvo.choices)
+    objeto_id = models.BigIntegerField()
+    descricao = models.CharField(max_length=255, blank=True)
+    solicitado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDENTE)
+    etapa = models.CharField(max_length=100, blank=True)
+    total = models.PositiveIntegerField(default=0)
+    removidos = models.PositiveIntegerField(default=0)
+    erro = models.TextField(blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Uma única exclusão em andamento por objeto
+            models.UniqueConstraint(
+                fields=['alvo', 'objeto_id'], condition=~models.Q(status='concluida'),
+                name='tarefa_exclusao_aberta_unica',
+            ),
+        ]
+
+    @property
+    def progresso_percentual(self):
+        if self.status == self.Status.CONCLUIDA:
+            return 100
+        return round(min(self.removidos / self.total * 100, 99), 1) if self.total else 0
+
+    def __str__(self):
+        return f"Exclusão de {self.get_alvo_display().lower()} {self.descricao or self.objeto_id} ({self.get_status_display()})"
+
 class Plano(models.Model):
     nome = models.CharField(max_length=50, unique=True)
     preco_mensal = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
@@ -0,0 +1,88 @@
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# --- Leituras de relatórios na réplica ---
+# As views de análise marcadas com @usar_replica fazem suas leituras no alias
+# 'replica' (quando configurado em DATABASES); todo o resto, inclusive qualquer
+# escrita, continua no 'default'.
+# Para o usuário sempre ver o que acabou de lançar, depois de qualquer requisição
+# de escrita (POST, PUT, DELETE...) um cookie o "prende" ao banco principal por
+# alguns segundos, tempo suficiente para a réplica alcançar o primário.
+#
+# Nos testes a réplica é um espelho do 'default' (TEST['MIRROR'] em settings.py): o
+# mesmo banco, mas por outra conexão, que não enxergaria os dados ainda não
+# confirmados da transação de cada TestCase. Uma réplica que aponta para o mesmo
+# banco do 'default' não ganha nada com a segunda conexão, então é lida pela primeira.
+
+ALIAS_REPLICA = 'replica'
+COOKIE_PRIMARIO = 'ler_do_primario_ate'
+
+_ler_da_replica = ContextVar('ler_da_replica', default=False)
+
+
+def _mesmo_banco(alias, outro):
+    dados, outros = connections[alias].settings_dict, connections[outro].settings_dict
+    return all(dados.get(chave) == outros.get(chave) for chave in ('ENGINE', 'NAME', 'HOST', 'PORT'))
+
+
+def replica_configurada():
+    return ALIAS_REPLICA in settings.DATABASES and not _mesmo_banco(ALIAS_REPLICA, DEFAULT_DB_ALIAS)
+
+
+def _preso_ao_primario(request):
+    try:
+        return float(request.COOKIES.get(COOKIE_PRIMARIO, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def usar_replica(view_func):
+    """Decorator para views somente leitura que podem ler da réplica."""
+    @wraps(view_func)
+    def _view(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or _preso_ao_primario(request):
+            return view_func(request, *args, **kwargs)
+        token = _ler_da_replica.set(True)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _ler_da_replica.reset(token)
+    return _view
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _ler_da_replica.get() and replica_configurada():
+            return ALIAS_REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Os dois aliases apontam para os mesmos dados
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != ALIAS_REPLICA
+
+
+class LeituraAposEscritaMiddleware:
+    """Após uma requisição de escrita, mantém o usuário no banco principal por alguns segundos."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and replica_configurada():
+            segundos = settings.REPLICA_SEGUNDOS_APOS_ESCRITA
+            response.set_cookie(
+                COOKIE_PRIMARIO, str(time.time() + segundos), max_age=segundos,
+                httponly=True, samesite='Lax',
+            )
+        return response
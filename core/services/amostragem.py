@@ -0,0 +1,83 @@
+import numpy as np
+
+# --- Redução de séries longas para os gráficos (Largest-Triangle-Three-Buckets) ---
+# Um gráfico diário de vários anos teria milhares de pontos, mais do que cabe em
+# pixels na tela. O LTTB divide a série em 'limite' baldes e, de cada balde, mantém
+# o ponto que forma o maior triângulo com o ponto escolhido no balde anterior e a
+# média do balde seguinte; assim picos e vales continuam aparecendo. O tamanho da
+# resposta e o tempo de desenho passam a depender só do limite de pontos.
+
+PONTOS_PADRAO = 400
+PONTOS_MINIMO = 20
+PONTOS_MAXIMO = 2000
+
+
+def limite_pontos(valor):
+    """Converte o parâmetro '?pontos=' da requisição em um limite válido."""
+    try:
+        pontos = int(valor)
+    except (TypeError, ValueError):
+        return PONTOS_PADRAO
+    return min(max(pontos, PONTOS_MINIMO), PONTOS_MAXIMO)
+
+
+def lttb(y, limite, x=None):
+    """
+    Índices dos 'limite' pontos escolhidos pelo LTTB (sempre incluindo o primeiro e o
+    último). Se a série já cabe no limite, devolve todos os índices.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if limite >= n or limite < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+
+    # limite - 2 baldes entre o primeiro e o último ponto
+    bordas = np.linspace(1, n - 1, limite - 1).astype(np.int64)
+    inicios, fins = bordas[:-1], bordas[1:]
+
+    # Média de cada balde, por somas acumuladas; o último balde usa o último ponto
+    soma_x = np.concatenate(([0.0], np.cumsum(x)))
+    soma_y = np.concatenate(([0.0], np.cumsum(y)))
+    tamanhos = fins - inicios
+    medias_x = (soma_x[fins] - soma_x[inicios]) / tamanhos
+    medias_y = (soma_y[fins] - soma_y[inicios]) / tamanhos
+    proximo_x = np.append(medias_x[1:], x[-1])
+    proximo_y = np.append(medias_y[1:], y[-1])
+
+    indices = np.empty(limite, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    anterior = 0
+    for balde, (inicio, fim) in enumerate(zip(inicios, fins)):
+        # Dobro da área do triângulo (anterior, candidato, média do próximo balde)
+        areas = np.abs(
+            (x[anterior] - proximo_x[balde]) * (y[inicio:fim] - y[anterior])
+            - (x[anterior] - x[inicio:fim]) * (proximo_y[balde] - y[anterior])
+        )
+        anterior = inicio + int(areas.argmax())
+        indices[balde + 1] = anterior
+    return indices
+
+
+def reduzir_series(serie, campos, limite):
+    """
+    Reduz um dicionário de séries alinhadas (arrays ou listas do mesmo tamanho) a no
+    máximo 'limite' pontos. Cada campo de 'campos' recebe uma parte do limite no LTTB e
+    os índices escolhidos são unidos, para que todas as séries continuem alinhadas.
+    """
+    n = len(serie[campos[0]])
+    if n <= limite:
+        return serie
+    por_campo = max(limite // len(campos), 3)
+    indices = np.unique(np.concatenate([lttb(serie[campo], por_campo) for campo in campos]))
+
+    reduzida = {}
+    for chave, valor in serie.items():
+        if isinstance(valor, np.ndarray) and len(valor) == n:
+            reduzida[chave] = valor[indices]
+        elif isinstance(valor, list) and len(valor) == n:
+            reduzida[chave] = [valor[i] for i in indices]
+        else:
+            reduzida[chave] = valor
+    reduzida['pontos_originais'] = n
+    return reduzida
@@ -0,0 +1,111 @@
+from datetime import date
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+from core.models import (
+    Despesa, DespesaArquivada, Perfil, Receita, ReceitaArquivada, ResumoMensalArquivado
+)
+from core.services import sincronizacao
+
+# --- Arquivamento de anos fechados ---
+# As transações de um ano já encerrado saem das tabelas principais e vão para
+# tabelas de arquivo com a mesma estrutura (e os mesmos ids). No lugar delas fica
+# um resumo por mês, usuário, conta/cartão e categoria, que é o que os saldos, a
+# projeção e os gráficos leem. Assim as consultas do dia a dia só percorrem os anos
+# ativos. Um ano arquivado pode ser restaurado a qualquer momento.
+# As duas operações são feitas com INSERT ... SELECT e DELETE no próprio banco,
+# dentro de uma transação, sem trazer as linhas para o Python.
+#
+# As duas rodam em comandos do manage.py, num processo separado dos workers, então
+# incrementar a versão em cache da família (invalidar_familia) não adiantaria com o
+# cache locmem. Os caches dos workers são renovados pelas linhas que as operações
+# gravam no registro de alterações (sincronizacao.registrar_queryset), lidas do banco
+# a cada chave montada (ver chave_familia em core/services/cache.py).
+
+TABELAS = [
+    # (ativa, arquivo, tipo do resumo, campo de categoria no resumo)
+    (Despesa, DespesaArquivada, ResumoMensalArquivado.Tipo.DESPESA, 'categoria'),
+    (Receita, ReceitaArquivada, ResumoMensalArquivado.Tipo.RECEITA, 'categoria_receita'),
+]
+
+
+def _usuarios_da_familia(familia_id):
+    return list(Perfil.objects.filter(familia_id=familia_id).values_list('user_id', flat=True))
+
+
+def _filtrar(queryset, ano, user_ids):
+    queryset = queryset.filter(data__gte=date(ano, 1, 1), data__lte=date(ano, 12, 31))
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    return queryset
+
+
+def _copiar_e_apagar(queryset, destino):
+    """Copia as linhas do queryset para a tabela 'destino' e as apaga da origem."""
+    origem = queryset.model
+    colunas = ", ".join(connection.ops.quote_name(f.column) for f in origem._meta.concrete_fields)
+    tabela_origem = connection.ops.quote_name(origem._meta.db_table)
+    tabela_destino = connection.ops.quote_name(destino._meta.db_table)
+    sql_ids, params = queryset.values('id').query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {tabela_destino} ({colunas}) SELECT {colunas} FROM {tabela_origem} WHERE id IN ({sql_ids})",
+            params,
+        )
+        cursor.execute(f"DELETE FROM {tabela_origem} WHERE id IN ({sql_ids})", params)
+        return cursor.rowcount
+
+
+def arquivar_ano(ano, familia_id=None):
+    """
+    Move as transações do ano para o arquivo, deixando os resumos mensais.
+    Despesas de cartão com fatura ainda não paga ficam nas tabelas ativas.
+    Retorna quantas linhas de cada modelo foram arquivadas.
+    """
+    if ano >= date.today().year:
+        raise ValueError("Só é possível arquivar anos já encerrados.")
+    user_ids = _usuarios_da_familia(familia_id) if familia_id else None
+
+    movidas = {}
+    with transaction.atomic():
+        for modelo, arquivo, tipo, campo_categoria in TABELAS:
+            queryset = _filtrar(modelo.objects.all(), ano, user_ids)
+            if modelo is Despesa:
+                queryset = queryset.exclude(cartao__isnull=False, fatura_paga=False)
+
+            grupos = queryset.annotate(mes=TruncMonth('data')).values(
+                'user_id', 'mes', 'conta_id', 'categoria_id', *(['cartao_id'] if modelo is Despesa else [])
+            ).annotate(soma=Sum('valor'), quantidade=Count('id')).order_by()
+            ResumoMensalArquivado.objects.bulk_create([
+                ResumoMensalArquivado(
+                    user_id=grupo['user_id'], tipo=tipo, mes=grupo['mes'], conta_id=grupo['conta_id'],
+                    cartao_id=grupo.get('cartao_id'), total=grupo['soma'], quantidade=grupo['quantidade'],
+                    **{f"{campo_categoria}_id": grupo['categoria_id']},
+                )
+                for grupo in grupos
+            ])
+            # Para o aplicativo, as transações arquivadas saem das tabelas ativas
+            sincronizacao.registrar_queryset(queryset, excluido=True)
+            movidas[modelo.__name__] = _copiar_e_apagar(queryset, arquivo)
+    return movidas
+
+
+def restaurar_ano(ano, familia_id=None):
+    """Devolve as transações arquivadas do ano às tabelas ativas e apaga os resumos."""
+    user_ids = _usuarios_da_familia(familia_id) if familia_id else None
+
+    restauradas = {}
+    with transaction.atomic():
+        for modelo, arquivo, tipo, _ in TABELAS:
+            queryset = _filtrar(arquivo.objects.all(), ano, user_ids)
+            sincronizacao.registrar_queryset(queryset, modelo=modelo)
+            restauradas[modelo.__name__] = _copiar_e_apagar(queryset, modelo)
+            resumos = ResumoMensalArquivado.objects.filter(tipo=tipo, mes__year=ano)
+            if user_ids is not None:
+                resumos = resumos.filter(user_id__in=user_ids)
+            resumos.delete()
+    return restauradas
+
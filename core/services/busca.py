@@ -0,0 +1,170 @@
+import re
+import unicodedata
+from datetime import date
+
+from django.db import connection
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+from core.models import Despesa, Receita
+from core.services.paginacao import codificar_cursor, decodificar_cursor
+
+ITENS_POR_PAGINA = 30
+
+# --- Índices de busca textual ---
+# SQLite: uma tabela FTS5 de conteúdo externo por tabela de transação, com
+# tokenizador que ignora acentos, mantida em sincronia por triggers.
+# PostgreSQL: índices GIN de tsvector (busca por prefixo) e de trigramas (trechos
+# no meio da palavra) sobre a descrição sem acentos; o próprio banco os atualiza.
+# Tudo é idempotente: roda na migração e novamente a cada post_migrate, porque no
+# SQLite algumas alterações de schema recriam a tabela e apagam os triggers.
+
+TABELAS_BUSCA = [Despesa, Receita]
+
+SQL_SQLITE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS {tabela}_busca USING fts5(
+        descricao, content='{tabela}', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS {tabela}_busca_ai AFTER INSERT ON {tabela} BEGIN
+        INSERT INTO {tabela}_busca(rowid, descricao) VALUES (new.id, new.descricao);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {tabela}_busca_ad AFTER DELETE ON {tabela} BEGIN
+        INSERT INTO {tabela}_busca({tabela}_busca, rowid, descricao) VALUES ('delete', old.id, old.descricao);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {tabela}_busca_au AFTER UPDATE OF descricao ON {tabela} BEGIN
+        INSERT INTO {tabela}_busca({tabela}_busca, rowid, descricao) VALUES ('delete', old.id, old.descricao);
+        INSERT INTO {tabela}_busca(rowid, descricao) VALUES (new.id, new.descricao);
+    END""",
+]
+
+SQL_POSTGRES_FUNCOES = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # unaccent() não é IMMUTABLE, então não pode ser usada diretamente em um índice
+    """CREATE OR REPLACE FUNCTION core_sem_acento(text) RETURNS text AS
+        $$ SELECT public.unaccent('public.unaccent', lower($1)) $$
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT""",
+]
+
+SQL_POSTGRES = [
+    "CREATE INDEX IF NOT EXISTS {tabela}_busca_tsv ON {tabela} USING GIN (to_tsvector('simple', core_sem_acento(descricao)))",
+    "CREATE INDEX IF NOT EXISTS {tabela}_busca_trgm ON {tabela} USING GIN (core_sem_acento(descricao) gin_trgm_ops)",
+]
+
+
+def instalar_busca(conexao, reconstruir=False):
+    """Cria (se ainda não existirem) as estruturas de busca textual no banco."""
+    with conexao.cursor() as cursor:
+        if conexao.vendor == 'sqlite':
+            for modelo in TABELAS_BUSCA:
+                tabela = modelo._meta.db_table
+                for sql in SQL_SQLITE:
+                    cursor.execute(sql.format(tabela=tabela))
+                if reconstruir:
+                    cursor.execute(f"INSERT INTO {tabela}_busca({tabela}_busca) VALUES ('rebuild')")
+        elif conexao.vendor == 'postgresql':
+            for sql in SQL_POSTGRES_FUNCOES:
+                cursor.execute(sql)
+            for modelo in TABELAS_BUSCA:
+                for sql in SQL_POSTGRES:
+                    cursor.execute(sql.format(tabela=modelo._meta.db_table))
+
+
+def remover_busca(conexao):
+    with conexao.cursor() as cursor:
+        for modelo in TABELAS_BUSCA:
+            tabela = modelo._meta.db_table
+            if conexao.vendor == 'sqlite':
+                for sufixo in ('ai', 'ad', 'au'):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {tabela}_busca_{sufixo}")
+                cursor.execute(f"DROP TABLE IF EXISTS {tabela}_busca")
+            elif conexao.vendor == 'postgresql':
+                cursor.execute(f"DROP INDEX IF EXISTS {tabela}_busca_tsv")
+                cursor.execute(f"DROP INDEX IF EXISTS {tabela}_busca_trgm")
+
+
+# --- Consulta ---
+
+def normalizar_termos(texto):
+    """Quebra o texto em termos minúsculos, sem acentos e sem pontuação."""
+    sem_acento = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii')
+    return re.findall(r'\w+', sem_acento.lower())
+
+
+def filtrar_por_texto(queryset, texto):
+    """
+    Filtra um queryset de Despesa ou Receita pelos termos da descrição.
+    Todos os termos precisam aparecer, cada um como prefixo de alguma palavra
+    ("farm" encontra "Farmácia"), sem diferenciar acentos.
+    """
+    termos = normalizar_termos(texto)
+    if not termos:
+        return queryset.none()
+    tabela = queryset.model._meta.db_table
+
+    if connection.vendor == 'sqlite':
+        expressao = " ".join(f'"{termo}"*' for termo in termos)
+        condicao = RawSQL(
+            f'"{tabela}"."id" IN (SELECT rowid FROM {tabela}_busca WHERE {tabela}_busca MATCH %s)',
+            [expressao], output_field=BooleanField(),
+        )
+        return queryset.filter(condicao)
+
+    if connection.vendor == 'postgresql':
+        expressao = " & ".join(f"{termo}:*" for termo in termos)
+        condicao = RawSQL(
+            f"""(to_tsvector('simple', core_sem_acento("{tabela}"."descricao")) @@ to_tsquery('simple', %s)
+                OR core_sem_acento("{tabela}"."descricao") LIKE %s)""",
+            [expressao, f"%{' '.join(termos)}%"], output_field=BooleanField(),
+        )
+        return queryset.filter(condicao)
+
+    filtro = Q()
+    for termo in termos:
+        filtro &= Q(descricao__icontains=termo)
+    return queryset.filter(filtro)
+
+
+def _pagina(queryset, tipo, chave, limite):
+    """Próximos itens de uma das tabelas depois do cursor (data, tipo, id)."""
+    if chave:
+        data, tipo_cursor, id_ = chave
+        depois = Q(data__lt=data)
+        if tipo < tipo_cursor:
+            depois |= Q(data=data)
+        elif tipo == tipo_cursor:
+            depois |= Q(data=data, id__lt=id_)
+        queryset = queryset.filter(depois)
+    return list(queryset.order_by('-data', '-id')[:limite + 1])
+
+
+def buscar_transacoes(usuarios, texto, data_inicio=None, data_fim=None, cursor=None, limite=ITENS_POR_PAGINA):
+    """
+    Busca despesas e receitas pela descrição, combinando com o período e a visão
+    (lista de usuários). As duas tabelas são lidas já na ordem (data, tipo, id) e
+    intercaladas, então cada página custa duas consultas.
+    Retorna (transacoes, proximo_cursor); cada transação ganha o atributo 'tipo'.
+    """
+    filtros = Q(user__in=usuarios)
+    if data_inicio:
+        filtros &= Q(data__gte=data_inicio)
+    if data_fim:
+        filtros &= Q(data__lte=data_fim)
+
+    chave = decodificar_cursor(cursor, date, str, int)
+    despesas = filtrar_por_texto(Despesa.objects.filter(filtros), texto).select_related('categoria', 'user')
+    receitas = filtrar_por_texto(Receita.objects.filter(filtros), texto).select_related('categoria', 'user')
+
+    transacoes = []
+    for tipo, queryset in (('D', despesas), ('R', receitas)):
+        for item in _pagina(queryset, tipo, chave, limite):
+            item.tipo = tipo
+            transacoes.append(item)
+    transacoes.sort(key=lambda t: (t.data, t.tipo, t.id), reverse=True)
+
+    proximo_cursor = None
+    if len(transacoes) > limite:
+        transacoes = transacoes[:limite]
+        ultima = transacoes[-1]
+        proximo_cursor = codificar_cursor(ultima.data, ultima.tipo, ultima.id)
+    return transacoes, proximo_cursor
@@ -0,0 +1,162 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from core import metricas
+from core.services.sincronizacao import marcador_alteracoes
+
+
+# --- Versionamento dos dados da família ---
+# Toda chave de cache derivada dos dados de uma família carrega o número de versão
+# atual. Quando algo muda (uma despesa salva, uma conta editada), basta incrementar
+# a versão: as chaves antigas deixam de ser lidas e expiram sozinhas.
+#
+# A versão fica no próprio cache. Com o backend locmem, cada worker (e cada comando
+# do manage.py) tem a sua, e o incremento feito por um não chega aos outros. Por
+# isso as chaves do escopo de dados levam também o marcador da última alteração
+# registrada da família no banco (core/services/sincronizacao.py), que todos os
+# processos enxergam: qualquer transação, conta, cartão, categoria ou investimento
+# gravado muda a chave em todos os workers.
+
+ESCOPO_DADOS = 'dados'
+# Configuração da família (categorias, contas, cartões): muda bem menos que os dados
+ESCOPO_CONFIG = 'config'
+
+
+def _chave_versao(familia_id, escopo):
+    return f"familia:{familia_id}:versao:{escopo}"
+
+
+def versao_familia(familia_id, escopo=ESCOPO_DADOS):
+    """Retorna a versão atual dos dados da família para o escopo informado."""
+    chave = _chave_versao(familia_id, escopo)
+    versao = cache.get(chave)
+    if versao is None:
+        # Começa a partir do relógio para não reaproveitar versões antigas
+        # caso a chave tenha sido descartada pelo backend de cache.
+        cache.add(chave, int(time.time() * 1000), timeout=None)
+        versao = cache.get(chave)
+    return versao
+
+
+def invalidar_familia(familia_id, escopo=ESCOPO_DADOS):
+    """Incrementa a versão da família, invalidando todos os caches do escopo."""
+    if not familia_id:
+        return
+    chave = _chave_versao(familia_id, escopo)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        versao_familia(familia_id, escopo)
+
+
+def chave_familia(familia_id, *partes, escopo=ESCOPO_DADOS):
+    """Monta uma chave de cache amarrada à versão atual dos dados da família."""
+    versao = versao_familia(familia_id, escopo)
+    if escopo == ESCOPO_DADOS:
+        versao = f"{versao}.{marcador_alteracoes(familia_id)}"
+    sufixo = ":".join(str(p) for p in partes)
+    return f"familia:{familia_id}:v{versao}:{sufixo}"
+
+
+# --- Obter ou calcular, com proteção contra estouro de recálculo ---
+# Quando uma chave muito usada expira (ou a versão da família muda), vários
+# workers podem perceber a ausência ao mesmo tempo e recalcular a mesma coisa.
+# Aqui só quem consegue a trava (cache.add, atômico nos backends locmem, arquivo e
+# banco) recalcula; os demais esperam o valor aparecer por alguns instantes.
+#
+# Cada valor é guardado junto com um prazo "suave", menor que o timeout real. Depois
+# dele o valor antigo continua sendo servido enquanto um único worker o renova em
+# segundo plano, então nenhuma requisição paga o recálculo inteiro.
+#
+# Com o backend locmem a trava vale só dentro do processo; para coordenar vários
+# processos use o backend de arquivo ou de banco (CACHE_BACKEND, em settings.py).
+
+TIMEOUT_TRAVA = 30
+ESPERA_MAXIMA = 3
+INTERVALO_ESPERA = 0.05
+
+EVENTOS_CACHE = ('acertos', 'falhas', 'vencidos', 'esperas')
+
+
+def _contar(nome, evento):
+    # Na memória do processo (core/metricas.py), e não no próprio cache: um contador
+    # no cache custaria mais uma ida a ele por leitura, e o incr dos backends de
+    # arquivo e de banco (ler e gravar) perde incrementos com acessos simultâneos.
+    metricas.contar('cache_eventos_total', cache=nome, evento=evento)
+
+
+def contadores_cache(nomes):
+    """Acertos, falhas, valores vencidos servidos e esperas pela trava de cada nome, neste processo."""
+    return {
+        nome: {evento: metricas.valor_contador('cache_eventos_total', cache=nome, evento=evento) for evento in EVENTOS_CACHE}
+        for nome in nomes
+    }
+
+
+def _gravar(chave, calcular, timeout, ttl_suave):
+    valor = calcular()
+    prazo_suave = time.time() + ttl_suave if ttl_suave is not None else None
+    cache.set(chave, (valor, prazo_suave), timeout)
+    return valor
+
+
+def _renovar(chave, trava, calcular, timeout, ttl_suave):
+    try:
+        _gravar(chave, calcular, timeout, ttl_suave)
+    finally:
+        cache.delete(trava)
+
+
+def _renovar_em_segundo_plano(chave, trava, calcular, timeout, ttl_suave):
+    def executar():
+        try:
+            _renovar(chave, trava, calcular, timeout, ttl_suave)
+        finally:
+            # A thread abre a própria conexão com o banco; fecha ao terminar
+            close_old_connections()
+
+    threading.Thread(target=executar, daemon=True).start()
+
+
+def obter_ou_calcular(chave, calcular, timeout=None, ttl_suave=None, nome='geral'):
+    """
+    Retorna o valor em cache de 'chave' ou o resultado de 'calcular()', guardado por
+    'timeout' segundos (None = sem expirar). Com 'ttl_suave', o valor é renovado uma
+    vez passado esse prazo, servindo o antigo enquanto isso. 'nome' agrupa os
+    contadores de acertos e falhas (ver contadores_cache).
+    """
+    trava = f"{chave}:trava"
+    entrada = cache.get(chave)
+    if entrada is not None:
+        valor, prazo_suave = entrada
+        if prazo_suave is not None and time.time() >= prazo_suave and cache.add(trava, 1, TIMEOUT_TRAVA):
+            _contar(nome, 'vencidos')
+            if settings.CACHE_RENOVAR_EM_SEGUNDO_PLANO:
+                _renovar_em_segundo_plano(chave, trava, calcular, timeout, ttl_suave)
+            else:
+                _renovar(chave, trava, calcular, timeout, ttl_suave)
+        else:
+            _contar(nome, 'acertos')
+        return valor
+
+    _contar(nome, 'falhas')
+    if cache.add(trava, 1, TIMEOUT_TRAVA):
+        try:
+            return _gravar(chave, calcular, timeout, ttl_suave)
+        finally:
+            cache.delete(trava)
+
+    # Outro worker está calculando: espera o resultado dele
+    _contar(nome, 'esperas')
+    limite = time.monotonic() + ESPERA_MAXIMA
+    while time.monotonic() < limite:
+        time.sleep(INTERVALO_ESPERA)
+        entrada = cache.get(chave)
+        if entrada is not None:
+            return entrada[0]
+    # Demorou demais (ou o outro worker falhou): calcula aqui mesmo
+    return _gravar(chave, calcular, timeout, ttl_suave)
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+# --- Cálculos de calendário de faturas, vetorizados com NumPy ---
+# Seguem a mesma regra de CartaoDeCredito.get_fatura_aberta: o dia de fechamento
+# é limitado ao último dia do mês (ex.: dia 31 em fevereiro vira 28/29) e uma
+# compra feita no dia do fechamento ainda entra na fatura que fecha naquele dia.
+
+def _dias_no_mes(meses):
+    """Quantidade de dias de cada mês de um array datetime64[M]."""
+    return ((meses + 1).astype('datetime64[D]') - meses.astype('datetime64[D]')).astype(np.int64)
+
+
+def dia_no_mes(meses, dias):
+    """Data do 'dia' em cada mês de um array datetime64[M], limitada ao último dia do mês."""
+    meses = np.asarray(meses, dtype='datetime64[M]')
+    return meses.astype('datetime64[D]') + (np.minimum(dias, _dias_no_mes(meses)) - 1)
+
+
+def datas_fechamento(datas, dias_fechamento):
+    """
+    Retorna, para cada data, o dia em que fecha a fatura em que ela cai.
+    'dias_fechamento' pode ser um inteiro ou um array do mesmo tamanho de 'datas'.
+    """
+    datas = np.asarray(datas, dtype='datetime64[D]')
+    dias_fechamento = np.asarray(dias_fechamento, dtype=np.int64)
+
+    meses = datas.astype('datetime64[M]')
+    inicio_mes = meses.astype('datetime64[D]')
+    dia = (datas - inicio_mes).astype(np.int64) + 1
+
+    fechamento_atual = np.minimum(dias_fechamento, _dias_no_mes(meses))
+    proximo_mes = meses + 1
+    fechamento_proximo = np.minimum(dias_fechamento, _dias_no_mes(proximo_mes))
+
+    return np.where(
+        dia <= fechamento_atual,
+        inicio_mes + (fechamento_atual - 1),
+        proximo_mes.astype('datetime64[D]') + (fechamento_proximo - 1),
+    )
+
+
+def inicio_periodo(fechamentos):
+    """
+    Primeiro dia do período de cada fatura: o dia seguinte à mesma data um mês antes
+    do fechamento (igual a get_fatura_aberta, que subtrai um mês com relativedelta).
+    """
+    fechamentos = np.asarray(fechamentos, dtype='datetime64[D]')
+    meses = fechamentos.astype('datetime64[M]')
+    dia = (fechamentos - meses.astype('datetime64[D]')).astype(np.int64) + 1
+    return dia_no_mes(meses - 1, dia) + 1
+
+
+def datas_vencimento(fechamentos, dias_fechamento, dias_vencimento):
+    """
+    Retorna o vencimento de cada fatura a partir da sua data de fechamento.
+    Se o dia de vencimento vem depois do dia de fechamento, a fatura vence no
+    mesmo mês; caso contrário, vence no mês seguinte.
+    """
+    fechamentos = np.asarray(fechamentos, dtype='datetime64[D]')
+    dias_fechamento = np.asarray(dias_fechamento, dtype=np.int64)
+    dias_vencimento = np.asarray(dias_vencimento, dtype=np.int64)
+
+    meses = fechamentos.astype('datetime64[M]')
+    mes_vencimento = np.where(dias_vencimento > dias_fechamento, meses, meses + 1)
+    dia = np.minimum(dias_vencimento, _dias_no_mes(mes_vencimento))
+    return mes_vencimento.astype('datetime64[D]') + (dia - 1)
@@ -0,0 +1,159 @@
+import math
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+
+from core.models import Despesa
+from core.services.busca import normalizar_termos
+
+# --- Sugestão automática de categoria ---
+# Um classificador Naive Bayes multinomial por família, treinado com o histórico
+# de despesas (descrição, faixa de valor e conta/cartão -> categoria).
+# As características passam por "hashing" para um vetor de tamanho fixo, então o
+# modelo não precisa guardar vocabulário: é só uma matriz de contagens por categoria.
+# Os modelos ficam na memória do processo, com descarte LRU entre as famílias, e são
+# atualizados a cada despesa criada (sinal post_save).
+
+DIMENSOES = 2 ** 12
+MAX_FAMILIAS = 64
+MAX_EXEMPLOS_TREINO = 5000
+# Depois desse tempo o modelo é retreinado, para absorver o que outros processos aprenderam
+TEMPO_MAXIMO_MODELO = 60 * 60
+
+
+def _valor_positivo(valor):
+    """O valor como Decimal, ou None se vier vazio, malformado (ex.: digitado pela metade) ou <= 0."""
+    try:
+        valor = Decimal(str(valor))
+    except (InvalidOperation, ValueError):
+        return None
+    return valor if valor.is_finite() and valor > 0 else None
+
+
+def caracteristicas(descricao, valor=None, conta_id=None, cartao_id=None):
+    """Índices (com repetição) das características de uma despesa no vetor de hashing."""
+    tokens = normalizar_termos(descricao)
+    valor = _valor_positivo(valor)
+    if valor:
+        # Faixas logarítmicas: 10-20, 20-40, 40-80... separam "café" de "aluguel"
+        tokens.append(f"valor:{int(math.log2(float(valor) + 1))}")
+    if conta_id:
+        tokens.append(f"conta:{conta_id}")
+    if cartao_id:
+        tokens.append(f"cartao:{cartao_id}")
+    return np.array([zlib.crc32(t.encode()) % DIMENSOES for t in tokens], dtype=np.int64)
+
+
+class ModeloCategorias:
+    def __init__(self):
+        self.categorias = []        # id da categoria de cada linha da matriz
+        self.indice = {}            # id da categoria -> linha
+        self.contagens = np.zeros((0, DIMENSOES), dtype=np.int32)
+        self.total_tokens = np.zeros(0, dtype=np.int64)
+        self.exemplos = np.zeros(0, dtype=np.int64)
+        self.criado_em = time.monotonic()
+
+    def _linha(self, categoria_id):
+        linha = self.indice.get(categoria_id)
+        if linha is None:
+            linha = len(self.categorias)
+            self.categorias.append(categoria_id)
+            self.indice[categoria_id] = linha
+            self.contagens = np.vstack([self.contagens, np.zeros((1, DIMENSOES), dtype=np.int32)])
+            self.total_tokens = np.append(self.total_tokens, 0)
+            self.exemplos = np.append(self.exemplos, 0)
+        return linha
+
+    def aprender(self, indices, categoria_id):
+        linha = self._linha(categoria_id)
+        np.add.at(self.contagens[linha], indices, 1)
+        self.total_tokens[linha] += len(indices)
+        self.exemplos[linha] += 1
+
+    def prever(self, indices):
+        """Retorna (categoria_id, probabilidade) mais provável, ou None sem histórico."""
+        if not self.categorias or len(indices) == 0:
+            return None
+        # Log-verossimilhança só das colunas presentes, com suavização de Laplace
+        log_prior = np.log(self.exemplos) - np.log(self.exemplos.sum())
+        log_prob = np.log(self.contagens[:, indices] + 1.0) - np.log(self.total_tokens + DIMENSOES)[:, None]
+        pontuacao = log_prior + log_prob.sum(axis=1)
+        melhor = int(pontuacao.argmax())
+        probabilidades = np.exp(pontuacao - pontuacao.max())
+        return self.categorias[melhor], float(probabilidades[melhor] / probabilidades.sum())
+
+
+_modelos = OrderedDict()
+_trava = threading.Lock()
+
+
+def _treinar(familia_id):
+    modelo = ModeloCategorias()
+    historico = Despesa.objects.filter(categoria__familia_id=familia_id).order_by('-data', '-id').values_list(
+        'descricao', 'valor', 'conta_id', 'cartao_id', 'categoria_id'
+    )[:MAX_EXEMPLOS_TREINO]
+    for descricao, valor, conta_id, cartao_id, categoria_id in historico:
+        modelo.aprender(caracteristicas(descricao, valor, conta_id, cartao_id), categoria_id)
+    return modelo
+
+
+def obter_modelo(familia_id):
+    with _trava:
+        modelo = _modelos.get(familia_id)
+        if modelo is not None and time.monotonic() - modelo.criado_em < TEMPO_MAXIMO_MODELO:
+            _modelos.move_to_end(familia_id)
+            return modelo
+
+    modelo = _treinar(familia_id)
+    with _trava:
+        _modelos[familia_id] = modelo
+        _modelos.move_to_end(familia_id)
+        while len(_modelos) > MAX_FAMILIAS:
+            _modelos.popitem(last=False)
+    return modelo
+
+
+def aprender_despesa(familia_id, despesa):
+    """Atualiza o modelo da família (se estiver carregado) com uma nova despesa."""
+    with _trava:
+        modelo = _modelos.get(familia_id)
+        if modelo is not None:
+            modelo.aprender(
+                caracteristicas(despesa.descricao, despesa.valor, despesa.conta_id, despesa.cartao_id),
+                despesa.categoria_id,
+            )
+
+
+def descartar_modelo(familia_id):
+    """Remove o modelo da memória; ele é retreinado no próximo uso."""
+    with _trava:
+        _modelos.pop(familia_id, None)
+
+
+def sugerir_categoria(familia_id, descricao, valor=None, conta_id=None, cartao_id=None):
+    """Retorna o id da categoria sugerida para uma despesa, ou None."""
+    sugestoes = sugerir_categorias(familia_id, [
+        {'descricao': descricao, 'valor': valor, 'conta_id': conta_id, 'cartao_id': cartao_id}
+    ])
+    return sugestoes[0]
+
+
+def sugerir_categorias(familia_id, linhas):
+    """
+    Classifica várias despesas de uma vez (ex.: linhas de um extrato importado).
+    'linhas' é uma lista de dicionários com 'descricao' e, opcionalmente, 'valor',
+    'conta_id' e 'cartao_id'. Retorna uma lista de ids de categoria (ou None).
+    """
+    modelo = obter_modelo(familia_id)
+    sugestoes = []
+    with _trava:
+        for linha in linhas:
+            previsao = modelo.prever(caracteristicas(
+                linha.get('descricao'), linha.get('valor'), linha.get('conta_id'), linha.get('cartao_id')
+            ))
+            sugestoes.append(previsao[0] if previsao else None)
+    return sugestoes
@@ -0,0 +1,213 @@
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, close_old_connections, connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import (
+    AlteracaoSincronizacao, AporteInvestimento, CartaoDeCredito, Categoria, CategoriaReceita, Conta,
+    Despesa, DespesaArquivada, Familia, HistoricoOrcamento, Investimento, MetaFinanceira, Perfil,
+    Receita, ReceitaArquivada, ResumoMensalArquivado, TarefaExclusao
+)
+from core.services import categorizador, sincronizacao
+from core.services.cache import ESCOPO_CONFIG, invalidar_familia
+
+# --- Exclusão de famílias, usuários e investimentos em lotes ---
+# O delete() do Django carrega todos os objetos relacionados (em cascata) para a
+# memória e os apaga dentro de uma única requisição, o que não termina a tempo em
+# contas antigas. Aqui cada tabela dependente é esvaziada em lotes de até
+# LOTE_EXCLUSAO linhas (um DELETE ... WHERE id IN (...) por lote, cada um na sua
+# transação), em segundo plano, registrando o progresso em TarefaExclusao.
+#
+# As etapas seguem a ordem das chaves estrangeiras: primeiro as transações (que
+# protegem com PROTECT as categorias, contas e cartões), depois a configuração e,
+# por último, o próprio objeto, com o delete() normal, que a essa altura só tem
+# poucas linhas em cascata. Se a tarefa for interrompida, basta executá-la de novo:
+# cada etapa apaga apenas o que ainda existe.
+#
+# Cada objeto tem no máximo uma tarefa não concluída (restrição no banco), e as
+# telas escondem os objetos com exclusão em andamento (ver ids_em_exclusao).
+
+LOTE_EXCLUSAO = 1000
+
+
+def _etapas_investimento(investimento_id):
+    return [
+        ('Aportes', AporteInvestimento.objects.filter(investimento_id=investimento_id)),
+    ]
+
+
+def _etapas_usuario(user_id):
+    return [
+        ('Despesas', Despesa.objects.filter(user_id=user_id)),
+        ('Despesas arquivadas', DespesaArquivada.objects.filter(user_id=user_id)),
+        ('Receitas', Receita.objects.filter(user_id=user_id)),
+        ('Receitas arquivadas', ReceitaArquivada.objects.filter(user_id=user_id)),
+        ('Resumos arquivados', ResumoMensalArquivado.objects.filter(user_id=user_id)),
+        ('Aportes', AporteInvestimento.objects.filter(user_id=user_id)),
+    ]
+
+
+def _etapas_familia(familia_id):
+    # Transações de qualquer usuário que apontem para a configuração da família
+    # (inclusive de quem já saiu dela), senão o PROTECT impediria apagar a configuração
+    despesas = Q(categoria__familia_id=familia_id) | Q(conta__familia_id=familia_id) | Q(cartao__familia_id=familia_id)
+    receitas = Q(categoria__familia_id=familia_id) | Q(conta__familia_id=familia_id)
+    return [
+        ('Aportes', AporteInvestimento.objects.filter(Q(investimento__familia_id=familia_id) | Q(conta_origem__familia_id=familia_id))),
+        ('Despesas', Despesa.objects.filter(despesas)),
+        ('Despesas arquivadas', DespesaArquivada.objects.filter(despesas)),
+        ('Receitas', Receita.objects.filter(receitas)),
+        ('Receitas arquivadas', ReceitaArquivada.objects.filter(receitas)),
+        ('Resumos arquivados', ResumoMensalArquivado.objects.filter(
+            despesas | Q(categoria_receita__familia_id=familia_id)
+        )),
+        ('Histórico do orçamento', HistoricoOrcamento.objects.filter(categoria__familia_id=familia_id)),
+        ('Subcategorias', Categoria.objects.filter(familia_id=familia_id, categoria_mae__isnull=False)),
+        ('Categorias', Categoria.objects.filter(familia_id=familia_id, categoria_mae__isnull=True)),
+        ('Categorias de receita', CategoriaReceita.objects.filter(familia_id=familia_id)),
+        ('Contas', Conta.objects.filter(familia_id=familia_id)),
+        ('Cartões', CartaoDeCredito.objects.filter(familia_id=familia_id)),
+        ('Investimentos', Investimento.objects.filter(familia_id=familia_id)),
+        ('Metas', MetaFinanceira.objects.filter(familia_id=familia_id)),
+        ('Registro de sincronização', AlteracaoSincronizacao.objects.filter(familia_id=familia_id)),
+    ]
+
+
+PLANOS = {
+    # alvo: (modelo do objeto, etapas antes de apagá-lo)
+    TarefaExclusao.Alvo.INVESTIMENTO: (Investimento, _etapas_investimento),
+    TarefaExclusao.Alvo.USUARIO: (User, _etapas_usuario),
+    TarefaExclusao.Alvo.FAMILIA: (Familia, _etapas_familia),
+}
+
+
+def _familia_do_alvo(alvo, objeto_id):
+    if alvo == TarefaExclusao.Alvo.FAMILIA:
+        return objeto_id
+    if alvo == TarefaExclusao.Alvo.USUARIO:
+        return Perfil.objects.filter(user_id=objeto_id).values_list('familia_id', flat=True).first()
+    return Investimento.objects.filter(id=objeto_id).values_list('familia_id', flat=True).first()
+
+
+def tarefas_abertas(alvo):
+    return TarefaExclusao.objects.filter(alvo=alvo).exclude(status=TarefaExclusao.Status.CONCLUIDA)
+
+
+def ids_em_exclusao(alvo):
+    """Subconsulta com os ids dos objetos cuja exclusão ainda não terminou, para escondê-los."""
+    return tarefas_abertas(alvo).values('objeto_id')
+
+
+def tarefa_aberta(alvo, objeto_id):
+    return tarefas_abertas(alvo).filter(objeto_id=objeto_id).first()
+
+
+def criar_tarefa(alvo, objeto, solicitado_por=None):
+    """
+    Cria a tarefa de exclusão do objeto, a menos que ele já tenha uma não concluída.
+    Retorna (tarefa, criada), como get_or_create.
+    """
+    existente = tarefa_aberta(alvo, objeto.pk)
+    if existente:
+        return existente, False
+    try:
+        with transaction.atomic():
+            tarefa = TarefaExclusao.objects.create(
+                alvo=alvo, objeto_id=objeto.pk, descricao=str(objeto)[:255], solicitado_por=solicitado_por,
+            )
+    except IntegrityError:
+        # Outra requisição criou a tarefa ao mesmo tempo
+        return tarefa_aberta(alvo, objeto.pk), False
+    return tarefa, True
+
+
+def agendar_exclusao(alvo, objeto, solicitado_por=None):
+    """
+    Cria a tarefa de exclusão do objeto e a inicia em segundo plano (ou na hora,
+    se EXCLUSOES_EM_SEGUNDO_PLANO estiver desligado). Se o objeto já tem uma
+    exclusão não concluída, não cria outra. Retorna (tarefa, criada).
+    """
+    tarefa, criada = criar_tarefa(alvo, objeto, solicitado_por)
+    if not criada:
+        return tarefa, False
+    if settings.EXCLUSOES_EM_SEGUNDO_PLANO:
+        transaction.on_commit(lambda: _executar_em_segundo_plano(tarefa.id))
+    else:
+        executar_exclusao(tarefa)
+    return tarefa, True
+
+
+def _executar_em_segundo_plano(tarefa_id):
+    def executar():
+        try:
+            executar_exclusao(TarefaExclusao.objects.get(id=tarefa_id))
+        finally:
+            close_old_connections()
+
+    threading.Thread(target=executar, daemon=True).start()
+
+
+def _apagar_em_lotes(tarefa, queryset, registrar):
+    modelo = queryset.model
+    banco = router.db_for_write(modelo)
+    conexao = connections[banco]
+    tabela = conexao.ops.quote_name(modelo._meta.db_table)
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list('id', flat=True).order_by()[:LOTE_EXCLUSAO])
+            if not ids:
+                return
+            if registrar and modelo in sincronizacao.NOMES_MODELOS:
+                sincronizacao.registrar_queryset(modelo.objects.filter(id__in=ids), excluido=True)
+            with conexao.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {tabela} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+                apagados = cursor.rowcount
+            tarefa.removidos += apagados
+            tarefa.save(update_fields=['removidos', 'atualizado_em'])
+
+
+def executar_exclusao(tarefa):
+    """Executa (ou retoma) a tarefa até o fim. Em caso de erro, grava-o na tarefa e o relança."""
+    modelo, etapas = PLANOS[tarefa.alvo]
+    familia_id = _familia_do_alvo(tarefa.alvo, tarefa.objeto_id)
+    etapas = etapas(tarefa.objeto_id)
+    tarefa.status = TarefaExclusao.Status.EXECUTANDO
+    tarefa.erro = ''
+    tarefa.total = tarefa.removidos + sum(queryset.count() for _, queryset in etapas)
+    tarefa.save()
+    try:
+        # Na exclusão da família o registro de sincronização dela também é apagado
+        registrar = tarefa.alvo != TarefaExclusao.Alvo.FAMILIA
+        for rotulo, queryset in etapas:
+            tarefa.etapa = rotulo
+            tarefa.save(update_fields=['etapa', 'atualizado_em'])
+            _apagar_em_lotes(tarefa, queryset, registrar)
+
+        tarefa.etapa = 'Finalizando'
+        tarefa.save(update_fields=['etapa', 'atualizado_em'])
+        modelo.objects.filter(pk=tarefa.objeto_id).delete()
+    except Exception as erro:
+        tarefa.status = TarefaExclusao.Status.ERRO
+        tarefa.erro = str(erro)
+        tarefa.save(update_fields=['status', 'erro', 'atualizado_em'])
+        raise
+    finally:
+        # Os DELETEs em lote não disparam os sinais que invalidam os caches
+        if familia_id:
+            invalidar_familia(familia_id)
+            invalidar_familia(familia_id, ESCOPO_CONFIG)
+            categorizador.descartar_modelo(familia_id)
+
+    tarefa.status = TarefaExclusao.Status.CONCLUIDA
+    tarefa.etapa = ''
+    tarefa.concluido_em = timezone.now()
+    tarefa.save(update_fields=['status', 'etapa', 'concluido_em', 'atualizado_em'])
+    return tarefa
+
+
+def tarefas_a_retomar():
+    """Tarefas não concluídas (interrompidas por um deploy, por exemplo, ou com erro)."""
+    return TarefaExclusao.objects.exclude(status=TarefaExclusao.Status.CONCLUIDA).order_by('id')
@@ -0,0 +1,101 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection
+
+from core.models import Categoria, CategoriaReceita, Lancamento, ResumoMensalArquivado
+from core.services.paginacao import codificar_cursor, decodificar_cursor
+
+ITENS_POR_PAGINA = 50
+
+SQL_EXTRATO = """
+WITH movimentos AS (
+    SELECT l.objeto_id AS id, l.tipo, l.data, l.descricao, l.valor, COALESCE(c.nome, cr.nome) AS categoria,
+           l.parcela_atual, l.parcelas_totais
+    FROM {lancamento} l
+    LEFT JOIN {categoria} c ON c.id = l.categoria_id
+    LEFT JOIN {categoria_receita} cr ON cr.id = l.categoria_receita_id
+    WHERE l.familia_id = %s AND l.conta_id = %s AND l.user_id IN ({usuarios}) AND l.data <= %s
+),
+extrato AS (
+    SELECT movimentos.*,
+           SUM(valor) OVER (ORDER BY data, tipo, id ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS acumulado
+    FROM movimentos
+)
+SELECT id, tipo, data, descricao, valor, categoria, parcela_atual, parcelas_totais, acumulado,
+       (SELECT COALESCE(SUM(CASE WHEN a.tipo = 'R' THEN a.total ELSE -a.total END), 0)
+        FROM {resumo} a WHERE a.conta_id = %s AND a.user_id IN ({usuarios}) AND a.mes <= %s) AS arquivado
+FROM extrato
+{filtro_cursor}
+ORDER BY data DESC, tipo DESC, id DESC
+LIMIT %s
+"""
+
+FILTRO_CURSOR = "WHERE data < %s OR (data = %s AND (tipo < %s OR (tipo = %s AND id < %s)))"
+
+
+def _decimal(valor):
+    if isinstance(valor, Decimal):
+        return valor
+    return Decimal(str(valor)).quantize(Decimal('0.01'))
+
+
+def extrato_conta(conta, usuarios, data_limite, cursor=None, limite=ITENS_POR_PAGINA):
+    """
+    Retorna uma página do extrato unificado da conta (receitas e despesas do razão,
+    core/services/razao.py, da mais recente para a mais antiga), com o saldo após cada lançamento
+    calculado pelo banco com uma window function. Os anos arquivados entram no saldo
+    pelo total dos seus resumos mensais.
+
+    A paginação é por cursor sobre (data, tipo, id), então cada página custa uma
+    única consulta, independentemente de quão antiga ela seja.
+    Retorna (linhas, proximo_cursor); proximo_cursor é None na última página.
+    """
+    user_ids = [u.id for u in usuarios]
+    if not user_ids:
+        return [], None
+
+    filtro_cursor = ""
+    params_cursor = []
+    chave = decodificar_cursor(cursor, date, str, int)
+    if chave:
+        data, tipo, id_ = chave
+        filtro_cursor = FILTRO_CURSOR
+        params_cursor = [data, data, tipo, tipo, id_]
+
+    sql = SQL_EXTRATO.format(
+        lancamento=Lancamento._meta.db_table,
+        categoria_receita=CategoriaReceita._meta.db_table, categoria=Categoria._meta.db_table,
+        resumo=ResumoMensalArquivado._meta.db_table,
+        usuarios=", ".join(["%s"] * len(user_ids)), filtro_cursor=filtro_cursor,
+    )
+    params = [
+        conta.familia_id, conta.id, *user_ids, data_limite,
+        conta.id, *user_ids, data_limite, *params_cursor, limite + 1,
+    ]
+
+    with connection.cursor() as cursor_db:
+        cursor_db.execute(sql, params)
+        registros = cursor_db.fetchall()
+
+    linhas = []
+    for id_, tipo, data, descricao, valor, categoria, parcela_atual, parcelas_totais, acumulado, arquivado in registros[:limite]:
+        if not isinstance(data, date):
+            data = date.fromisoformat(str(data))
+        linhas.append({
+            'id': id_,
+            'tipo': tipo,
+            'data': data,
+            'descricao': descricao,
+            'valor': abs(_decimal(valor)),
+            'categoria': categoria,
+            'parcela_atual': parcela_atual,
+            'parcelas_totais': parcelas_totais,
+            'saldo': conta.saldo_inicial + _decimal(arquivado) + _decimal(acumulado),
+        })
+
+    proximo_cursor = None
+    if len(registros) > limite:
+        ultima = linhas[-1]
+        proximo_cursor = codificar_cursor(ultima['data'], ultima['tipo'], ultima['id'])
+    return linhas, proximo_cursor
@@ -0,0 +1,137 @@
+from datetime import date
+
+import numpy as np
+from django.db.models import Q, Sum
+
+from core.models import CartaoDeCredito, Despesa
+from core.services.calendario import datas_fechamento, datas_vencimento, dia_no_mes, inicio_periodo
+from core.services.valores import centavos, para_decimal
+
+DIAS_DO_MES = np.arange(1, 32)
+
+
+def resumo_cartoes(familia, usuarios, data_base=None):
+    """
+    Resumo de todos os cartões da família em uma única consulta agrupada:
+      - total da fatura aberta dos 'usuarios' (mesmo período de
+        CartaoDeCredito.get_fatura_aberta);
+      - limite disponível (limite menos tudo o que ainda não foi pago, inclusive
+        parcelas futuras). O limite é do cartão, dividido pela família inteira, então
+        entram as compras de todos, qualquer que seja a visão;
+      - datas de fechamento e vencimento da fatura aberta.
+
+    O período da fatura depende só do dia de fechamento, então ele é calculado de uma
+    vez (vetorizado) para os 31 dias possíveis e vira um filtro do SUM no próprio banco.
+    Retorna uma lista de dicionários, um por cartão.
+    """
+    if data_base is None:
+        data_base = date.today()
+    if familia is None:
+        return []
+
+    fechamentos = datas_fechamento(np.full(len(DIAS_DO_MES), np.datetime64(data_base, 'D')), DIAS_DO_MES)
+    inicios = inicio_periodo(fechamentos)
+
+    periodo_aberto = Q()
+    for dia, inicio, fechamento in zip(DIAS_DO_MES, inicios, fechamentos):
+        periodo_aberto |= Q(dia_fechamento=int(dia), despesa__data__gte=inicio.item(), despesa__data__lte=fechamento.item())
+    nao_pagas = Q(despesa__fatura_paga=False)
+
+    cartoes = list(CartaoDeCredito.objects.filter(familia=familia).annotate(
+        total_aberto=Sum('despesa__valor', filter=nao_pagas & Q(despesa__user__in=usuarios) & periodo_aberto),
+        total_comprometido=Sum('despesa__valor', filter=nao_pagas),
+    ).order_by('nome'))
+    if not cartoes:
+        return []
+
+    indices = np.array([c.dia_fechamento - 1 for c in cartoes])
+    vencimentos = datas_vencimento(
+        fechamentos[indices], [c.dia_fechamento for c in cartoes], [c.dia_vencimento for c in cartoes]
+    )
+
+    resumo = []
+    for cartao, indice, vencimento in zip(cartoes, indices, vencimentos):
+        comprometido = cartao.total_comprometido or 0
+        resumo.append({
+            'cartao': cartao,
+            'total': cartao.total_aberto or 0,
+            'comprometido': comprometido,
+            'disponivel': cartao.limite - comprometido,
+            'data_inicio': inicios[indice].item(),
+            'data_fechamento': fechamentos[indice].item(),
+            'data_vencimento': vencimento.item(),
+        })
+    return resumo
+
+
+def calendario_faturas(familia, usuarios, meses=12, data_base=None, cartoes=None):
+    """
+    Calendário de faturas: total de cada cartão na fatura que fecha em cada um dos
+    'meses' meses a partir do mês de 'data_base' (matriz cartão x mês).
+
+    Todas as despesas não pagas do período vêm em uma única consulta e são atribuídas
+    à sua fatura de uma vez, com datas_fechamento vetorizado (dia 31 e fevereiro
+    seguem a mesma regra de get_fatura_aberta). Faturas já fechadas no mês de
+    'data_base' e ainda não pagas entram na primeira coluna.
+
+    'cartoes' restringe o calendário a alguns cartões (padrão: todos os da família).
+    """
+    if data_base is None:
+        data_base = date.today()
+    if cartoes is None:
+        cartoes = list(CartaoDeCredito.objects.filter(familia=familia).order_by('nome')) if familia else []
+    mes_inicial = np.datetime64(data_base, 'M')
+    meses_calendario = mes_inicial + np.arange(meses)
+
+    totais = np.zeros((len(cartoes), meses), dtype=np.int64)
+    if cartoes:
+        indice_cartao = {c.id: i for i, c in enumerate(cartoes)}
+        dias_fechamento = np.array([c.dia_fechamento for c in cartoes], dtype=np.int64)
+        dias_vencimento = np.array([c.dia_vencimento for c in cartoes], dtype=np.int64)
+
+        # Uma fatura que fecha no mês inicial começa, no máximo, no mês anterior
+        despesas = list(Despesa.objects.filter(
+            cartao_id__in=list(indice_cartao), user__in=usuarios, fatura_paga=False,
+            data__gte=(mes_inicial - 1).astype('datetime64[D]').item(),
+            data__lt=(mes_inicial + meses).astype('datetime64[D]').item(),
+        ).values_list('cartao_id', 'data', 'valor'))
+        if despesas:
+            cartao_ids, datas, valores = zip(*despesas)
+            linhas = np.array([indice_cartao[c] for c in cartao_ids], dtype=np.int64)
+            fechamentos = datas_fechamento(np.array(datas, dtype='datetime64[D]'), dias_fechamento[linhas])
+            colunas = (fechamentos.astype('datetime64[M]') - mes_inicial).astype(np.int64)
+            no_calendario = (colunas >= 0) & (colunas < meses)
+            np.add.at(totais, (linhas[no_calendario], colunas[no_calendario]), centavos(valores)[no_calendario])
+
+        fechamentos = dia_no_mes(meses_calendario[np.newaxis, :], dias_fechamento[:, np.newaxis])
+        vencimentos = datas_vencimento(fechamentos, dias_fechamento[:, np.newaxis], dias_vencimento[:, np.newaxis])
+
+    linhas_cartoes = []
+    for i, cartao in enumerate(cartoes):
+        linhas_cartoes.append({
+            'cartao': cartao,
+            'faturas': [
+                {
+                    'mes': meses_calendario[j].item(),
+                    'data_fechamento': fechamentos[i, j].item(),
+                    'data_vencimento': vencimentos[i, j].item(),
+                    'total': para_decimal(totais[i, j]),
+                }
+                for j in range(meses)
+            ],
+            'total': para_decimal(totais[i].sum()),
+        })
+    totais_mes = totais.sum(axis=0)
+
+    return {
+        'meses': [m.item() for m in meses_calendario],
+        'cartoes': cartoes,
+        'matriz': totais,
+        'linhas': linhas_cartoes,
+        # Mesma matriz por mês, para tabelas com um mês por linha
+        'por_mes': [
+            {'mes': meses_calendario[j].item(), 'valores': [para_decimal(v) for v in totais[:, j]], 'total': para_decimal(totais_mes[j])}
+            for j in range(meses)
+        ],
+        'total': para_decimal(totais.sum()),
+    }
@@ -0,0 +1,108 @@
+import json
+
+import numpy as np
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek, TruncYear
+
+from core.models import Lancamento, ResumoMensalArquivado
+
+# --- Série de fluxo de caixa (receitas x despesas) por período ---
+# Receitas e despesas vêm do razão (core/services/razao.py), e os resumos arquivados
+# entram na mesma consulta (UNION ALL de SELECTs agrupados pelo período). Os totais
+# são espalhados em arrays NumPy já com todos os períodos do intervalo, inclusive os
+# sem movimento, então a montagem é O(n) no número de linhas retornadas.
+#
+# As despesas consideradas são as pagas por conta (regime de caixa): compras no
+# cartão entram quando a fatura é paga, pela despesa de pagamento lançada na conta.
+
+AGRUPAMENTOS = {
+    # agrupamento: (função de truncamento, formato do rótulo)
+    'diario': (TruncDay, "%d/%m/%Y"),
+    'semanal': (TruncWeek, "Sem %W/%Y"),
+    'mensal': (TruncMonth, "%b/%y"),
+    'anual': (TruncYear, "%Y"),
+}
+
+
+def _consulta(usuarios, data_inicio, data_fim, agrupamento):
+    truncar = AGRUPAMENTOS[agrupamento][0]
+    # Receitas e despesas pagas por conta numa só leitura do razão
+    movimentos = Lancamento.objects.filter(
+        user__in=usuarios, conta__isnull=False, data__range=[data_inicio, data_fim]
+    ).annotate(periodo=truncar('data')).values('periodo').annotate(
+        receitas=Sum('valor', filter=Q(tipo='R')), despesas=Sum(-F('valor'), filter=Q(tipo='D')),
+    ).order_by()
+    if agrupamento not in ('mensal', 'anual'):
+        return movimentos
+    # Os resumos arquivados só têm resolução de mês
+    return movimentos.union(ResumoMensalArquivado.objects.filter(
+        user__in=usuarios, conta__isnull=False, mes__range=[data_inicio.replace(day=1), data_fim]
+    ).annotate(periodo=truncar('mes')).values('periodo').annotate(
+        receitas=Sum('total', filter=Q(tipo='R')), despesas=Sum('total', filter=Q(tipo='D'))
+    ).order_by(), all=True)
+
+
+def _periodos(data_inicio, data_fim, agrupamento):
+    """Início de cada período do intervalo, em datetime64[D]."""
+    inicio = np.datetime64(data_inicio, 'D')
+    fim = np.datetime64(data_fim, 'D')
+    if agrupamento == 'diario':
+        return np.arange(inicio, fim + 1)
+    if agrupamento == 'semanal':
+        # Semanas começando na segunda-feira, como TruncWeek
+        segunda = inicio - np.timedelta64(data_inicio.weekday(), 'D')
+        return np.arange(segunda, fim + 1, np.timedelta64(7, 'D'))
+    unidade = 'M' if agrupamento == 'mensal' else 'Y'
+    return np.arange(inicio.astype(f'datetime64[{unidade}]'), fim.astype(f'datetime64[{unidade}]') + 1).astype('datetime64[D]')
+
+
+def _indice_periodo(datas, periodos, agrupamento):
+    if agrupamento == 'diario':
+        return (datas - periodos[0]).astype(np.int64)
+    if agrupamento == 'semanal':
+        return (datas - periodos[0]).astype(np.int64) // 7
+    unidade = 'M' if agrupamento == 'mensal' else 'Y'
+    return (datas.astype(f'datetime64[{unidade}]') - periodos[0].astype(f'datetime64[{unidade}]')).astype(np.int64)
+
+
+def serie_fluxo_caixa(usuarios, data_inicio, data_fim, agrupamento='mensal'):
+    """
+    Receitas, despesas e saldo de cada período entre 'data_inicio' e 'data_fim'
+    ('diario', 'semanal', 'mensal' ou 'anual'), alinhados e preenchidos com zero.
+    Os valores ficam em centavos (int64); 'rotulos' traz o texto de cada período.
+    """
+    if agrupamento not in AGRUPAMENTOS:
+        agrupamento = 'mensal'
+    periodos = _periodos(data_inicio, data_fim, agrupamento)
+    receitas = np.zeros(len(periodos), dtype=np.int64)
+    despesas = np.zeros(len(periodos), dtype=np.int64)
+
+    linhas = list(_consulta(usuarios, data_inicio, data_fim, agrupamento).values_list('periodo', 'receitas', 'despesas'))
+    if linhas:
+        datas, valores_receita, valores_despesa = zip(*linhas)
+        datas = np.array(datas, dtype='datetime64[D]')
+        indices = _indice_periodo(datas, periodos, agrupamento)
+        np.add.at(receitas, indices, [int((v or 0) * 100) for v in valores_receita])
+        np.add.at(despesas, indices, [int((v or 0) * 100) for v in valores_despesa])
+
+    formato = AGRUPAMENTOS[agrupamento][1]
+    return {
+        'agrupamento': agrupamento,
+        'periodos': [p.item() for p in periodos],
+        'rotulos': [p.item().strftime(formato) for p in periodos],
+        'receitas': receitas,
+        'despesas': despesas,
+        'saldo': receitas - despesas,
+    }
+
+
+def serie_para_chartjs(serie):
+    """JSON compacto (sem espaços, valores em reais com 2 casas) para os gráficos Chart.js."""
+    return json.dumps({
+        'labels': serie['rotulos'],
+        'receitas': (serie['receitas'] / 100).round(2).tolist(),
+        'despesas': (serie['despesas'] / 100).round(2).tolist(),
+        'saldo': (serie['saldo'] / 100).round(2).tolist(),
+        # Presente quando a série foi reduzida (core/services/amostragem.py)
+        'pontos_originais': serie.get('pontos_originais'),
+    }, separators=(',', ':'), ensure_ascii=False)
@@ -0,0 +1,73 @@
+from dateutil.relativedelta import relativedelta
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from core.models import (
+    CartaoDeCredito, Categoria, Conta, Despesa, Investimento, ResumoMensalArquivado, TarefaExclusao
+)
+from core.services.exclusao import ids_em_exclusao
+
+# --- Dados dos gráficos ---
+# Usados tanto pelas páginas quanto pelos endpoints JSON (core/views/graficos.py),
+# para que os dois caminhos mostrem sempre os mesmos números.
+
+
+def gastos_por_categoria_principal(familia, usuarios, data_inicio, data_fim):
+    """
+    Total gasto em cada categoria principal (somando as subcategorias) no período,
+    incluindo os anos arquivados. Duas consultas agrupadas, do maior para o menor.
+    """
+    if not familia:
+        return []
+    totais = {}
+    consultas = [
+        Despesa.objects.filter(user__in=usuarios, categoria__familia=familia, data__range=[data_inicio, data_fim])
+        .values(principal=Coalesce('categoria__categoria_mae_id', 'categoria_id')).annotate(total=Sum('valor')),
+        # Anos arquivados entram pelos resumos mensais (só têm resolução de mês)
+        ResumoMensalArquivado.objects.filter(
+            tipo='D', user__in=usuarios, categoria__familia=familia, mes__range=[data_inicio.replace(day=1), data_fim]
+        ).values(principal=Coalesce('categoria__categoria_mae_id', 'categoria_id')).annotate(total=Sum('total')),
+    ]
+    for consulta in consultas:
+        for item in consulta.order_by():
+            totais[item['principal']] = totais.get(item['principal'], 0) + item['total']
+
+    nomes = dict(Categoria.objects.filter(id__in=list(totais)).values_list('id', 'nome'))
+    gastos = [{'categoria__nome': nomes[principal], 'total': total} for principal, total in totais.items() if total > 0]
+    return sorted(gastos, key=lambda item: item['total'], reverse=True)
+
+
+def gastos_por_subcategoria(familia, usuarios, categoria_mae_nome, data_inicio, data_fim):
+    """Gastos de cada subcategoria de uma categoria principal. None se ela não existe."""
+    try:
+        categoria_mae = Categoria.objects.get(familia=familia, nome=categoria_mae_nome, categoria_mae__isnull=True)
+    except Categoria.DoesNotExist:
+        return None
+    return list(Despesa.objects.filter(
+        user__in=usuarios, data__range=[data_inicio, data_fim], categoria__categoria_mae=categoria_mae
+    ).values('categoria__nome').annotate(total=Sum('valor')).order_by('-total'))
+
+
+def serie_patrimonio(familia, usuarios, periodo, hoje):
+    """
+    Patrimônio líquido no fim de cada mês, de 6 meses atrás até 6 meses à frente
+    (os meses futuros só no período 'projetado').
+    """
+    patrimonio = []
+    for i in range(-6, 7):
+        ponto_no_tempo = hoje + relativedelta(months=i)
+        ultimo_dia_mes = ponto_no_tempo.replace(day=1) + relativedelta(months=1) - relativedelta(days=1)
+        if periodo == 'realizado' and ponto_no_tempo > hoje:
+            continue
+        data_limite = ultimo_dia_mes if periodo == 'projetado' else min(ultimo_dia_mes, hoje)
+        contas = Conta.objects.filter(familia=familia) if familia else []
+        saldo_contas = sum(c.get_saldo_atual(usuarios=usuarios, data_base=data_limite) for c in contas)
+        investimentos = Investimento.objects.filter(familia=familia, data_criacao__lte=data_limite).exclude(
+            id__in=ids_em_exclusao(TarefaExclusao.Alvo.INVESTIMENTO)
+        ) if familia else []
+        valor_investido = sum(inv.aportes.filter(user__in=usuarios, data__lte=data_limite).aggregate(t=Sum('valor'))['t'] or 0 for inv in investimentos)
+        cartoes = CartaoDeCredito.objects.filter(familia=familia) if familia else []
+        divida_cartoes = sum(c.get_fatura_aberta(usuarios=usuarios, data_base=ultimo_dia_mes)['total'] for c in cartoes)
+        patrimonio_liquido = (saldo_contas + valor_investido) - divida_cartoes
+        patrimonio.append({'mes': ultimo_dia_mes.strftime('%b/%y'), 'valor': float(patrimonio_liquido)})
+    return patrimonio
@@ -0,0 +1,29 @@
+from django.db import transaction
+
+from core.models import Despesa
+from core.services import categorizador, sincronizacao
+from core.services.cache import invalidar_familia
+
+# --- Lançamento de despesas em lote ---
+# A grade de lançamento envia várias linhas de uma vez. Cada linha é validada
+# contra as opções da família já em cache (sem consultas) e todas são gravadas
+# com um único bulk_create, dentro de uma transação: ou entram todas, ou nenhuma.
+# Como bulk_create não dispara os sinais, os caches, o registro de sincronização e
+# o modelo de categorias são atualizados aqui, uma vez por lote.
+
+
+def criar_despesas_em_lote(user, familia_id, linhas):
+    """
+    Cria uma despesa para cada dicionário de 'linhas' (campos de DespesaLoteForm).
+    Retorna a lista de despesas criadas.
+    """
+    despesas = [Despesa(user=user, **linha) for linha in linhas]
+    if not despesas:
+        return []
+    with transaction.atomic():
+        despesas = Despesa.objects.bulk_create(despesas)
+        sincronizacao.registrar_alteracoes(Despesa, [(familia_id, despesa.id) for despesa in despesas])
+        invalidar_familia(familia_id)
+        for despesa in despesas:
+            categorizador.aprender_despesa(familia_id, despesa)
+    return despesas
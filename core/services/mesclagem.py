@@ -0,0 +1,143 @@
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
+
+from core.models import (
+    AporteInvestimento, Categoria, CategoriaReceita, Conta, Despesa, DespesaArquivada, HistoricoOrcamento,
+    Receita, ReceitaArquivada, ResumoMensalArquivado
+)
+from core.services import categorizador, sincronizacao
+from core.services.cache import ESCOPO_CONFIG, invalidar_familia
+
+# --- Mesclagem de categorias e contas ---
+# Categorias e contas em uso não podem ser excluídas (PROTECT). Para tirá-las do
+# caminho, todas as referências a elas passam para outra categoria/conta da família
+# com um UPDATE por tabela, e só então a origem é excluída, tudo numa transação.
+# Nenhuma transação é carregada para o Python: o custo é o de um UPDATE indexado
+# (as chaves estrangeiras têm índice) mesmo com centenas de milhares de linhas.
+#
+# Os resumos arquivados que passam a ter a mesma chave (usuário, tipo, mês, conta,
+# cartão e categorias) são somados num só, e o orçamento da categoria de origem é
+# somado ao do destino, mês a mês no histórico. Na mesclagem de contas, o saldo
+# inicial da origem é somado ao do destino, para que o saldo total não mude.
+
+# Tabelas e campos que apontam para cada modelo mesclável
+REFERENCIAS = {
+    Categoria: [
+        (Despesa, 'categoria'), (DespesaArquivada, 'categoria'), (ResumoMensalArquivado, 'categoria'),
+    ],
+    CategoriaReceita: [
+        (Receita, 'categoria'), (ReceitaArquivada, 'categoria'), (ResumoMensalArquivado, 'categoria_receita'),
+    ],
+    Conta: [
+        (Despesa, 'conta'), (Receita, 'conta'), (DespesaArquivada, 'conta'), (ReceitaArquivada, 'conta'),
+        (ResumoMensalArquivado, 'conta'), (AporteInvestimento, 'conta_origem'),
+    ],
+}
+
+CHAVE_RESUMO = ['user_id', 'tipo', 'mes', 'conta_id', 'cartao_id', 'categoria_id', 'categoria_receita_id']
+
+
+def _tem_atualizado_em(modelo):
+    return any(campo.name == 'atualizado_em' for campo in modelo._meta.concrete_fields)
+
+
+def _consolidar_resumos(campo, destino):
+    """Soma num único resumo os resumos do destino que ficaram com a mesma chave."""
+    resumos = ResumoMensalArquivado.objects.filter(**{campo: destino})
+    grupos = list(resumos.values(*CHAVE_RESUMO).annotate(
+        linhas=Count('id'), manter=Min('id'), soma_total=Sum('total'), soma_quantidade=Sum('quantidade')
+    ).filter(linhas__gt=1).order_by())
+    if not grupos:
+        return
+    ResumoMensalArquivado.objects.bulk_update([
+        ResumoMensalArquivado(id=grupo['manter'], total=grupo['soma_total'], quantidade=grupo['soma_quantidade'])
+        for grupo in grupos
+    ], ['total', 'quantidade'], batch_size=500)
+    # Um DELETE para as linhas repetidas: fica só o menor id de cada chave
+    mantidos = resumos.values(*CHAVE_RESUMO).annotate(manter=Min('id')).values('manter').order_by()
+    resumos.exclude(id__in=mantidos).delete()
+
+
+def _valor_no_mes(registros, mes, padrao):
+    """Orçamento vigente no mês, com a mesma regra de core/services/orcamento.py."""
+    if not registros:
+        return padrao
+    valor = registros[0][1]
+    for inicio, registro in registros:
+        if inicio > mes:
+            break
+        valor = registro
+    return valor
+
+
+def _mesclar_orcamento(origem, destino):
+    historico = {origem.id: [], destino.id: []}
+    for categoria_id, mes, valor in HistoricoOrcamento.objects.filter(
+        categoria__in=[origem, destino]
+    ).order_by('mes').values_list('categoria_id', 'mes', 'valor'):
+        historico[categoria_id].append((mes, valor))
+
+    meses = sorted({mes for registros in historico.values() for mes, _ in registros})
+    if meses:
+        HistoricoOrcamento.objects.filter(categoria=destino).delete()
+        HistoricoOrcamento.objects.bulk_create([
+            HistoricoOrcamento(categoria=destino, mes=mes, valor=(
+                _valor_no_mes(historico[origem.id], mes, origem.orcamento_mensal)
+                + _valor_no_mes(historico[destino.id], mes, destino.orcamento_mensal)
+            ))
+            for mes in meses
+        ])
+    destino.orcamento_mensal += origem.orcamento_mensal
+
+
+def _mover_subcategorias(origem, destino, agora):
+    if destino.categoria_mae_id == origem.id:
+        # O destino era subcategoria da origem: assume o lugar dela
+        destino.categoria_mae_id = origem.categoria_mae_id
+    nova_mae = destino.id if destino.categoria_mae_id is None else destino.categoria_mae_id
+    subcategorias = Categoria.objects.filter(categoria_mae=origem).exclude(id=destino.id)
+    sincronizacao.registrar_queryset(subcategorias)
+    subcategorias.update(categoria_mae_id=nova_mae, atualizado_em=agora)
+
+
+def mesclar(origem, destino):
+    """
+    Passa para 'destino' tudo o que referencia 'origem' (categoria de despesa, de
+    receita ou conta da mesma família) e exclui a origem. Retorna quantas despesas
+    e receitas foram movidas.
+    """
+    modelo = type(origem)
+    if type(destino) is not modelo or origem.pk == destino.pk or origem.familia_id != destino.familia_id:
+        raise ValueError("A mesclagem precisa de dois registros diferentes, do mesmo tipo e da mesma família.")
+
+    agora = timezone.now()
+    movidas = 0
+    with transaction.atomic():
+        for referencia, campo in REFERENCIAS[modelo]:
+            queryset = referencia.objects.filter(**{campo: origem})
+            if referencia in sincronizacao.NOMES_MODELOS:
+                sincronizacao.registrar_queryset(queryset)
+            alteracoes = {campo: destino}
+            if _tem_atualizado_em(referencia):
+                alteracoes['atualizado_em'] = agora
+            alteradas = queryset.update(**alteracoes)
+            if referencia in (Despesa, Receita):
+                movidas += alteradas
+            if referencia is ResumoMensalArquivado:
+                _consolidar_resumos(campo, destino)
+
+        if modelo is Categoria:
+            _mover_subcategorias(origem, destino, agora)
+            _mesclar_orcamento(origem, destino)
+            destino.save()
+        elif modelo is Conta:
+            destino.saldo_inicial += origem.saldo_inicial
+            destino.save()
+        # Os sinais do delete() registram a exclusão para a sincronização
+        origem.delete()
+
+        invalidar_familia(origem.familia_id)
+        invalidar_familia(origem.familia_id, ESCOPO_CONFIG)
+        categorizador.descartar_modelo(origem.familia_id)
+    return movidas
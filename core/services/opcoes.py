@@ -0,0 +1,48 @@
+from core.models import Categoria, CategoriaReceita, Conta, CartaoDeCredito
+from core.services.cache import ESCOPO_CONFIG, chave_familia, obter_ou_calcular
+
+# --- Opções dos formulários, em cache por família ---
+# Os <select> de categoria, conta e cartão aparecem em quase toda tela de lançamento.
+# As listas são montadas uma vez por versão da configuração da família (com
+# select_related, para que Categoria.__str__ não consulte a categoria mãe de cada
+# subcategoria) e guardadas no cache. Os sinais de Categoria, Conta, CartaoDeCredito
+# e CategoriaReceita incrementam a versão, então uma alteração aparece na hora.
+#
+# Com o cache locmem a versão é de cada processo, e os outros workers não veem a
+# alteração. Por isso as listas expiram em TIMEOUT_OPCOES segundos, e os formulários
+# não confiam só nelas: uma opção que não está na lista é procurada no banco
+# (consulta_opcoes), e a validação do modelo confirma que a escolhida ainda existe.
+
+TIMEOUT_OPCOES = 60
+
+# Lista -> (modelo, filtros além da família)
+LISTAS = {
+    'categorias': (Categoria, {}),
+    'categorias_principais': (Categoria, {'categoria_mae__isnull': True}),
+    'categorias_receita': (CategoriaReceita, {}),
+    'contas': (Conta, {}),
+    'cartoes': (CartaoDeCredito, {}),
+}
+
+
+def opcoes_familia(familia_id):
+    """Retorna um dicionário com as listas de objetos usadas nos formulários da família."""
+    chave = chave_familia(familia_id, 'opcoes', escopo=ESCOPO_CONFIG)
+    return obter_ou_calcular(chave, lambda: _montar_opcoes(familia_id), timeout=TIMEOUT_OPCOES, nome='opcoes')
+
+
+def consulta_opcoes(familia_id, lista):
+    """Queryset com os objetos da família que fazem parte de 'lista' (uma chave de LISTAS)."""
+    modelo, filtros = LISTAS[lista]
+    return modelo.objects.filter(familia_id=familia_id, **filtros)
+
+
+def _montar_opcoes(familia_id):
+    categorias = list(consulta_opcoes(familia_id, 'categorias').select_related('categoria_mae'))
+    return {
+        'categorias': categorias,
+        'categorias_principais': [c for c in categorias if c.categoria_mae_id is None],
+        'categorias_receita': list(consulta_opcoes(familia_id, 'categorias_receita')),
+        'contas': list(consulta_opcoes(familia_id, 'contas')),
+        'cartoes': list(consulta_opcoes(familia_id, 'cartoes')),
+    }
@@ -0,0 +1,242 @@
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import TruncMonth
+
+from core.models import Categoria, Despesa, HistoricoOrcamento, Receita, ResumoMensalArquivado
+from core.services.cache import chave_familia, obter_ou_calcular
+from core.services.opcoes import opcoes_familia
+from core.services.valores import para_decimal
+
+TIMEOUT_50_30_20 = 60 * 60
+
+
+# --- Orçamento x realizado por categoria, mês a mês ---
+# As categorias vêm da lista em cache de core/services/opcoes.py; o histórico de
+# orçamento, os gastos e os resumos arquivados vêm de três consultas agrupadas,
+# independentemente da quantidade de meses ou de categorias. O orçamento de uma
+# categoria principal cobre também os gastos das suas subcategorias.
+#
+# Nas categorias com 'acumular_sobra', o que não foi gasto em um mês é somado ao
+# disponível do mês seguinte. A sobra acumula só dentro do ano (zera em janeiro),
+# então o resultado de um mês não depende do período pedido.
+
+
+def _mes(valor):
+    return np.datetime64(valor, 'M')
+
+
+def orcamento_por_mes(familia, usuarios, inicio=None, meses=1):
+    """
+    Orçamento e gasto de cada categoria orçada nos 'meses' meses a partir do mês de
+    'inicio' (padrão: mês atual). Retorna as matrizes categoria x mês (em centavos) e
+    as mesmas informações em listas de dicionários prontas para os templates.
+    """
+    if inicio is None:
+        inicio = date.today()
+    mes_inicial = _mes(inicio)
+    # O cálculo começa em janeiro para que a sobra acumulada já chegue ao primeiro mês
+    mes_calculo = mes_inicial.astype('datetime64[Y]').astype('datetime64[M]')
+    deslocamento = int((mes_inicial - mes_calculo).astype(np.int64))
+    n_meses = deslocamento + meses
+    data_inicio = mes_calculo.astype('datetime64[D]').item()
+    data_fim = (mes_inicial + meses).astype('datetime64[D]').item()
+
+    categorias_familia = opcoes_familia(familia.id)['categorias'] if familia else []
+    historico = {}
+    for categoria_id, mes, valor in HistoricoOrcamento.objects.filter(
+        categoria__familia=familia, mes__lt=data_fim
+    ).order_by('categoria_id', 'mes').values_list('categoria_id', 'mes', 'valor'):
+        historico.setdefault(categoria_id, []).append((mes, valor))
+
+    categorias = [
+        c for c in categorias_familia
+        if c.orcamento_mensal > 0 or any(valor > 0 for _, valor in historico.get(c.id, []))
+    ]
+    indice = {c.id: i for i, c in enumerate(categorias)}
+
+    # 1. Orçamento vigente em cada mês: cada registro do histórico vale dali em diante.
+    # Antes do primeiro registro vale o valor mais antigo conhecido.
+    orcado = np.zeros((len(categorias), n_meses), dtype=np.int64)
+    for i, categoria in enumerate(categorias):
+        registros = historico.get(categoria.id)
+        if not registros:
+            orcado[i, :] = int(categoria.orcamento_mensal * 100)
+            continue
+        orcado[i, :] = int(registros[0][1] * 100)
+        for mes, valor in registros:
+            coluna = max(int((_mes(mes) - mes_calculo).astype(np.int64)), 0)
+            orcado[i, coluna:] = int(valor * 100)
+
+    # 2. Gastos por categoria e mês, somados também na categoria principal
+    gasto = np.zeros((len(categorias), n_meses), dtype=np.int64)
+    if categorias:
+        agrupados = list(Despesa.objects.filter(
+            user__in=usuarios, categoria__familia=familia, data__gte=data_inicio, data__lt=data_fim
+        ).annotate(mes=TruncMonth('data')).values(
+            'categoria_id', 'categoria__categoria_mae_id', 'mes'
+        ).annotate(total=Sum('valor')).order_by())
+        agrupados += list(ResumoMensalArquivado.objects.filter(
+            tipo='D', user__in=usuarios, categoria__familia=familia, mes__gte=data_inicio, mes__lt=data_fim
+        ).values('categoria_id', 'categoria__categoria_mae_id', 'mes').annotate(total=Sum('total')).order_by())
+        for item in agrupados:
+            coluna = int((_mes(item['mes']) - mes_calculo).astype(np.int64))
+            for categoria_id in (item['categoria_id'], item['categoria__categoria_mae_id']):
+                if categoria_id in indice:
+                    gasto[indice[categoria_id], coluna] += int(item['total'] * 100)
+
+    # 3. Disponível no mês = orçamento + sobra acumulada do mês anterior
+    disponivel = orcado.copy()
+    acumula = np.array([c.acumular_sobra for c in categorias], dtype=bool)
+    meses_calculo = mes_calculo + np.arange(n_meses)
+    for coluna in range(1, n_meses):
+        if meses_calculo[coluna].astype(np.int64) % 12 == 0:
+            continue  # janeiro: a sobra do ano anterior não é levada
+        sobra = np.maximum(disponivel[:, coluna - 1] - gasto[:, coluna - 1], 0)
+        disponivel[:, coluna] += np.where(acumula, sobra, 0)
+
+    orcado, disponivel, gasto = orcado[:, deslocamento:], disponivel[:, deslocamento:], gasto[:, deslocamento:]
+    meses_periodo = [m.item() for m in meses_calculo[deslocamento:]]
+
+    linhas = []
+    for i, categoria in enumerate(categorias):
+        itens = []
+        for j, mes in enumerate(meses_periodo):
+            percentual = float(gasto[i, j] / disponivel[i, j] * 100) if disponivel[i, j] > 0 else 0
+            itens.append({
+                'mes': mes,
+                'orcado': para_decimal(orcado[i, j]),
+                'disponivel': para_decimal(disponivel[i, j]),
+                'acumulado': para_decimal(disponivel[i, j] - orcado[i, j]),
+                'gasto': para_decimal(gasto[i, j]),
+                'restante': para_decimal(disponivel[i, j] - gasto[i, j]),
+                'percentual': percentual,
+                'progresso': min(percentual, 100),
+            })
+        linhas.append({'categoria': categoria, 'meses': itens})
+
+    totais = [
+        {
+            'mes': mes,
+            'orcado': para_decimal(orcado[:, j].sum()),
+            'disponivel': para_decimal(disponivel[:, j].sum()),
+            'gasto': para_decimal(gasto[:, j].sum()),
+            'restante': para_decimal(disponivel[:, j].sum() - gasto[:, j].sum()),
+        }
+        for j, mes in enumerate(meses_periodo)
+    ]
+
+    return {
+        'meses': meses_periodo,
+        'categorias': categorias,
+        'orcado': orcado,
+        'disponivel': disponivel,
+        'gasto': gasto,
+        'linhas': linhas,
+        'totais': totais,
+    }
+
+
+# --- Regra 50/30/20 mês a mês ---
+# Receitas e gastos por macro-categoria saem de uma única consulta: três SELECTs
+# agrupados por mês (despesas, receitas e resumos arquivados) unidos com UNION ALL,
+# cada um com somas condicionais por macro-categoria. Uma subcategoria 'Não
+# Classificado' herda a macro-categoria da sua categoria principal.
+
+MACROS_50_30_20 = [
+    ('necessidades', Categoria.MacroCategoria.NECESSIDADE, 'Necessidades', 50),
+    ('desejos', Categoria.MacroCategoria.DESEJO, 'Desejos Pessoais', 30),
+    ('metas', Categoria.MacroCategoria.META, 'Metas Financeiras', 20),
+]
+NAO_CLASSIFICADO = 'nao_classificado'
+
+
+def _macro_efetiva(prefixo='categoria__'):
+    return Case(
+        When(**{f'{prefixo}macro_categoria': Categoria.MacroCategoria.NAO_CLASSIFICADO,
+                f'{prefixo}categoria_mae__isnull': False},
+             then=F(f'{prefixo}categoria_mae__macro_categoria')),
+        default=F(f'{prefixo}macro_categoria'),
+    )
+
+
+def _somas_por_macro(campo, filtro=Q()):
+    macros = [(chave, codigo) for chave, codigo, _, _ in MACROS_50_30_20]
+    macros.append((NAO_CLASSIFICADO, Categoria.MacroCategoria.NAO_CLASSIFICADO))
+    return {chave: Sum(campo, filter=filtro & Q(macro=codigo)) for chave, codigo in macros}
+
+
+def _zeros(*chaves):
+    return {chave: Value(Decimal('0.00'), output_field=DecimalField()) for chave in chaves}
+
+
+def _consultar_50_30_20(usuarios, data_inicio, data_fim):
+    chaves_macro = [chave for chave, _, _, _ in MACROS_50_30_20] + [NAO_CLASSIFICADO]
+    despesas = Despesa.objects.filter(
+        user__in=usuarios, data__gte=data_inicio, data__lt=data_fim
+    ).annotate(mes=TruncMonth('data')).alias(macro=_macro_efetiva()).values('mes').annotate(
+        **_zeros('receita'), **_somas_por_macro('valor')
+    ).order_by()
+    receitas = Receita.objects.filter(
+        user__in=usuarios, data__gte=data_inicio, data__lt=data_fim
+    ).annotate(mes=TruncMonth('data')).values('mes').annotate(
+        receita=Sum('valor'), **_zeros(*chaves_macro)
+    ).order_by()
+    arquivados = ResumoMensalArquivado.objects.filter(
+        user__in=usuarios, mes__gte=data_inicio, mes__lt=data_fim
+    ).alias(macro=_macro_efetiva()).values('mes').annotate(
+        receita=Sum('total', filter=Q(tipo='R')), **_somas_por_macro('total', Q(tipo='D'))
+    ).order_by()
+    return despesas.union(receitas, arquivados, all=True)
+
+
+def divisao_50_30_20(familia, usuarios, inicio, meses=12):
+    """
+    Receita e gasto por macro-categoria em cada um dos 'meses' meses a partir do mês
+    de 'inicio', com os alvos da regra 50/30/20. Fica em cache por versão dos dados
+    da família. Retorna uma lista de dicionários, um por mês.
+    """
+    mes_inicial = _mes(inicio)
+    user_ids = sorted(u.id for u in usuarios)
+
+    if not familia:
+        return _calcular_50_30_20(user_ids, mes_inicial, meses)
+    chave = chave_familia(familia.id, '50_30_20', str(mes_inicial), meses, ",".join(map(str, user_ids)))
+    return obter_ou_calcular(
+        chave, lambda: _calcular_50_30_20(user_ids, mes_inicial, meses), timeout=TIMEOUT_50_30_20, nome='50_30_20'
+    )
+
+
+def _calcular_50_30_20(user_ids, mes_inicial, meses):
+    data_inicio = mes_inicial.astype('datetime64[D]').item()
+    data_fim = (mes_inicial + meses).astype('datetime64[D]').item()
+    campos = ['receita'] + [chave_macro for chave_macro, _, _, _ in MACROS_50_30_20] + [NAO_CLASSIFICADO]
+    totais = np.zeros((meses, len(campos)), dtype=np.int64)
+    for linha in _consultar_50_30_20(user_ids, data_inicio, data_fim).values_list('mes', *campos):
+        coluna_mes = int((_mes(linha[0]) - mes_inicial).astype(np.int64))
+        totais[coluna_mes] += [int((valor or 0) * 100) for valor in linha[1:]]
+
+    resultado = []
+    for j in range(meses):
+        receita = totais[j, 0]
+        mes = {'mes': (mes_inicial + j).item(), 'receita': para_decimal(receita), 'macros': []}
+        for posicao, (chave_macro, _, nome, alvo_percentual) in enumerate(MACROS_50_30_20, start=1):
+            gasto = totais[j, posicao]
+            alvo = receita * alvo_percentual // 100
+            percentual = float(gasto / alvo * 100) if alvo > 0 else 0
+            mes['macros'].append({
+                'chave': chave_macro,
+                'nome': nome,
+                'alvo_percentual': alvo_percentual,
+                'alvo_valor': para_decimal(alvo),
+                'gasto_real': para_decimal(gasto),
+                'restante': para_decimal(alvo - gasto),
+                # Parcela da receita que foi para a macro-categoria
+                'percentual_receita': float(gasto / receita * 100) if receita > 0 else 0,
+                'progresso': min(percentual, 100),
+            })
+        mes[NAO_CLASSIFICADO] = para_decimal(totais[j, -1])
+        resultado.append(mes)
+    return resultado
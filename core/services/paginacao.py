@@ -0,0 +1,51 @@
+from datetime import date
+
+from django.db.models import Q
+
+# --- Paginação por cursor (keyset) ---
+# O cursor é a chave de ordenação do último item da página anterior, serializada
+# como texto para ir na querystring, ex.: "2025-10-15.D.123" para (data, tipo, id).
+
+SEPARADOR = '.'
+
+
+def codificar_cursor(*partes):
+    return SEPARADOR.join(p.isoformat() if isinstance(p, date) else str(p) for p in partes)
+
+
+def decodificar_cursor(cursor, *tipos):
+    """
+    Converte o texto do cursor de volta para uma tupla, usando 'tipos' para cada
+    parte (date, int ou str). Retorna None se o cursor estiver ausente ou inválido.
+    """
+    if not cursor:
+        return None
+    partes = cursor.split(SEPARADOR)
+    if len(partes) != len(tipos):
+        return None
+    try:
+        return tuple(
+            date.fromisoformat(parte) if tipo is date else tipo(parte)
+            for parte, tipo in zip(partes, tipos)
+        )
+    except ValueError:
+        return None
+
+
+def paginar_por_cursor(queryset, cursor, tamanho):
+    """
+    Pagina um queryset de transações em ordem decrescente de (data, id).
+    Em vez de OFFSET e COUNT(*), filtra a partir do último item visto, então o custo
+    de cada página não depende da profundidade. Retorna (itens, proximo_cursor).
+    """
+    chave = decodificar_cursor(cursor, date, int)
+    if chave:
+        data, id_ = chave
+        queryset = queryset.filter(Q(data__lt=data) | Q(data=data, id__lt=id_))
+    itens = list(queryset.order_by('-data', '-id')[:tamanho + 1])
+
+    proximo_cursor = None
+    if len(itens) > tamanho:
+        itens = itens[:tamanho]
+        proximo_cursor = codificar_cursor(itens[-1].data, itens[-1].id)
+    return itens, proximo_cursor
@@ -0,0 +1,68 @@
+import uuid
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+
+from core.models import Despesa
+from core.services import categorizador, sincronizacao
+from core.services.cache import invalidar_familia
+from core.services.calendario import datas_fechamento, dia_no_mes
+
+
+def dividir_valor(valor_total, numero_parcelas):
+    """
+    Divide o valor em parcelas exatas em centavos. A diferença do arredondamento
+    vai para as primeiras parcelas (ex.: 100,00 em 3 -> 33,34 + 33,33 + 33,33).
+    """
+    centavos = int((Decimal(valor_total) * 100).quantize(Decimal('1')))
+    base, resto = divmod(centavos, numero_parcelas)
+    return [Decimal(base + (1 if i < resto else 0)) / 100 for i in range(numero_parcelas)]
+
+
+def datas_das_parcelas(data_compra, numero_parcelas, cartao=None):
+    """
+    Data de cada parcela: a mesma data da compra nos meses seguintes. No cartão, cada
+    data é ajustada para cair dentro do período da fatura correspondente (a 1ª parcela
+    na fatura da compra, a 2ª na seguinte...), seguindo a mesma regra de fechamento
+    de CartaoDeCredito.get_fatura_aberta.
+    """
+    deslocamentos = np.arange(numero_parcelas)
+    compra = np.datetime64(data_compra, 'D')
+    datas = dia_no_mes(compra.astype('datetime64[M]') + deslocamentos, data_compra.day)
+
+    if cartao is not None:
+        primeiro_fechamento = datas_fechamento(compra, cartao.dia_fechamento).astype('datetime64[M]')
+        # Fechamentos da fatura anterior à 1ª parcela até a fatura da última
+        fechamentos = dia_no_mes(primeiro_fechamento + np.arange(-1, numero_parcelas), cartao.dia_fechamento)
+        inicio_periodo, fim_periodo = fechamentos[:-1] + 1, fechamentos[1:]
+        datas = np.minimum(np.maximum(datas, inicio_periodo), fim_periodo)
+
+    return [d.item() for d in datas]
+
+
+def criar_compra_parcelada(user, familia_id, descricao, valor_total, data_compra, numero_parcelas,
+                           categoria, conta=None, cartao=None):
+    """
+    Cria as N parcelas de uma compra com um único bulk_create, dentro de uma transação.
+    Retorna a lista de despesas criadas.
+    """
+    id_compra = uuid.uuid4()
+    parcelas = [
+        Despesa(
+            user=user, descricao=descricao, valor=valor, data=data, categoria=categoria,
+            conta=conta, cartao=cartao, parcelada=True, parcela_atual=numero, parcelas_totais=numero_parcelas,
+            id_compra_parcelada=id_compra,
+        )
+        for numero, (valor, data) in enumerate(zip(
+            dividir_valor(valor_total, numero_parcelas),
+            datas_das_parcelas(data_compra, numero_parcelas, cartao),
+        ), start=1)
+    ]
+    with transaction.atomic():
+        # bulk_create não dispara post_save: os caches da família são ajustados uma vez só
+        parcelas = Despesa.objects.bulk_create(parcelas)
+        sincronizacao.registrar_alteracoes(Despesa, [(familia_id, parcela.id) for parcela in parcelas])
+        invalidar_familia(familia_id)
+        categorizador.aprender_despesa(familia_id, parcelas[0])
+    return parcelas
@@ -0,0 +1,126 @@
+from datetime import date
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from django.db.models import Case, F, Sum, When
+
+from core.models import Conta, CartaoDeCredito, Despesa, Receita, ResumoMensalArquivado
+from core.services.cache import chave_familia, obter_ou_calcular
+from core.services.calendario import datas_fechamento, datas_vencimento
+from core.services.valores import centavos, para_decimal
+
+TIMEOUT_PROJECAO = 60 * 60
+
+
+def projetar_saldos(familia, usuarios, meses=6, data_base=None):
+    """
+    Projeta o saldo diário de cada conta da família de 'data_base' até 'meses' à frente.
+
+    Combina, em arrays NumPy (valores em centavos):
+      - o saldo realizado de cada conta em 'data_base';
+      - as receitas e despesas futuras já lançadas nas contas (séries recorrentes e parcelas);
+      - o vencimento das faturas de cartão ainda não pagas (dia_vencimento de cada cartão).
+
+    Como os cartões não estão ligados a uma conta específica, as faturas entram apenas
+    na série consolidada (soma de todas as contas).
+    O resultado fica em cache por versão dos dados da família.
+    """
+    if data_base is None:
+        data_base = date.today()
+    user_ids = sorted(u.id for u in usuarios)
+
+    chave = chave_familia(familia.id, 'projecao', data_base.isoformat(), meses, ",".join(map(str, user_ids)))
+    return obter_ou_calcular(
+        chave, lambda: _calcular_projecao(familia, user_ids, meses, data_base),
+        timeout=TIMEOUT_PROJECAO, nome='projecao',
+    )
+
+
+def _calcular_projecao(familia, user_ids, meses, data_base):
+    data_fim = data_base + relativedelta(months=meses)
+    inicio = np.datetime64(data_base, 'D')
+    n_dias = (data_fim - data_base).days + 1
+    datas = inicio + np.arange(n_dias)
+
+    contas = list(Conta.objects.filter(familia=familia).order_by('id'))
+    indice_conta = {c.id: i for i, c in enumerate(contas)}
+    movimentos = np.zeros((len(contas), n_dias), dtype=np.int64)
+
+    # 1. Saldo realizado até a data base, em consultas agrupadas por conta
+    movimentos[:, 0] = centavos(c.saldo_inicial for c in contas)
+    realizados = [
+        (Receita.objects, 1),
+        (Despesa.objects, -1),
+    ]
+    for manager, sinal in realizados:
+        totais = manager.filter(
+            conta__familia=familia, user_id__in=user_ids, data__lte=data_base
+        ).values('conta_id').annotate(total=Sum('valor'))
+        for item in totais:
+            movimentos[indice_conta[item['conta_id']], 0] += sinal * int(item['total'] * 100)
+    # Anos arquivados: resumos mensais por conta
+    arquivados = ResumoMensalArquivado.objects.filter(
+        conta__familia=familia, user_id__in=user_ids, mes__lte=data_base
+    ).values('conta_id').annotate(total=Sum(Case(When(tipo='R', then='total'), default=-F('total'))))
+    for item in arquivados:
+        movimentos[indice_conta[item['conta_id']], 0] += int(item['total'] * 100)
+
+    # 2. Lançamentos futuros já existentes nas contas
+    for manager, sinal in realizados:
+        futuros = list(manager.filter(
+            conta__familia=familia, user_id__in=user_ids, data__gt=data_base, data__lte=data_fim
+        ).values_list('conta_id', 'data', 'valor'))
+        if futuros:
+            conta_ids, datas_mov, valores = zip(*futuros)
+            linhas = np.array([indice_conta[c] for c in conta_ids], dtype=np.int64)
+            colunas = (np.array(datas_mov, dtype='datetime64[D]') - inicio).astype(np.int64)
+            np.add.at(movimentos, (linhas, colunas), sinal * centavos(valores))
+
+    saldos = np.cumsum(movimentos, axis=1)
+
+    # 3. Faturas de cartão em aberto, lançadas na data de vencimento
+    faturas = np.zeros(n_dias, dtype=np.int64)
+    cartoes = {c.id: c for c in CartaoDeCredito.objects.filter(familia=familia)}
+    abertas = list(Despesa.objects.filter(
+        cartao_id__in=list(cartoes), user_id__in=user_ids, fatura_paga=False, data__lte=data_fim
+    ).values_list('cartao_id', 'data', 'valor'))
+    if abertas:
+        cartao_ids, datas_compra, valores = zip(*abertas)
+        fechamento = np.array([cartoes[c].dia_fechamento for c in cartao_ids], dtype=np.int64)
+        vencimento = np.array([cartoes[c].dia_vencimento for c in cartao_ids], dtype=np.int64)
+        fechamentos = datas_fechamento(np.array(datas_compra, dtype='datetime64[D]'), fechamento)
+        vencimentos = datas_vencimento(fechamentos, fechamento, vencimento)
+        colunas = (vencimentos - inicio).astype(np.int64)
+        no_horizonte = colunas < n_dias
+        # Faturas já vencidas e não pagas pesam desde o primeiro dia da projeção
+        np.add.at(faturas, np.clip(colunas[no_horizonte], 0, None), centavos(valores)[no_horizonte])
+
+    consolidado = saldos.sum(axis=0) - np.cumsum(faturas)
+
+    # 4. Menor saldo projetado de cada conta, em uma única passada sobre a matriz
+    minimos = []
+    if contas:
+        posicoes = saldos.argmin(axis=1)
+        for conta, posicao, linha in zip(contas, posicoes, saldos):
+            minimos.append({
+                'conta': conta,
+                'valor': para_decimal(linha[posicao]),
+                'data': datas[posicao].item(),
+                'saldo_final': para_decimal(linha[-1]),
+            })
+    posicao_consolidado = int(consolidado.argmin())
+
+    return {
+        'data_base': data_base,
+        'data_fim': data_fim,
+        'datas': datas,
+        'contas': contas,
+        'saldos': saldos,
+        'consolidado': consolidado,
+        'minimos': minimos,
+        'minimo_consolidado': {
+            'valor': para_decimal(consolidado[posicao_consolidado]),
+            'data': datas[posicao_consolidado].item(),
+        },
+        'saldo_final_consolidado': para_decimal(consolidado[-1]),
+    }
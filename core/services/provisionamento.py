@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.models import Assinatura, Categoria, CategoriaReceita, Plano
+
+NE = Categoria.MacroCategoria.NECESSIDADE
+DE = Categoria.MacroCategoria.DESEJO
+ME = Categoria.MacroCategoria.META
+
+
+# --- Pacotes de categorias iniciais ---
+# Cada pacote descreve as categorias de despesa (com a macro-categoria de cada
+# subcategoria) e as categorias de receita criadas para uma nova família. Ao mudar
+# o conteúdo de um pacote, incremente a 'versao': ela fica gravada na família e
+# permite saber com qual modelo cada uma foi criada.
+
+PACOTES_CATEGORIAS = {
+    'padrao': {
+        'versao': 1,
+        'despesas': [
+            ("Moradia", NE, [("Aluguel", NE), ("Condomínio", NE), ("Contas de Casa", NE), ("Manutenção", None)]),
+            ("Alimentação", NE, [("Supermercado", NE), ("Restaurantes", DE), ("Delivery", DE)]),
+            ("Transporte", NE, [("Gasolina", None), ("Transporte Público", NE), ("Uber/Táxi", DE)]),
+            ("Lazer", DE, [("Hobbies", DE), ("Streaming", DE), ("Viagens", DE), ("Compras", DE)]),
+            ("Saúde", NE, [("Farmácia", NE), ("Plano de Saúde", NE), ("Consultas", None)]),
+            ("Financeiro", ME, [("Pagamento de Fatura", ME), ("Aportes em Metas", ME), ("Investimentos", ME)]),
+        ],
+        'receitas': ["Salário", "Renda Extra", "Presente", "Reembolso", "Vendas"],
+    },
+    'essencial': {
+        'versao': 1,
+        'despesas': [
+            ("Casa", NE, [("Aluguel", NE), ("Contas de Casa", NE), ("Supermercado", NE)]),
+            ("Transporte", NE, []),
+            ("Saúde", NE, []),
+            ("Lazer", DE, []),
+            ("Financeiro", ME, [("Pagamento de Fatura", ME), ("Aportes em Metas", ME)]),
+        ],
+        'receitas': ["Salário", "Renda Extra"],
+    },
+    'autonomo': {
+        'versao': 1,
+        'despesas': [
+            ("Moradia", NE, [("Aluguel", NE), ("Contas de Casa", NE)]),
+            ("Alimentação", NE, [("Supermercado", NE), ("Restaurantes", DE)]),
+            ("Trabalho", NE, [("Impostos", NE), ("Equipamentos", None), ("Software", None), ("Contador", NE)]),
+            ("Saúde", NE, [("Plano de Saúde", NE), ("Farmácia", NE)]),
+            ("Lazer", DE, [("Streaming", DE), ("Viagens", DE)]),
+            ("Financeiro", ME, [("Pagamento de Fatura", ME), ("Aportes em Metas", ME), ("Reserva de Impostos", ME)]),
+        ],
+        'receitas': ["Serviços Prestados", "Vendas", "Reembolso", "Renda Extra"],
+    },
+}
+
+
+
+def pacote_padrao():
+    """Pacote usado quando a família não escolhe outro (settings.PACOTE_CATEGORIAS_PADRAO)."""
+    return getattr(settings, 'PACOTE_CATEGORIAS_PADRAO', 'padrao')
+
+
+def obter_pacote(nome):
+    try:
+        return PACOTES_CATEGORIAS[nome]
+    except KeyError:
+        raise ValueError(f"Pacote de categorias desconhecido: {nome}")
+
+
+# Id do plano gratuito no cache do Django, por pouco tempo: os sinais de Plano o
+# descartam, mas com o cache locmem só no próprio processo, e os outros workers
+# enxergam uma troca de plano depois de no máximo TIMEOUT_PLANO_GRATUITO segundos.
+CHAVE_PLANO_GRATUITO = 'provisionamento:plano_gratuito_id'
+TIMEOUT_PLANO_GRATUITO = 60
+
+
+def plano_gratuito_id():
+    """Id do plano gratuito (None quando não há plano gratuito cadastrado)."""
+    plano_id = cache.get(CHAVE_PLANO_GRATUITO)
+    if plano_id is None:
+        # 0 guarda "sem plano gratuito", que também vale a pena não consultar de novo
+        plano_id = Plano.objects.filter(preco_mensal=0).values_list('id', flat=True).first() or 0
+        cache.set(CHAVE_PLANO_GRATUITO, plano_id, TIMEOUT_PLANO_GRATUITO)
+    return plano_id or None
+
+
+def descartar_plano_gratuito():
+    cache.delete(CHAVE_PLANO_GRATUITO)
+
+
+def provisionar_familia(familia, pacote=None):
+    """
+    Cria as categorias iniciais e a assinatura gratuita de uma família recém-criada,
+    em uma única transação: um bulk_create para as categorias principais, outro para
+    as subcategorias, outro para as categorias de receita e o INSERT da assinatura.
+
+    bulk_create não dispara post_save; como a família acabou de ser criada, ainda não
+    há nada dela em cache para invalidar.
+    """
+    modelo = obter_pacote(pacote or familia.pacote_categorias or pacote_padrao())
+
+    with transaction.atomic():
+        principais = Categoria.objects.bulk_create([
+            Categoria(familia=familia, nome=nome, macro_categoria=macro)
+            for nome, macro, _ in modelo['despesas']
+        ])
+        Categoria.objects.bulk_create([
+            Categoria(
+                familia=familia, nome=nome, categoria_mae=principal,
+                macro_categoria=macro or Categoria.MacroCategoria.NAO_CLASSIFICADO,
+            )
+            for principal, (_, _, subcategorias) in zip(principais, modelo['despesas'])
+            for nome, macro in subcategorias
+        ])
+        CategoriaReceita.objects.bulk_create([
+            CategoriaReceita(familia=familia, nome=nome) for nome in modelo['receitas']
+        ])
+
+        plano_id = plano_gratuito_id()
+        if plano_id:
+            Assinatura.objects.create(
+                familia=familia,
+                plano_id=plano_id,
+                status=Assinatura.StatusAssinatura.ATIVA
+            )
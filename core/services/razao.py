@@ -0,0 +1,151 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Case, F, Sum, When
+
+from core.models import Categoria, CategoriaReceita, Despesa, Lancamento, Receita, ResumoMensalArquivado
+
+# --- Razão unificado (tabela Lancamento) ---
+# Relatórios, saldos e extratos precisavam ler despesas e receitas separadamente e
+# juntar o resultado. Lancamento espelha as duas tabelas numa só, com o valor com
+# sinal e um índice em (familia, conta, data), então cada relatório lê um único
+# intervalo do índice.
+#
+# O espelho é mantido por triggers no banco, e não por sinais, porque boa parte das
+# gravações são em massa (séries, parcelamentos, lotes, arquivo, mesclagem,
+# exclusões) e não passam pelo save(). Assim como os triggers da busca textual, eles
+# são (re)criados na migração e a cada post_migrate, já que no SQLite algumas
+# alterações de schema recriam as tabelas de transação e descartam os triggers.
+#
+# Aportes e pagamentos de fatura já geram uma despesa na conta de origem, então
+# entram no razão por ela, sem linhas próprias.
+
+TABELA = Lancamento._meta.db_table
+
+# Tabela de origem: (tipo, sinal, tabela da categoria, coluna da categoria no razão, cartão e parcelas?)
+ORIGENS = {
+    Despesa: ('D', '-', Categoria, 'categoria_id', True),
+    Receita: ('R', '', CategoriaReceita, 'categoria_receita_id', False),
+}
+
+COLUNAS = (
+    "tipo, objeto_id, familia_id, user_id, conta_id, cartao_id, categoria_id, categoria_receita_id, "
+    "data, descricao, valor, parcela_atual, parcelas_totais"
+)
+
+
+def _valores(modelo, linha):
+    """Expressões SQL das colunas do razão a partir de uma linha ('new' ou um alias) da origem."""
+    tipo, sinal, modelo_categoria, coluna_categoria, com_cartao = ORIGENS[modelo]
+    categorias = {'categoria_id': 'NULL', 'categoria_receita_id': 'NULL'}
+    categorias[coluna_categoria] = f"{linha}.categoria_id"
+    cartao, parcela_atual, parcelas_totais = (
+        (f"{linha}.cartao_id", f"{linha}.parcela_atual", f"{linha}.parcelas_totais") if com_cartao else ('NULL',) * 3
+    )
+    familia = f"(SELECT familia_id FROM {modelo_categoria._meta.db_table} WHERE id = {linha}.categoria_id)"
+    return (
+        f"'{tipo}', {linha}.id, {familia}, {linha}.user_id, {linha}.conta_id, {cartao}, "
+        f"{categorias['categoria_id']}, {categorias['categoria_receita_id']}, {linha}.data, {linha}.descricao, "
+        f"{sinal}{linha}.valor, {parcela_atual}, {parcelas_totais}"
+    )
+
+
+def _sql_sqlite(modelo):
+    tabela = modelo._meta.db_table
+    tipo = ORIGENS[modelo][0]
+    inserir = f"INSERT INTO {TABELA} ({COLUNAS}) VALUES ({_valores(modelo, 'new')});"
+    apagar = f"DELETE FROM {TABELA} WHERE tipo = '{tipo}' AND objeto_id = old.id;"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {tabela}_razao_ai AFTER INSERT ON {tabela} BEGIN {inserir} END",
+        f"CREATE TRIGGER IF NOT EXISTS {tabela}_razao_ad AFTER DELETE ON {tabela} BEGIN {apagar} END",
+        f"CREATE TRIGGER IF NOT EXISTS {tabela}_razao_au AFTER UPDATE ON {tabela} BEGIN {apagar} {inserir} END",
+    ]
+
+
+def _sql_postgres(modelo):
+    tabela = modelo._meta.db_table
+    tipo = ORIGENS[modelo][0]
+    return [
+        f"""CREATE OR REPLACE FUNCTION {tabela}_razao() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM {TABELA} WHERE tipo = '{tipo}' AND objeto_id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {TABELA} ({COLUNAS}) VALUES ({_valores(modelo, 'NEW')});
+            END IF;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql""",
+        f"DROP TRIGGER IF EXISTS {tabela}_razao ON {tabela}",
+        f"""CREATE TRIGGER {tabela}_razao AFTER INSERT OR UPDATE OR DELETE ON {tabela}
+            FOR EACH ROW EXECUTE FUNCTION {tabela}_razao()""",
+    ]
+
+
+def instalar_razao(conexao, reconstruir=False):
+    """
+    Cria (se ainda não existirem) os triggers que mantêm o razão. Com 'reconstruir',
+    recria também todo o conteúdo a partir das despesas e receitas atuais.
+    """
+    if conexao.vendor not in ('sqlite', 'postgresql'):
+        return
+    with conexao.cursor() as cursor:
+        for modelo in ORIGENS:
+            sqls = _sql_sqlite(modelo) if conexao.vendor == 'sqlite' else _sql_postgres(modelo)
+            for sql in sqls:
+                cursor.execute(sql)
+        if reconstruir:
+            cursor.execute(f"DELETE FROM {TABELA}")
+            for modelo in ORIGENS:
+                cursor.execute(
+                    f"INSERT INTO {TABELA} ({COLUNAS}) SELECT {_valores(modelo, 'origem')} "
+                    f"FROM {modelo._meta.db_table} origem"
+                )
+
+
+def remover_razao(conexao):
+    with conexao.cursor() as cursor:
+        for modelo in ORIGENS:
+            tabela = modelo._meta.db_table
+            if conexao.vendor == 'sqlite':
+                for sufixo in ('ai', 'ad', 'au'):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {tabela}_razao_{sufixo}")
+            elif conexao.vendor == 'postgresql':
+                cursor.execute(f"DROP TRIGGER IF EXISTS {tabela}_razao ON {tabela}")
+                cursor.execute(f"DROP FUNCTION IF EXISTS {tabela}_razao()")
+
+
+# --- Leituras ---
+
+def saldos_contas(contas, usuarios, data_base=None):
+    """
+    Saldo realizado de cada conta até 'data_base' (por padrão, hoje), como em
+    Conta.get_saldo_atual, mas para todas as contas de uma vez: uma consulta agrupada
+    no razão e outra nos resumos arquivados. Retorna {conta_id: saldo}.
+    """
+    contas = list(contas)
+    if not contas:
+        return {}
+    if data_base is None:
+        data_base = date.today()
+    user_ids = [u.id for u in usuarios]
+    conta_ids = [c.id for c in contas]
+
+    movimentos = dict(Lancamento.objects.filter(
+        familia_id=contas[0].familia_id, conta_id__in=conta_ids, user_id__in=user_ids, data__lte=data_base
+    ).values('conta_id').annotate(total=Sum('valor')).order_by().values_list('conta_id', 'total'))
+    arquivados = movimento_arquivado(conta_ids, user_ids, data_base)
+
+    return {
+        c.id: c.saldo_inicial + (movimentos.get(c.id) or Decimal('0.00')) + (arquivados.get(c.id) or Decimal('0.00'))
+        for c in contas
+    }
+
+
+def movimento_arquivado(conta_ids, user_ids, data_base):
+    """Saldo dos resumos arquivados de cada conta até 'data_base', numa consulta agrupada: {conta_id: total}."""
+    return dict(ResumoMensalArquivado.objects.filter(
+        conta_id__in=conta_ids, user_id__in=user_ids, mes__lte=data_base
+    ).values('conta_id').annotate(
+        total=Sum(Case(When(tipo='R', then='total'), default=-F('total')))
+    ).order_by().values_list('conta_id', 'total'))
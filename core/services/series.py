@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import DateField, ExpressionWrapper, F, Q
+
+from django.utils import timezone
+
+from core.services import categorizador, sincronizacao
+from core.services.cache import invalidar_familia
+
+# --- Operações em séries (recorrências e compras parceladas) ---
+# Cada operação é um único UPDATE ou DELETE sobre o id da série, dentro de uma
+# transação. Como UPDATE/DELETE em massa não disparam os sinais por linha, os
+# caches derivados (versão da família, modelo de categorias) são invalidados uma
+# única vez ao final, em vez de uma vez por ocorrência.
+
+ESCOPO_ESTA = 'esta'
+ESCOPO_FUTURAS = 'futuras'
+ESCOPO_SERIE = 'serie'
+
+ESCOPO_CHOICES = [
+    (ESCOPO_ESTA, 'Somente esta'),
+    (ESCOPO_FUTURAS, 'Esta e as próximas'),
+    (ESCOPO_SERIE, 'Toda a série'),
+]
+
+# Campos que fazem sentido replicar para as demais ocorrências
+CAMPOS_SERIE = ['descricao', 'valor', 'categoria', 'conta', 'cartao']
+
+
+def campo_da_serie(transacao):
+    """Retorna (nome do campo, id da série) ou None se a transação é avulsa."""
+    if getattr(transacao, 'id_compra_parcelada', None):
+        return 'id_compra_parcelada', transacao.id_compra_parcelada
+    if transacao.id_recorrencia:
+        return 'id_recorrencia', transacao.id_recorrencia
+    return None
+
+
+def transacoes_da_serie(transacao, escopo):
+    """Queryset com as ocorrências da série afetadas pelo escopo escolhido."""
+    modelo = type(transacao)
+    serie = campo_da_serie(transacao)
+    if escopo == ESCOPO_ESTA or serie is None:
+        return modelo.objects.filter(id=transacao.id)
+
+    campo, valor = serie
+    queryset = modelo.objects.filter(user_id=transacao.user_id, **{campo: valor})
+    if escopo == ESCOPO_FUTURAS:
+        queryset = queryset.filter(Q(data__gt=transacao.data) | Q(data=transacao.data, id__gte=transacao.id))
+    return queryset
+
+
+def _invalidar(transacao):
+    familia_id = transacao.user.perfil.familia_id
+    invalidar_familia(familia_id)
+    categorizador.descartar_modelo(familia_id)
+
+
+def atualizar_serie(transacao, escopo, campos, dias=0):
+    """
+    Aplica 'campos' às ocorrências do escopo e desloca suas datas em 'dias',
+    tudo em um único UPDATE. 'transacao' deve refletir o estado salvo no banco.
+    Retorna a quantidade de linhas alteradas.
+    """
+    alteracoes = {campo: valor for campo, valor in campos.items() if campo in CAMPOS_SERIE}
+    if dias:
+        alteracoes['data'] = ExpressionWrapper(F('data') + timedelta(days=dias), output_field=DateField())
+    if not alteracoes:
+        return 0
+    alteracoes['atualizado_em'] = timezone.now()
+    with transaction.atomic():
+        queryset = transacoes_da_serie(transacao, escopo)
+        sincronizacao.registrar_queryset(queryset)
+        alteradas = queryset.update(**alteracoes)
+        _invalidar(transacao)
+    return alteradas
+
+
+def excluir_serie(transacao, escopo):
+    """Exclui as ocorrências do escopo com um único DELETE. Retorna quantas foram excluídas."""
+    modelo = type(transacao)
+    banco = router.db_for_write(modelo)
+    conexao = connections[banco]
+    with transaction.atomic():
+        # Um DELETE direto, sem carregar as linhas nem disparar post_delete para cada
+        # uma (não há nada em cascata a partir de transações)
+        queryset = transacoes_da_serie(transacao, escopo)
+        sincronizacao.registrar_queryset(queryset, excluido=True)
+        sql_ids, params = queryset.values('id').query.get_compiler(using=banco).as_sql()
+        with conexao.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {conexao.ops.quote_name(modelo._meta.db_table)} WHERE id IN ({sql_ids})", params)
+            excluidas = cursor.rowcount
+        _invalidar(transacao)
+    return excluidas
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Exists, Max, Min, OuterRef
+from django.utils import timezone
+
+from core.models import (
+    AlteracaoSincronizacao, CartaoDeCredito, Categoria, Conta, Despesa, Investimento, Receita,
+    TokenSincronizacao
+)
+
+# --- Sincronização incremental com o aplicativo ---
+# Cada gravação ou exclusão de um registro sincronizado gera uma linha em
+# AlteracaoSincronizacao (pelos sinais, ou explicitamente nas operações em massa,
+# que não disparam sinais). O id dessa tabela é o cursor do cliente: ele pede só o
+# que mudou depois do último id recebido e, de cada registro, recebe apenas a
+# alteração mais recente. Exclusões chegam como lápides ("excluido": true).
+#
+# A resposta é NDJSON (um objeto JSON por linha), gerada aos poucos: o cliente
+# processa cada linha ao recebê-la e o servidor não monta a resposta inteira na
+# memória. A última linha traz o novo cursor e se ainda há alterações a buscar.
+#
+# Os ids são atribuídos no INSERT, mas as transações podem ser confirmadas fora de
+# ordem: o id 11 pode ficar visível antes do 10, e um cursor que passasse do 11
+# perderia o 10 para sempre. Por isso o cursor nunca passa de uma alteração mais
+# recente que SINCRONIZACAO_JANELA_SEGUNDOS: ela (e tudo depois dela) fica para a
+# próxima sincronização. Isso supõe que nenhuma transação que registra alterações
+# fica aberta mais que a janela.
+
+MODELOS_SINCRONIZADOS = {
+    'despesa': Despesa,
+    'receita': Receita,
+    'conta': Conta,
+    'cartao': CartaoDeCredito,
+    'categoria': Categoria,
+    'investimento': Investimento,
+}
+NOMES_MODELOS = {modelo: nome for nome, modelo in MODELOS_SINCRONIZADOS.items()}
+
+LIMITE_PADRAO = 1000
+LIMITE_MAXIMO = 5000
+TAMANHO_LOTE = 500
+
+
+def _campo_familia(modelo):
+    # Transações pertencem ao usuário; a família vem do perfil dele
+    return 'user__perfil__familia_id' if modelo in (Despesa, Receita) else 'familia_id'
+
+
+def registrar_alteracoes(modelo, linhas, excluido=False):
+    """
+    Registra a alteração (ou exclusão) de vários registros de um modelo com um único
+    INSERT. 'linhas' são pares (familia_id, objeto_id); os sem família são ignorados.
+    """
+    nome = NOMES_MODELOS[modelo]
+    AlteracaoSincronizacao.objects.bulk_create([
+        AlteracaoSincronizacao(familia_id=familia_id, modelo=nome, objeto_id=objeto_id, excluido=excluido)
+        for familia_id, objeto_id in linhas if familia_id
+    ])
+
+
+def registrar_queryset(queryset, excluido=False, modelo=None):
+    """
+    Registra a alteração de todas as linhas do queryset (como registros de 'modelo',
+    por padrão o do próprio queryset) com um INSERT ... SELECT, sem trazer as linhas
+    para o Python. Para exclusões, chame antes de apagar as linhas.
+    """
+    modelo = modelo or queryset.model
+    campo_familia = _campo_familia(modelo)
+    sql, params = queryset.filter(**{f'{campo_familia}__isnull': False}).values_list(
+        campo_familia, 'id'
+    ).order_by().query.sql_with_params()
+    tabela = connection.ops.quote_name(AlteracaoSincronizacao._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {tabela} (familia_id, objeto_id, modelo, excluido, momento) "
+            f"SELECT linhas.*, %s, %s, %s FROM ({sql}) linhas",
+            (NOMES_MODELOS[modelo], excluido, timezone.now(), *params),
+        )
+
+
+# --- Tokens de acesso ---
+
+def _hash(chave):
+    return hashlib.sha256(chave.encode()).hexdigest()
+
+
+def criar_token(user, nome=''):
+    """Cria um token para o usuário e devolve a chave (ela não é guardada em texto)."""
+    chave = secrets.token_urlsafe(32)
+    TokenSincronizacao.objects.create(user=user, chave_hash=_hash(chave), nome=nome[:100])
+    return chave
+
+
+def usuario_do_token(chave):
+    """
+    Usuário dono do token, ou None se a chave não existe. Um token sem uso há mais de
+    SINCRONIZACAO_TOKEN_DIAS_SEM_USO dias expira e é apagado.
+    """
+    token = TokenSincronizacao.objects.select_related('user__perfil').filter(chave_hash=_hash(chave)).first()
+    if token is None or not token.user.is_active:
+        return None
+    agora = timezone.now()
+    if (token.ultimo_uso or token.criado_em) < agora - timedelta(days=settings.SINCRONIZACAO_TOKEN_DIAS_SEM_USO):
+        token.delete()
+        return None
+    TokenSincronizacao.objects.filter(id=token.id).update(ultimo_uso=agora)
+    return token.user
+
+
+def revogar_token(chave):
+    return TokenSincronizacao.objects.filter(chave_hash=_hash(chave)).delete()[0] > 0
+
+
+def tentativa_permitida(*identificadores):
+    """
+    Conta um pedido de token para cada identificador (IP, usuário) e diz se todos
+    ainda estão dentro do limite de SINCRONIZACAO_TENTATIVAS_TOKEN por
+    SINCRONIZACAO_INTERVALO_TENTATIVAS segundos. Os contadores ficam no cache: com o
+    locmem, o limite vale por worker.
+    """
+    intervalo = settings.SINCRONIZACAO_INTERVALO_TENTATIVAS
+    permitida = True
+    for identificador in identificadores:
+        chave = f"sync:tentativas:{_hash(identificador)}"
+        cache.add(chave, 0, intervalo)
+        try:
+            tentativas = cache.incr(chave)
+        except ValueError:
+            # Expirou entre o add e o incr
+            cache.set(chave, 1, intervalo)
+            tentativas = 1
+        permitida = permitida and tentativas <= settings.SINCRONIZACAO_TENTATIVAS_TOKEN
+    return permitida
+
+
+# --- Marcador para caches e ETags ---
+
+def marcador_alteracoes(familia_id):
+    """
+    Texto que muda a cada alteração registrada da família: o id da última, lido com
+    uma consulta ao índice (familia, id). Enquanto ela está na janela de segurança,
+    uma transação anterior ainda pode ser confirmada sem mudar esse id; o marcador
+    leva então também a fatia atual de SINCRONIZACAO_JANELA_SEGUNDOS.
+    """
+    ultima = AlteracaoSincronizacao.objects.filter(familia_id=familia_id).order_by('-id').values_list('id', 'momento').first()
+    if ultima is None:
+        return '0'
+    ultima_id, momento = ultima
+    janela = settings.SINCRONIZACAO_JANELA_SEGUNDOS
+    agora = timezone.now()
+    if janela and momento >= agora - timedelta(seconds=janela):
+        return f"{ultima_id}.{int(agora.timestamp()) // janela}"
+    return str(ultima_id)
+
+
+# --- Geração da resposta ---
+
+def limite_alteracoes(valor):
+    """Converte o parâmetro '?limite=' em um limite válido."""
+    try:
+        limite = int(valor)
+    except (TypeError, ValueError):
+        return LIMITE_PADRAO
+    return min(max(limite, 1), LIMITE_MAXIMO)
+
+
+def _linha(dados):
+    return json.dumps(dados, cls=DjangoJSONEncoder, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+
+def _registros(modelo, familia_id, ids=None):
+    queryset = modelo.objects.filter(**{_campo_familia(modelo): familia_id})
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    return queryset.order_by('id').values()
+
+
+def _alteracoes_estaveis(familia_id, cursor=0):
+    """
+    Alterações da família depois do cursor que o cursor pode ultrapassar: as anteriores
+    à primeira ainda dentro da janela de segurança (ver o comentário do módulo).
+    """
+    alteracoes = AlteracaoSincronizacao.objects.filter(familia_id=familia_id, id__gt=cursor)
+    janela = settings.SINCRONIZACAO_JANELA_SEGUNDOS
+    if janela:
+        corte = timezone.now() - timedelta(seconds=janela)
+        teto = alteracoes.filter(momento__gte=corte).aggregate(m=Min('id'))['m']
+        if teto is not None:
+            alteracoes = alteracoes.filter(id__lt=teto)
+    return alteracoes
+
+
+def _ultimas_alteracoes(familia_id, cursor, limite):
+    """Alterações depois do cursor, só a mais recente de cada registro, em ordem."""
+    posteriores = AlteracaoSincronizacao.objects.filter(
+        familia_id=familia_id, modelo=OuterRef('modelo'), objeto_id=OuterRef('objeto_id'), id__gt=OuterRef('id')
+    )
+    return list(_alteracoes_estaveis(familia_id, cursor).exclude(
+        Exists(posteriores)
+    ).order_by('id').values_list('id', 'modelo', 'objeto_id', 'excluido')[:limite + 1])
+
+
+def gerar_alteracoes(familia_id, cursor=0, limite=LIMITE_PADRAO):
+    """
+    Gera as linhas NDJSON da sincronização. Com cursor 0 (primeira sincronização)
+    envia todos os registros atuais da família; depois, só o que mudou.
+    """
+    if not cursor:
+        # O cursor é lido antes da cópia, e só até onde é seguro (a janela): o que
+        # mudar durante ela ou depois do cursor vem de novo na próxima sincronização,
+        # e o cliente só sobrescreve o registro.
+        cursor_final = _alteracoes_estaveis(familia_id).aggregate(m=Max('id'))['m'] or 0
+        for nome, modelo in MODELOS_SINCRONIZADOS.items():
+            for dados in _registros(modelo, familia_id).iterator(chunk_size=TAMANHO_LOTE):
+                yield _linha({'modelo': nome, 'id': dados['id'], 'excluido': False, 'dados': dados})
+        yield _linha({'cursor': cursor_final, 'mais': False})
+        return
+
+    alteracoes = _ultimas_alteracoes(familia_id, cursor, limite)
+    mais = len(alteracoes) > limite
+    alteracoes = alteracoes[:limite]
+    for inicio in range(0, len(alteracoes), TAMANHO_LOTE):
+        lote = alteracoes[inicio:inicio + TAMANHO_LOTE]
+        ids_por_modelo = {}
+        for _, nome, objeto_id, excluido in lote:
+            if not excluido:
+                ids_por_modelo.setdefault(nome, []).append(objeto_id)
+        registros = {
+            (nome, dados['id']): dados
+            for nome, ids in ids_por_modelo.items()
+            for dados in _registros(MODELOS_SINCRONIZADOS[nome], familia_id, ids)
+        }
+        for _, nome, objeto_id, excluido in lote:
+            dados = None if excluido else registros.get((nome, objeto_id))
+            if dados is None:
+                # Excluído (ou saiu da família) sem que a exclusão tenha sido registrada
+                yield _linha({'modelo': nome, 'id': objeto_id, 'excluido': True})
+            else:
+                yield _linha({'modelo': nome, 'id': objeto_id, 'excluido': False, 'dados': dados})
+    yield _linha({'cursor': alteracoes[-1][0] if alteracoes else cursor, 'mais': mais})
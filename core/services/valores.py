@@ -0,0 +1,18 @@
+from decimal import Decimal
+
+import numpy as np
+
+# --- Valores em centavos ---
+# Os cálculos com arrays NumPy (projeção, faturas, orçamento) somam valores em
+# centavos, como inteiros, para não acumular erros de ponto flutuante; o resultado
+# volta para Decimal só na hora de exibir.
+
+
+def centavos(valores):
+    """Array int64 com os valores (Decimal) em centavos."""
+    return np.array([int(v * 100) for v in valores], dtype=np.int64)
+
+
+def para_decimal(valor_centavos):
+    """Converte um valor em centavos de volta para Decimal, com duas casas."""
+    return (Decimal(int(valor_centavos)) / 100).quantize(Decimal('0.01'))
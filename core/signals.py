@@ -1,7 +1,18 @@
-from django.db.models.signals import post_save
+from datetime import date
+
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Perfil, Familia, Categoria, CategoriaReceita, Plano, Assinatura
+from django.db import connections
+from .models import (
+    Perfil, Familia, Categoria, CategoriaReceita, Plano, Conta, CartaoDeCredito,
+    Despesa, Receita, Investimento, AporteInvestimento, MetaFinanceira, HistoricoOrcamento,
+    Assinatura
+)
+from .services.cache import ESCOPO_CONFIG, invalidar_familia
+from .services.busca import instalar_busca
+from .services.razao import TABELA as TABELA_RAZAO, instalar_razao
+from .services import categorizador, provisionamento, sincronizacao
 
 # --- Sinal para criar Perfil ---
 @receiver(post_save, sender=User)
@@ -15,21 +26,14 @@ def salvar_perfil(sender, instance, **kwargs):
         instance.perfil.save()
 
 
-# --- Sinal para criar Associações Padrão para uma nova Família ---
-
-# Definindo nossas categorias padrão
-CATEGORIAS_DESPESA_PADRAO = [
-    {"nome": "Moradia", "macro": "NE", "sub": ["Aluguel", "Condomínio", "Contas de Casa", "Manutenção"]},
-    {"nome": "Alimentação", "macro": "NE", "sub": ["Supermercado", "Restaurantes", "Delivery"]},
-    {"nome": "Transporte", "macro": "NE", "sub": ["Gasolina", "Transporte Público", "Uber/Táxi"]},
-    {"nome": "Lazer", "macro": "DE", "sub": ["Hobbies", "Streaming", "Viagens", "Compras"]},
-    {"nome": "Saúde", "macro": "NE", "sub": ["Farmácia", "Plano de Saúde", "Consultas"]},
-    {"nome": "Financeiro", "macro": "ME", "sub": ["Pagamento de Fatura", "Aportes em Metas", "Investimentos"]},
-]
+# --- Provisionamento de uma nova Família (categorias padrão e assinatura gratuita) ---
 
-CATEGORIAS_RECEITA_PADRAO = [
-    "Salário", "Renda Extra", "Presente", "Reembolso", "Vendas"
-]
+@receiver(pre_save, sender=Familia)
+def definir_pacote_familia(sender, instance, **kwargs):
+    """Grava na família o pacote de categorias que será aplicado e a sua versão."""
+    if instance._state.adding:
+        instance.pacote_categorias = instance.pacote_categorias or provisionamento.pacote_padrao()
+        instance.versao_pacote = provisionamento.obter_pacote(instance.pacote_categorias)['versao']
 
 @receiver(post_save, sender=Familia)
 def criar_associacoes_padrao(sender, instance, created, **kwargs):
@@ -38,41 +42,102 @@ def criar_associacoes_padrao(sender, instance, created, **kwargs):
     Ele cria as categorias padrão e a assinatura gratuita.
     """
     if created:
-        familia = instance
-
-        # 1. Cria as categorias de despesa com suas subcategorias e macro-categorias
-        for cat_data in CATEGORIAS_DESPESA_PADRAO:
-            cat_principal = Categoria.objects.create(
-                familia=familia,
-                nome=cat_data["nome"],
-                macro_categoria=cat_data["macro"]
-            )
-            for sub_nome in cat_data["sub"]:
-                # Uma lógica simples para atribuir macro-categorias às subcategorias
-                macro_sub = Categoria.MacroCategoria.NAO_CLASSIFICADO
-                if sub_nome in ["Aluguel", "Condomínio", "Contas de Casa", "Supermercado", "Transporte Público", "Plano de Saúde", "Farmácia"]:
-                    macro_sub = Categoria.MacroCategoria.NECESSIDADE
-                elif sub_nome in ["Restaurantes", "Delivery", "Hobbies", "Streaming", "Viagens", "Compras", "Uber/Táxi"]:
-                    macro_sub = Categoria.MacroCategoria.DESEJO
-                elif sub_nome in ["Pagamento de Fatura", "Aportes em Metas", "Investimentos"]:
-                    macro_sub = Categoria.MacroCategoria.META
-                
-                Categoria.objects.create(
-                    familia=familia,
-                    nome=sub_nome,
-                    categoria_mae=cat_principal,
-                    macro_categoria=macro_sub
-                )
-
-        # 2. Cria as categorias de receita
-        for nome_cat in CATEGORIAS_RECEITA_PADRAO:
-            CategoriaReceita.objects.create(familia=familia, nome=nome_cat)
-
-        # 3. Inscreve a nova família no plano Gratuito
-        plano_gratuito = Plano.objects.filter(preco_mensal=0).first()
-        if plano_gratuito:
-            Assinatura.objects.create(
-                familia=familia, 
-                plano=plano_gratuito, 
-                status=Assinatura.StatusAssinatura.ATIVA
-            )
\ No newline at end of file
+        provisionamento.provisionar_familia(instance)
+
+@receiver(post_save, sender=Plano)
+@receiver(post_delete, sender=Plano)
+def descartar_plano_gratuito(sender, instance, **kwargs):
+    provisionamento.descartar_plano_gratuito()
+
+# --- Sinais para invalidar os caches derivados dos dados da família ---
+
+def familia_do_usuario(user_id):
+    return Perfil.objects.filter(user_id=user_id).values_list('familia_id', flat=True).first()
+
+# Transações pertencem ao usuário, e a família vem do perfil dele. Um único receiver
+# resolve a família (uma consulta) e faz o que cada gravação ou exclusão pede: cache,
+# categorizador e registro para a sincronização.
+@receiver(post_save, sender=Despesa)
+@receiver(post_delete, sender=Despesa)
+@receiver(post_save, sender=Receita)
+@receiver(post_delete, sender=Receita)
+@receiver(post_save, sender=AporteInvestimento)
+@receiver(post_delete, sender=AporteInvestimento)
+def transacao_alterada(sender, instance, signal, created=False, **kwargs):
+    familia_id = familia_do_usuario(instance.user_id)
+    invalidar_familia(familia_id)
+    if sender is Despesa:
+        if created:
+            categorizador.aprender_despesa(familia_id, instance)
+        else:
+            # Edição ou exclusão: a categoria antiga não está mais disponível para
+            # "desaprender", então o modelo é retreinado no próximo uso.
+            categorizador.descartar_modelo(familia_id)
+    if sender in sincronizacao.NOMES_MODELOS:
+        sincronizacao.registrar_alteracoes(sender, [(familia_id, instance.id)], excluido=signal is post_delete)
+
+@receiver(post_save, sender=Conta)
+@receiver(post_delete, sender=Conta)
+@receiver(post_save, sender=CartaoDeCredito)
+@receiver(post_delete, sender=CartaoDeCredito)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_save, sender=CategoriaReceita)
+@receiver(post_delete, sender=CategoriaReceita)
+@receiver(post_save, sender=Investimento)
+@receiver(post_delete, sender=Investimento)
+@receiver(post_save, sender=MetaFinanceira)
+@receiver(post_delete, sender=MetaFinanceira)
+@receiver(post_save, sender=Assinatura)
+@receiver(post_delete, sender=Assinatura)
+def invalidar_cache_configuracao(sender, instance, **kwargs):
+    invalidar_familia(instance.familia_id)
+    if sender in (Conta, CartaoDeCredito, Categoria, CategoriaReceita):
+        # Listas de opções dos formulários (core/services/opcoes.py)
+        invalidar_familia(instance.familia_id, ESCOPO_CONFIG)
+
+
+# --- Registro de alterações para a sincronização do aplicativo ---
+
+# (despesas e receitas são registradas em transacao_alterada)
+@receiver(post_save, sender=Conta)
+@receiver(post_save, sender=CartaoDeCredito)
+@receiver(post_save, sender=Categoria)
+@receiver(post_save, sender=Investimento)
+@receiver(post_delete, sender=Conta)
+@receiver(post_delete, sender=CartaoDeCredito)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Investimento)
+def registrar_alteracao_sincronizacao(sender, instance, signal, **kwargs):
+    sincronizacao.registrar_alteracoes(sender, [(instance.familia_id, instance.id)], excluido=signal is post_delete)
+
+
+# --- Histórico do orçamento por categoria ---
+# Sempre que o orçamento de uma categoria muda, o novo valor passa a valer a partir
+# do mês atual; os meses anteriores continuam com o valor que tinham.
+
+@receiver(post_save, sender=Categoria)
+def registrar_historico_orcamento(sender, instance, created, **kwargs):
+    ultimo = instance.historico_orcamento.order_by('-mes').values_list('valor', flat=True).first()
+    if ultimo is None and not instance.orcamento_mensal:
+        return
+    if ultimo is not None and ultimo == instance.orcamento_mensal:
+        return
+    HistoricoOrcamento.objects.update_or_create(
+        categoria=instance, mes=date.today().replace(day=1),
+        defaults={'valor': instance.orcamento_mensal},
+    )
+
+
+# --- Sinal para garantir os índices de busca textual e o razão ---
+# No SQLite, migrações que recriam as tabelas de transação descartam os triggers
+# que mantêm o índice FTS e o razão (Lancamento) em dia; recriá-los aqui mantém
+# os dois consistentes.
+
+@receiver(post_migrate)
+def garantir_indices_busca(sender, using, **kwargs):
+    if sender.name == 'core':
+        conexao = connections[using]
+        instalar_busca(conexao)
+        if TABELA_RAZAO in conexao.introspection.table_names():
+            instalar_razao(conexao)
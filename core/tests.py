@@ -1,12 +1,13 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
 from decimal import Decimal
 from datetime import date
+from unittest.mock import patch
 from django.urls import reverse
 
 from core.models import (
     Familia, Perfil, Conta, CartaoDeCredito, Categoria, 
-    CategoriaReceita, Despesa, Receita
+    CategoriaReceita, Despesa, Receita, ResumoMensalArquivado, Plano
 )
 
 class ContaModelTest(TestCase):
@@ -84,4 +85,1284 @@ class DashboardViewTest(TestCase):
         response = self.client.get(reverse('dashboard'))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'core/dashboard.html')
-        self.assertContains(response, "Dashboard Financeiro")
\ No newline at end of file
+        self.assertContains(response, "Dashboard Financeiro")
+
+class ProjecaoSaldosTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuarioprojecao', password='123')
+        cls.familia = Familia.objects.create(nome="Família Projeção")
+        cls.user.perfil.familia = cls.familia
+        cls.user.perfil.save()
+        cls.categoria = Categoria.objects.create(familia=cls.familia, nome="Contas")
+        cls.cat_receita = CategoriaReceita.objects.create(familia=cls.familia, nome="Salário")
+        cls.conta = Conta.objects.create(familia=cls.familia, nome="Corrente", saldo_inicial=Decimal('1000.00'))
+
+    def test_datas_fechamento_respeita_fim_de_mes(self):
+        import numpy as np
+        from core.services.calendario import datas_fechamento, datas_vencimento
+        datas = np.array(['2025-01-31', '2025-02-28', '2025-03-01', '2024-02-29'], dtype='datetime64[D]')
+        fechamentos = datas_fechamento(datas, 31)
+        self.assertEqual([str(d) for d in fechamentos], ['2025-01-31', '2025-02-28', '2025-03-31', '2024-02-29'])
+        cartao = CartaoDeCredito.objects.create(familia=self.familia, nome="C", limite=1, dia_fechamento=31, dia_vencimento=10)
+        for data, fechamento in zip(datas, fechamentos):
+            fatura = cartao.get_fatura_aberta(usuarios=[self.user], data_base=data.item())
+            self.assertEqual(fatura['data_fechamento'], fechamento.item())
+        vencimentos = datas_vencimento(fechamentos, 31, 10)
+        self.assertEqual(str(vencimentos[1]), '2025-03-10')
+
+    def test_menor_saldo_projetado_por_conta(self):
+        from core.services.projecao import projetar_saldos
+        hoje = date(2025, 10, 15)
+        Despesa.objects.create(user=self.user, conta=self.conta, categoria=self.categoria, valor=Decimal('1200.00'), data=date(2025, 10, 20), descricao="Aluguel")
+        Receita.objects.create(user=self.user, conta=self.conta, categoria=self.cat_receita, valor=Decimal('500.00'), data=date(2025, 10, 25), descricao="Salário")
+        cartao = CartaoDeCredito.objects.create(familia=self.familia, nome="Cartão", limite=Decimal('5000.00'), dia_fechamento=25, dia_vencimento=5)
+        Despesa.objects.create(user=self.user, cartao=cartao, categoria=self.categoria, valor=Decimal('300.00'), data=date(2025, 10, 10), descricao="Mercado")
+
+        projecao = projetar_saldos(self.familia, [self.user], meses=2, data_base=hoje)
+
+        minimo = projecao['minimos'][0]
+        self.assertEqual(minimo['valor'], Decimal('-200.00'))
+        self.assertEqual(minimo['data'], date(2025, 10, 20))
+        self.assertEqual(minimo['saldo_final'], Decimal('300.00'))
+        # A fatura fecha em 25/10 e vence em 05/11, pesando apenas na série consolidada
+        self.assertEqual(projecao['saldo_final_consolidado'], Decimal('0.00'))
+        self.assertEqual(projecao['minimo_consolidado']['valor'], Decimal('-200.00'))
+
+    @override_settings(SINCRONIZACAO_JANELA_SEGUNDOS=0)
+    def test_cache_acompanha_escritas_de_outro_worker(self):
+        from core.services.projecao import projetar_saldos
+        hoje = date(2025, 10, 15)
+        self.assertEqual(projetar_saldos(self.familia, [self.user], meses=1, data_base=hoje)['saldo_final_consolidado'], Decimal('1000.00'))
+        # Sem invalidar o cache deste processo, como se outro worker atendesse a escrita
+        with patch('core.signals.invalidar_familia'):
+            Despesa.objects.create(user=self.user, conta=self.conta, categoria=self.categoria, valor=Decimal('100.00'), data=date(2025, 10, 20), descricao="Luz")
+        self.assertEqual(projetar_saldos(self.familia, [self.user], meses=1, data_base=hoje)['saldo_final_consolidado'], Decimal('900.00'))
+
+
+class ExtratoContaTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuarioextrato', password='123')
+        cls.familia = Familia.objects.create(nome="Família Extrato")
+        cls.user.perfil.familia = cls.familia
+        cls.user.perfil.save()
+        cls.categoria = Categoria.objects.create(familia=cls.familia, nome="Mercado")
+        cls.cat_receita = CategoriaReceita.objects.create(familia=cls.familia, nome="Salário")
+        cls.conta = Conta.objects.create(familia=cls.familia, nome="Corrente", saldo_inicial=Decimal('100.00'))
+        for dia in range(1, 6):
+            Receita.objects.create(user=cls.user, conta=cls.conta, categoria=cls.cat_receita, valor=Decimal('50.00'), data=date(2025, 3, dia), descricao=f"Receita {dia}")
+            Despesa.objects.create(user=cls.user, conta=cls.conta, categoria=cls.categoria, valor=Decimal('20.00'), data=date(2025, 3, dia), descricao=f"Despesa {dia}")
+
+    def test_saldo_corrido_e_paginas_por_cursor(self):
+        from core.services.extrato import extrato_conta
+        vistos = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                linhas, cursor = extrato_conta(self.conta, [self.user], date(2025, 12, 31), cursor=cursor, limite=3)
+            vistos.extend(linhas)
+            if not cursor:
+                break
+        self.assertEqual(len(vistos), 10)
+        self.assertEqual(vistos[0]['saldo'], self.conta.get_saldo_atual(usuarios=[self.user], data_base=date(2025, 12, 31)))
+        self.assertEqual(vistos[0]['saldo'], Decimal('250.00'))
+        # O lançamento mais antigo é a despesa de 01/03: 100 - 20
+        self.assertEqual((vistos[-1]['tipo'], vistos[-1]['saldo']), ('D', Decimal('80.00')))
+        self.assertEqual([l['data'] for l in vistos], sorted((l['data'] for l in vistos), reverse=True))
+
+
+class ListaDespesasCursorTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='usuariolista', password='123')
+        self.familia = Familia.objects.create(nome="Família Lista")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.categoria = Categoria.objects.create(familia=self.familia, nome="Lazer")
+        self.conta = Conta.objects.create(familia=self.familia, nome="Corrente")
+        for i in range(25):
+            Despesa.objects.create(user=self.user, conta=self.conta, categoria=self.categoria, valor=Decimal('10.00'), data=date(2025, 1, 1 + i), descricao=f"Antiga {i}")
+        self.client.login(username='usuariolista', password='123')
+
+    def test_paginas_seguem_o_cursor_sem_repetir(self):
+        response = self.client.get(reverse('lista_despesas'))
+        primeira = response.context['despesas']
+        self.assertEqual(len(primeira), 20)
+        response = self.client.get(reverse('lista_despesas'), {'cursor': response.context['proximo_cursor']}, HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response, 'core/partials/despesas_linhas.html')
+        segunda = response.context['despesas']
+        self.assertEqual(len(segunda), 5)
+        self.assertIsNone(response.context['proximo_cursor'])
+        self.assertFalse({d.id for d in primeira} & {d.id for d in segunda})
+
+    def test_post_htmx_devolve_apenas_a_nova_linha(self):
+        response = self.client.post(reverse('lista_despesas'), {
+            'descricao': 'Cinema', 'valor': '42.00', 'data': '2025-02-01',
+            'categoria': self.categoria.id, 'conta': self.conta.id, 'numero_parcelas': 1,
+        }, HTTP_HX_REQUEST='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Cinema')
+        self.assertContains(response, 'hx-swap-oob="afterbegin:#corpo-despesas"')
+        self.assertNotContains(response, 'Antiga')
+
+
+class BuscaTransacoesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuariobusca', password='123')
+        cls.familia = Familia.objects.create(nome="Família Busca")
+        cls.user.perfil.familia = cls.familia
+        cls.user.perfil.save()
+        cls.categoria = Categoria.objects.create(familia=cls.familia, nome="Saúde")
+        cls.cat_receita = CategoriaReceita.objects.create(familia=cls.familia, nome="Reembolsos")
+        cls.conta = Conta.objects.create(familia=cls.familia, nome="Corrente")
+        Despesa.objects.create(user=cls.user, conta=cls.conta, categoria=cls.categoria, valor=Decimal('30.00'), data=date(2025, 3, 10), descricao="Farmácia Central")
+        Despesa.objects.create(user=cls.user, conta=cls.conta, categoria=cls.categoria, valor=Decimal('12.00'), data=date(2025, 1, 5), descricao="Farmácia do Bairro")
+        Despesa.objects.create(user=cls.user, conta=cls.conta, categoria=cls.categoria, valor=Decimal('8.00'), data=date(2025, 3, 11), descricao="Padaria")
+        Receita.objects.create(user=cls.user, conta=cls.conta, categoria=cls.cat_receita, valor=Decimal('30.00'), data=date(2025, 3, 12), descricao="Reembolso farmácia")
+
+    def test_busca_ignora_acentos_e_aceita_prefixo(self):
+        from core.services.busca import buscar_transacoes
+        for termo in ('farmacia', 'FARM', 'farmácia'):
+            transacoes, _ = buscar_transacoes([self.user], termo)
+            self.assertEqual([t.descricao for t in transacoes], ['Reembolso farmácia', 'Farmácia Central', 'Farmácia do Bairro'])
+        self.assertEqual([t.tipo for t in transacoes], ['R', 'D', 'D'])
+
+    def test_busca_respeita_periodo_e_cursor(self):
+        from core.services.busca import buscar_transacoes
+        transacoes, _ = buscar_transacoes([self.user], 'farm', data_inicio=date(2025, 2, 1))
+        self.assertEqual(len(transacoes), 2)
+
+        _, cursor = buscar_transacoes([self.user], 'farm', limite=2)
+        pagina2, fim = buscar_transacoes([self.user], 'farm', cursor=cursor, limite=2)
+        self.assertEqual([t.descricao for t in pagina2], ['Farmácia do Bairro'])
+        self.assertIsNone(fim)
+
+    def test_descricao_alterada_atualiza_indice(self):
+        Despesa.objects.filter(descricao="Padaria").update(descricao="Drogaria")
+        self.client.login(username='usuariobusca', password='123')
+        response = self.client.get(reverse('busca_transacoes'), {'q': 'drog'})
+        self.assertContains(response, 'Drogaria')
+        self.assertEqual(len(response.context['transacoes']), 1)
+
+    def test_data_malformada_ignora_o_filtro(self):
+        self.client.login(username='usuariobusca', password='123')
+        response = self.client.get(reverse('busca_transacoes'), {'q': 'farm', 'data_inicio': '2025-13-40', 'data_fim': 'ontem'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['data_inicio'])
+        self.assertEqual(len(response.context['transacoes']), 3)
+
+
+class CategorizadorTest(TestCase):
+
+    def setUp(self):
+        from core.services import categorizador
+        self.user = User.objects.create_user(username='usuariocategorizador', password='123')
+        self.familia = Familia.objects.create(nome="Família Categorizador")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        categorizador.descartar_modelo(self.familia.id)
+        self.mercado = Categoria.objects.create(familia=self.familia, nome="Mercado")
+        self.transporte = Categoria.objects.create(familia=self.familia, nome="Transporte")
+        self.conta = Conta.objects.create(familia=self.familia, nome="Corrente")
+        for descricao in ["Supermercado Extra", "Mercado da Esquina", "Supermercado Pão de Açúcar"]:
+            Despesa.objects.create(user=self.user, conta=self.conta, categoria=self.mercado, valor=Decimal('150.00'), data=date(2025, 3, 1), descricao=descricao)
+        for descricao in ["Posto Ipiranga", "Uber viagem", "Posto Shell"]:
+            Despesa.objects.create(user=self.user, conta=self.conta, categoria=self.transporte, valor=Decimal('40.00'), data=date(2025, 3, 1), descricao=descricao)
+
+    def test_sugere_categoria_e_aprende_incrementalmente(self):
+        from core.services.categorizador import sugerir_categoria, sugerir_categorias
+        self.assertEqual(sugerir_categoria(self.familia.id, "SUPERMERCADO"), self.mercado.id)
+        self.assertEqual(
+            sugerir_categorias(self.familia.id, [{'descricao': "posto"}, {'descricao': "mercado"}]),
+            [self.transporte.id, self.mercado.id],
+        )
+        # Novas despesas entram no modelo já carregado, sem retreinar
+        for _ in range(3):
+            Despesa.objects.create(user=self.user, conta=self.conta, categoria=self.transporte, valor=Decimal('30.00'), data=date(2025, 3, 2), descricao="99 Taxi")
+        with self.assertNumQueries(0):
+            self.assertEqual(sugerir_categoria(self.familia.id, "taxi"), self.transporte.id)
+
+    def test_endpoint_htmx_marca_sugestao(self):
+        self.client.login(username='usuariocategorizador', password='123')
+        response = self.client.get(reverse('sugerir_categoria_despesa'), {'descricao': 'Uber', 'categoria': ''}, HTTP_HX_REQUEST='true')
+        self.assertContains(response, f'<option value="{self.transporte.id}" selected>')
+        # Uma escolha manual não é substituída
+        response = self.client.get(reverse('sugerir_categoria_despesa'), {'descricao': 'Uber', 'categoria': self.mercado.id}, HTTP_HX_REQUEST='true')
+        self.assertContains(response, f'<option value="{self.mercado.id}" selected>')
+
+    def test_valor_invalido_e_ignorado(self):
+        self.client.login(username='usuariocategorizador', password='123')
+        for valor in ('abc', '12,50', '-5', '0', 'NaN', 'Infinity'):
+            response = self.client.get(reverse('sugerir_categoria_despesa'), {'descricao': 'Uber', 'valor': valor}, HTTP_HX_REQUEST='true')
+            self.assertContains(response, f'<option value="{self.transporte.id}" selected>')
+
+
+class ReplicaRouterTest(TestCase):
+
+    def setUp(self):
+        from django.test import RequestFactory
+        self.factory = RequestFactory()
+
+    def _banco_de_leitura(self, request):
+        from django.db import router
+        from core.routers import usar_replica
+
+        @usar_replica
+        def view(request):
+            return router.db_for_read(Despesa)
+        return view(request)
+
+    @patch('core.routers.replica_configurada', return_value=True)
+    def test_views_de_relatorio_leem_da_replica(self, _):
+        self.assertEqual(self._banco_de_leitura(self.factory.get('/')), 'replica')
+        self.assertEqual(self._banco_de_leitura(self.factory.post('/')), 'default')
+
+    @patch('core.routers.replica_configurada', return_value=False)
+    def test_sem_replica_tudo_fica_no_principal(self, _):
+        self.assertEqual(self._banco_de_leitura(self.factory.get('/')), 'default')
+
+    @patch('core.routers.replica_configurada', return_value=True)
+    def test_escrita_recente_prende_usuario_ao_primario(self, _):
+        from django.http import HttpResponse
+        from core.routers import COOKIE_PRIMARIO, LeituraAposEscritaMiddleware
+        middleware = LeituraAposEscritaMiddleware(lambda request: HttpResponse())
+        response = middleware(self.factory.post('/'))
+        request = self.factory.get('/')
+        request.COOKIES[COOKIE_PRIMARIO] = response.cookies[COOKIE_PRIMARIO].value
+        self.assertEqual(self._banco_de_leitura(request), 'default')
+        self.assertNotIn(COOKIE_PRIMARIO, middleware(self.factory.get('/')).cookies)
+
+    def test_replica_espelho_do_principal_le_do_principal(self):
+        from types import SimpleNamespace
+        from core.routers import replica_configurada
+        principal = {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'financas', 'HOST': 'primario', 'PORT': 5432}
+        conexoes = {'default': SimpleNamespace(settings_dict=principal)}
+        bancos = {'default': principal, 'replica': {}}
+        with self.settings(DATABASES=bancos), patch('core.routers.connections', conexoes):
+            conexoes['replica'] = SimpleNamespace(settings_dict=dict(principal, HOST='replica'))
+            self.assertTrue(replica_configurada())
+            # O TEST['MIRROR'] aponta a réplica para o banco de testes do principal
+            conexoes['replica'] = SimpleNamespace(settings_dict=dict(principal))
+            self.assertFalse(replica_configurada())
+
+
+class ArquivoTransacoesTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='usuarioarquivo', password='123')
+        self.familia = Familia.objects.create(nome="Família Arquivo")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.categoria = Categoria.objects.create(familia=self.familia, nome="Mercado")
+        self.cat_receita = CategoriaReceita.objects.create(familia=self.familia, nome="Salário")
+        self.conta = Conta.objects.create(familia=self.familia, nome="Corrente", saldo_inicial=Decimal('100.00'))
+        self.cartao = CartaoDeCredito.objects.create(familia=self.familia, nome="Visa", limite=1000, dia_fechamento=10, dia_vencimento=20)
+        for mes in (1, 6, 12):
+            Receita.objects.create(user=self.user, conta=self.conta, categoria=self.cat_receita, valor=Decimal('1000.00'), data=date(2020, mes, 5), descricao="Salário")
+            Despesa.objects.create(user=self.user, conta=self.conta, categoria=self.categoria, valor=Decimal('300.00'), data=date(2020, mes, 8), descricao="Mercado")
+        Despesa.objects.create(user=self.user, cartao=self.cartao, categoria=self.categoria, valor=Decimal('50.00'), data=date(2020, 12, 1), descricao="Fatura em aberto")
+        Despesa.objects.create(user=self.user, conta=self.conta, categoria=self.categoria, valor=Decimal('10.00'), data=date(2021, 1, 2), descricao="Padaria")
+
+    def test_arquivar_e_restaurar_mantem_saldos(self):
+        from core.services.arquivo import arquivar_ano, restaurar_ano
+        from core.services.extrato import extrato_conta
+        saldo_antes = self.conta.get_saldo_atual(usuarios=[self.user])
+
+        movidas = arquivar_ano(2020, familia_id=self.familia.id)
+        self.assertEqual(movidas, {'Despesa': 3, 'Receita': 3})
+        self.assertEqual(Despesa.objects.filter(data__year=2020).count(), 1)  # fatura não paga continua ativa
+        self.assertEqual(self.conta.get_saldo_atual(usuarios=[self.user]), saldo_antes)
+        linhas, _ = extrato_conta(self.conta, [self.user], date.today())
+        self.assertEqual(linhas[0]['saldo'], saldo_antes)
+
+        restaurar_ano(2020, familia_id=self.familia.id)
+        self.assertEqual(Despesa.objects.filter(data__year=2020).count(), 4)
+        self.assertFalse(ResumoMensalArquivado.objects.exists())
+        self.assertEqual(self.conta.get_saldo_atual(usuarios=[self.user]), saldo_antes)
+
+    @override_settings(SINCRONIZACAO_JANELA_SEGUNDOS=0)
+    def test_arquivar_e_restaurar_mudam_as_chaves_de_cache(self):
+        from core.services.arquivo import arquivar_ano, restaurar_ano
+        from core.services.cache import chave_familia
+        # Nenhuma das duas toca a versão em cache deste processo: as chaves mudam pelo
+        # registro de alterações no banco, que os workers também leem
+        chave = chave_familia(self.familia.id, 'projecao')
+        arquivar_ano(2020, familia_id=self.familia.id)
+        arquivada = chave_familia(self.familia.id, 'projecao')
+        self.assertNotEqual(arquivada, chave)
+        restaurar_ano(2020, familia_id=self.familia.id)
+        self.assertNotEqual(chave_familia(self.familia.id, 'projecao'), arquivada)
+
+    def test_nao_arquiva_ano_corrente(self):
+        from core.services.arquivo import arquivar_ano
+        with self.assertRaises(ValueError):
+            arquivar_ano(date.today().year)
+
+
+class SeriesTransacoesTest(TestCase):
+
+    def setUp(self):
+        import uuid
+        self.user = User.objects.create_user(username='usuarioserie', password='123')
+        self.familia = Familia.objects.create(nome="Família Série")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.categoria = Categoria.objects.create(familia=self.familia, nome="Assinaturas")
+        self.outra_categoria = Categoria.objects.create(familia=self.familia, nome="Lazer")
+        self.conta = Conta.objects.create(familia=self.familia, nome="Corrente")
+        self.id_rec = uuid.uuid4()
+        self.serie = [
+            Despesa.objects.create(user=self.user, conta=self.conta, categoria=self.categoria, valor=Decimal('39.90'), data=date(2025, mes, 10), descricao="Streaming", recorrente=True, id_recorrencia=self.id_rec)
+            for mes in range(1, 13)
+        ]
+        self.client.login(username='usuarioserie', password='123')
+
+    def test_editar_esta_e_as_proximas_em_um_update(self):
+        from core.services.series import ESCOPO_FUTURAS, atualizar_serie
+        sexta = self.serie[5]
+        with self.assertNumQueries(4):  # savepoint, registro para a sincronização (INSERT ... SELECT), UPDATE, release
+            alteradas = atualizar_serie(sexta, ESCOPO_FUTURAS, {'valor': Decimal('44.90'), 'categoria': self.outra_categoria}, dias=2)
+        self.assertEqual(alteradas, 7)
+        self.assertEqual(Despesa.objects.filter(id_recorrencia=self.id_rec, valor=Decimal('44.90')).count(), 7)
+        self.assertEqual(Despesa.objects.get(id=sexta.id).data, date(2025, 6, 12))
+        self.assertEqual(Despesa.objects.get(id=self.serie[4].id).data, date(2025, 5, 10))
+
+    def test_editar_pela_view_desloca_toda_a_serie(self):
+        terceira = self.serie[2]
+        response = self.client.post(reverse('editar_despesa', args=[terceira.id]), {
+            'descricao': 'Streaming Premium', 'valor': '39.90', 'data': '2025-03-15',
+            'categoria': self.categoria.id, 'conta': self.conta.id, 'escopo': 'serie',
+        })
+        self.assertRedirects(response, reverse('lista_despesas'))
+        datas = list(Despesa.objects.filter(id_recorrencia=self.id_rec).order_by('data').values_list('data', flat=True))
+        self.assertEqual(datas[0], date(2025, 1, 15))
+        self.assertEqual(Despesa.objects.filter(descricao='Streaming Premium').count(), 12)
+
+    def test_excluir_serie_inteira(self):
+        response = self.client.get(reverse('excluir_despesa', args=[self.serie[3].id]), {'escopo': 'serie'})
+        self.assertRedirects(response, reverse('lista_despesas'))
+        self.assertFalse(Despesa.objects.filter(id_recorrencia=self.id_rec).exists())
+
+
+class CompraParceladaTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='usuarioparcelas', password='123')
+        self.familia = Familia.objects.create(nome="Família Parcelas")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.categoria = Categoria.objects.create(familia=self.familia, nome="Eletrônicos")
+        self.cartao = CartaoDeCredito.objects.create(familia=self.familia, nome="Master", limite=10000, dia_fechamento=30, dia_vencimento=8)
+
+    def test_divisao_exata_em_centavos(self):
+        from core.services.parcelamento import dividir_valor
+        parcelas = dividir_valor(Decimal('100.00'), 3)
+        self.assertEqual(parcelas, [Decimal('33.34'), Decimal('33.33'), Decimal('33.33')])
+        self.assertEqual(sum(dividir_valor(Decimal('999.99'), 48)), Decimal('999.99'))
+
+    def test_48_parcelas_em_um_insert_e_uma_por_fatura(self):
+        from core.services.parcelamento import criar_compra_parcelada
+        with self.assertNumQueries(4):  # savepoint, INSERT das parcelas, INSERT do registro de alterações, release
+            parcelas = criar_compra_parcelada(
+                self.user, self.familia.id, "Notebook", Decimal('4800.00'), date(2025, 1, 31), 48,
+                self.categoria, cartao=self.cartao,
+            )
+        self.assertEqual(Despesa.objects.filter(id_compra_parcelada=parcelas[0].id_compra_parcelada).count(), 48)
+        # A compra de 31/01 fica após o fechamento de janeiro (dia 30): 1ª parcela na fatura de fevereiro
+        self.assertEqual(parcelas[0].data, date(2025, 1, 31))
+        self.assertEqual(parcelas[1].data, date(2025, 3, 1))  # fatura de fevereiro fecha em 28/02
+        for parcela in parcelas:
+            fatura = self.cartao.get_fatura_aberta(usuarios=[self.user], data_base=parcela.data)
+            self.assertEqual(list(fatura['despesas'].values_list('parcela_atual', flat=True)), [parcela.parcela_atual])
+
+    def test_post_com_parcelas_cria_a_compra(self):
+        self.client.login(username='usuarioparcelas', password='123')
+        self.client.post(reverse('lista_despesas'), {
+            'descricao': 'Geladeira', 'valor': '1000.00', 'data': '2025-05-10',
+            'categoria': self.categoria.id, 'cartao': self.cartao.id, 'numero_parcelas': 3,
+        })
+        self.assertEqual(
+            list(Despesa.objects.filter(descricao='Geladeira').order_by('parcela_atual').values_list('valor', flat=True)),
+            [Decimal('333.34'), Decimal('333.33'), Decimal('333.33')],
+        )
+
+
+class ResumoCartoesTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='usuarioresumo', password='123')
+        self.familia = Familia.objects.create(nome="Família Resumo")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.categoria = Categoria.objects.create(familia=self.familia, nome="Compras")
+        self.cartoes = [
+            CartaoDeCredito.objects.create(familia=self.familia, nome=f"Cartão {dia}", limite=5000, dia_fechamento=dia, dia_vencimento=10)
+            for dia in (1, 15, 28, 31)
+        ]
+
+    def test_totais_iguais_a_fatura_aberta_em_uma_consulta(self):
+        from core.services.faturas import resumo_cartoes
+        from core.services.parcelamento import criar_compra_parcelada
+        data_base = date(2025, 3, 20)
+        for cartao in self.cartoes:
+            for dia in (1, 10, 20, 28):
+                Despesa.objects.create(user=self.user, descricao="Compra", valor=Decimal('10.00'), data=date(2025, 3, dia), categoria=self.categoria, cartao=cartao)
+            Despesa.objects.create(user=self.user, descricao="Antiga", valor=Decimal('7.00'), data=date(2025, 2, 27), categoria=self.categoria, cartao=cartao)
+        criar_compra_parcelada(self.user, self.familia.id, "TV", Decimal('1200.00'), data_base, 12, self.categoria, cartao=self.cartoes[1])
+
+        with self.assertNumQueries(1):
+            resumo = resumo_cartoes(self.familia, [self.user], data_base=data_base)
+
+        self.assertEqual(len(resumo), 4)
+        for item in resumo:
+            fatura = item['cartao'].get_fatura_aberta(usuarios=[self.user], data_base=data_base)
+            self.assertEqual(item['total'], fatura['total'])
+            self.assertEqual(item['data_inicio'], fatura['data_inicio'])
+            self.assertEqual(item['data_fechamento'], fatura['data_fechamento'])
+
+        cartao_15 = next(item for item in resumo if item['cartao'].dia_fechamento == 15)
+        # Parcelas futuras também consomem o limite
+        self.assertEqual(cartao_15['comprometido'], Decimal('1247.00'))
+        self.assertEqual(cartao_15['disponivel'], Decimal('3753.00'))
+        self.assertEqual(cartao_15['data_vencimento'], date(2025, 5, 10))
+
+    def test_limite_disponivel_considera_a_familia_em_qualquer_visao(self):
+        from core.services.faturas import resumo_cartoes
+        outro = User.objects.create_user(username='outroresumo', password='123')
+        outro.perfil.familia = self.familia
+        outro.perfil.save()
+        cartao = self.cartoes[0]
+        Despesa.objects.create(user=self.user, descricao="Minha", valor=Decimal('100.00'), data=date(2025, 3, 5), categoria=self.categoria, cartao=cartao)
+        Despesa.objects.create(user=outro, descricao="Dele", valor=Decimal('400.00'), data=date(2025, 3, 6), categoria=self.categoria, cartao=cartao)
+
+        item = resumo_cartoes(self.familia, [self.user], data_base=date(2025, 3, 20))[0]
+        self.assertEqual(item['total'], Decimal('100.00'))  # a fatura segue a visão
+        self.assertEqual(item['disponivel'], Decimal('4500.00'))  # o limite é da família
+
+        # Uma família sem cartões vê a mensagem da lista vazia
+        outro.perfil.familia = Familia.objects.create(nome="Sem cartões")
+        outro.perfil.save()
+        self.client.login(username='outroresumo', password='123')
+        self.assertContains(self.client.get(reverse('lista_cartoes')), "Nenhum cartão cadastrado.")
+
+    def test_calendario_de_faturas_com_dia_31_e_fevereiro(self):
+        from core.services.faturas import calendario_faturas
+        from core.services.parcelamento import criar_compra_parcelada
+        cartao_31 = self.cartoes[3]
+        cartao_15 = self.cartoes[1]
+        Despesa.objects.create(user=self.user, descricao="Fim de fevereiro", valor=Decimal('10.00'), data=date(2025, 2, 28), categoria=self.categoria, cartao=cartao_31)
+        Despesa.objects.create(user=self.user, descricao="Início de março", valor=Decimal('20.00'), data=date(2025, 3, 1), categoria=self.categoria, cartao=cartao_31)
+        criar_compra_parcelada(self.user, self.familia.id, "Sofá", Decimal('1200.00'), date(2025, 2, 20), 12, self.categoria, cartao=cartao_15)
+
+        with self.assertNumQueries(1):
+            calendario = calendario_faturas(self.familia, [self.user], data_base=date(2025, 2, 10), cartoes=[cartao_15, cartao_31])
+
+        self.assertEqual(calendario['meses'][0], date(2025, 2, 1))
+        faturas_31 = calendario['linhas'][1]['faturas']
+        self.assertEqual(faturas_31[0]['data_fechamento'], date(2025, 2, 28))
+        self.assertEqual(faturas_31[0]['total'], Decimal('10.00'))
+        self.assertEqual(faturas_31[1]['total'], Decimal('20.00'))
+        # Compra de 20/02 no cartão que fecha dia 15: 1ª parcela na fatura de março, uma por mês
+        faturas_15 = calendario['linhas'][0]['faturas']
+        self.assertEqual([f['total'] for f in faturas_15], [Decimal('0.00')] + [Decimal('100.00')] * 11)
+        self.assertEqual(calendario['por_mes'][1]['total'], Decimal('120.00'))
+        self.assertEqual(calendario['total'], Decimal('1130.00'))
+
+
+class ProvisionamentoFamiliaTest(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        self.addCleanup(cache.clear)
+        cache.clear()
+
+    def test_nova_familia_em_poucos_inserts(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        Plano.objects.create(nome="Gratuito", preco_mensal=0)
+
+        with CaptureQueriesContext(connection) as consultas:
+            familia = Familia.objects.create(nome="Família Nova")
+        inserts = [q['sql'] for q in consultas.captured_queries if q['sql'].startswith('INSERT')]
+        # família, categorias principais, subcategorias, categorias de receita e assinatura
+        self.assertEqual(len(inserts), 5)
+        self.assertEqual(len([q for q in consultas.captured_queries if 'core_plano' in q['sql']]), 1)
+
+        self.assertEqual((familia.pacote_categorias, familia.versao_pacote), ('padrao', 1))
+        self.assertEqual(Categoria.objects.filter(familia=familia, categoria_mae__isnull=True).count(), 6)
+        self.assertEqual(Categoria.objects.filter(familia=familia, categoria_mae__isnull=False).count(), 20)
+        self.assertEqual(CategoriaReceita.objects.filter(familia=familia).count(), 5)
+        self.assertEqual(Categoria.objects.get(familia=familia, nome="Delivery").categoria_mae.nome, "Alimentação")
+        self.assertEqual(Categoria.objects.get(familia=familia, nome="Gasolina").macro_categoria, 'NC')
+        self.assertEqual(familia.assinatura.plano.nome, "Gratuito")
+
+        # O id do plano fica em cache: a próxima família não consulta a tabela de planos
+        with CaptureQueriesContext(connection) as consultas:
+            Familia.objects.create(nome="Família Seguinte")
+        self.assertFalse([q for q in consultas.captured_queries if 'core_plano' in q['sql']])
+        # Gravar um plano descarta o id em cache
+        Plano.objects.filter(nome="Gratuito").update(preco_mensal=10)
+        Plano.objects.create(nome="Básico", preco_mensal=0)
+        self.assertEqual(Familia.objects.create(nome="Família Básica").assinatura.plano.nome, "Básico")
+
+    def test_pacote_alternativo(self):
+        familia = Familia.objects.create(nome="Família Autônoma", pacote_categorias='autonomo')
+        self.assertTrue(Categoria.objects.filter(familia=familia, nome="Impostos", categoria_mae__nome="Trabalho").exists())
+        self.assertTrue(CategoriaReceita.objects.filter(familia=familia, nome="Serviços Prestados").exists())
+        with self.assertRaises(ValueError):
+            Familia.objects.create(nome="Inválida", pacote_categorias='inexistente')
+
+
+class OrcamentoHistoricoTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='usuarioorcamento', password='123')
+        self.familia = Familia.objects.create(nome="Família Orçamento")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.moradia = Categoria.objects.create(familia=self.familia, nome="Casa", orcamento_mensal=Decimal('1000.00'))
+        self.luz = Categoria.objects.create(familia=self.familia, nome="Luz", categoria_mae=self.moradia)
+        self.lazer = Categoria.objects.create(familia=self.familia, nome="Diversão", orcamento_mensal=Decimal('100.00'), acumular_sobra=True)
+
+    def _despesa(self, categoria, valor, data):
+        Despesa.objects.create(user=self.user, descricao="Gasto", valor=Decimal(valor), data=data, categoria=categoria)
+
+    def test_historico_subcategorias_e_sobra_em_consultas_constantes(self):
+        from core.models import HistoricoOrcamento
+        from core.services.opcoes import opcoes_familia
+        from core.services.orcamento import orcamento_por_mes
+        HistoricoOrcamento.objects.create(categoria=self.moradia, mes=date(2024, 1, 1), valor=Decimal('500.00'))
+        HistoricoOrcamento.objects.create(categoria=self.moradia, mes=date(2025, 4, 1), valor=Decimal('800.00'))
+        self._despesa(self.moradia, '200.00', date(2025, 2, 5))
+        self._despesa(self.luz, '150.00', date(2025, 2, 20))
+        self._despesa(self.lazer, '60.00', date(2024, 12, 10))
+        self._despesa(self.lazer, '60.00', date(2025, 1, 10))
+        self._despesa(self.lazer, '30.00', date(2025, 2, 10))
+        opcoes_familia(self.familia.id)
+
+        with self.assertNumQueries(3):
+            orcamento = orcamento_por_mes(self.familia, [self.user], inicio=date(2024, 12, 1), meses=12)
+
+        casa, diversao = orcamento['linhas'][0]['meses'], orcamento['linhas'][1]['meses']
+        self.assertEqual([c.nome for c in orcamento['categorias']], ["Casa", "Diversão"])
+        # Fevereiro usa o orçamento da época e soma a subcategoria na categoria principal
+        self.assertEqual((casa[2]['orcado'], casa[2]['gasto']), (Decimal('500.00'), Decimal('350.00')))
+        self.assertEqual(casa[5]['orcado'], Decimal('800.00'))
+        # A sobra de dezembro não passa para janeiro; a de janeiro (40) passa para fevereiro
+        self.assertEqual(diversao[1]['disponivel'], Decimal('100.00'))
+        self.assertEqual(diversao[2]['disponivel'], Decimal('140.00'))
+        self.assertEqual(diversao[3]['disponivel'], Decimal('210.00'))
+        self.assertEqual(orcamento['totais'][2]['gasto'], Decimal('380.00'))
+
+        # O mesmo mês pedido isoladamente dá o mesmo resultado
+        fevereiro = orcamento_por_mes(self.familia, [self.user], inicio=date(2025, 2, 1))
+        self.assertEqual(fevereiro['linhas'][1]['meses'][0]['disponivel'], Decimal('140.00'))
+
+    def test_alterar_orcamento_registra_historico_e_paginas_renderizam(self):
+        self.moradia.orcamento_mensal = Decimal('1200.00')
+        self.moradia.save()
+        self.moradia.save()
+        self.assertEqual(
+            list(self.moradia.historico_orcamento.values_list('valor', flat=True)), [Decimal('1200.00')]
+        )
+        self.client.login(username='usuarioorcamento', password='123')
+        self.assertContains(self.client.get(reverse('orcamento_mensal') + '?mes=2025-02'), "Diversão")
+        self.assertContains(self.client.get(reverse('orcamento_historico')), "Diversão")
+
+    @override_settings(SINCRONIZACAO_JANELA_SEGUNDOS=0)
+    def test_50_30_20_por_mes_em_uma_consulta_e_em_cache(self):
+        from core.services.orcamento import divisao_50_30_20
+        categoria_receita = CategoriaReceita.objects.create(familia=self.familia, nome="Salário")
+        conta = Conta.objects.create(familia=self.familia, nome="Conta Corrente", saldo_inicial=0)
+        self.moradia.macro_categoria = Categoria.MacroCategoria.NECESSIDADE
+        self.moradia.save()
+        self.lazer.macro_categoria = Categoria.MacroCategoria.DESEJO
+        self.lazer.save()
+        for mes in (1, 2):
+            Receita.objects.create(user=self.user, descricao="Salário", valor=Decimal('1000.00'), data=date(2025, mes, 5), categoria=categoria_receita, conta=conta)
+        self._despesa(self.moradia, '300.00', date(2025, 1, 10))
+        self._despesa(self.luz, '100.00', date(2025, 1, 15))  # 'NC': herda 'NE' de Casa
+        self._despesa(self.lazer, '350.00', date(2025, 2, 10))
+        ResumoMensalArquivado.objects.create(user=self.user, tipo='D', mes=date(2025, 2, 1), categoria=self.luz, total=Decimal('50.00'), quantidade=1)
+
+        with self.assertNumQueries(2):  # marcador de alterações da família e a consulta agrupada
+            historico = divisao_50_30_20(self.familia, [self.user], inicio=date(2024, 12, 1), meses=3)
+        self.assertEqual([m['receita'] for m in historico], [Decimal('0.00'), Decimal('1000.00'), Decimal('1000.00')])
+        janeiro, fevereiro = historico[1]['macros'], historico[2]['macros']
+        self.assertEqual(janeiro[0]['gasto_real'], Decimal('400.00'))
+        self.assertEqual(janeiro[0]['alvo_valor'], Decimal('500.00'))
+        self.assertEqual(fevereiro[0]['gasto_real'], Decimal('50.00'))
+        self.assertEqual(fevereiro[1]['restante'], Decimal('-50.00'))
+        self.assertEqual(fevereiro[1]['percentual_receita'], 35.0)
+
+        with self.assertNumQueries(1):  # só o marcador
+            divisao_50_30_20(self.familia, [self.user], inicio=date(2024, 12, 1), meses=3)
+        # Uma escrita que não invalidou o cache deste processo (atendida por outro
+        # worker) também aparece: a chave leva a última alteração registrada no banco
+        with patch('core.signals.invalidar_familia'):
+            self._despesa(self.lazer, '10.00', date(2025, 2, 11))
+        self.assertEqual(divisao_50_30_20(self.familia, [self.user], inicio=date(2024, 12, 1), meses=3)[2]['macros'][1]['gasto_real'], Decimal('360.00'))
+
+        self.client.login(username='usuarioorcamento', password='123')
+        self.assertContains(self.client.get(reverse('orcamento_50_30_20')), "Últimos 12 Meses")
+
+
+class SerieFluxoCaixaTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='usuariofluxo', password='123')
+        self.familia = Familia.objects.create(nome="Família Fluxo")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.conta = Conta.objects.create(familia=self.familia, nome="Corrente", saldo_inicial=0)
+        cartao = CartaoDeCredito.objects.create(familia=self.familia, nome="Visa", limite=1000, dia_fechamento=5, dia_vencimento=12)
+        categoria = Categoria.objects.create(familia=self.familia, nome="Geral")
+        categoria_receita = CategoriaReceita.objects.create(familia=self.familia, nome="Salário")
+        Receita.objects.create(user=self.user, descricao="Salário", valor=Decimal('1000.00'), data=date(2025, 1, 6), categoria=categoria_receita, conta=self.conta)
+        Despesa.objects.create(user=self.user, descricao="Mercado", valor=Decimal('200.00'), data=date(2025, 1, 8), categoria=categoria, conta=self.conta)
+        Despesa.objects.create(user=self.user, descricao="Cartão", valor=Decimal('999.00'), data=date(2025, 1, 8), categoria=categoria, cartao=cartao)
+        Despesa.objects.create(user=self.user, descricao="Aluguel", valor=Decimal('300.00'), data=date(2025, 3, 10), categoria=categoria, conta=self.conta)
+        ResumoMensalArquivado.objects.create(user=self.user, tipo='R', mes=date(2024, 12, 1), conta=self.conta, total=Decimal('50.00'), quantidade=1)
+
+    def test_series_alinhadas_e_preenchidas_com_zero(self):
+        import json
+        from core.services.fluxo import serie_fluxo_caixa, serie_para_chartjs
+        with self.assertNumQueries(1):
+            mensal = serie_fluxo_caixa([self.user], date(2024, 12, 1), date(2025, 3, 31), 'mensal')
+        self.assertEqual(mensal['periodos'], [date(2024, 12, 1), date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1)])
+        self.assertEqual(mensal['receitas'].tolist(), [5000, 100000, 0, 0])
+        self.assertEqual(mensal['despesas'].tolist(), [0, 20000, 0, 30000])
+        self.assertEqual(mensal['saldo'].tolist(), [5000, 80000, 0, -30000])
+
+        semanal = serie_fluxo_caixa([self.user], date(2025, 1, 1), date(2025, 1, 31), 'semanal')
+        self.assertEqual(semanal['periodos'][0], date(2024, 12, 30))  # segunda-feira
+        self.assertEqual(semanal['receitas'].tolist(), [0, 100000, 0, 0, 0])
+        self.assertEqual(semanal['despesas'].tolist(), [0, 20000, 0, 0, 0])
+
+        diario = serie_fluxo_caixa([self.user], date(2025, 1, 5), date(2025, 1, 9), 'diario')
+        self.assertEqual(diario['saldo'].tolist(), [0, 100000, 0, -20000, 0])
+
+        anual = serie_fluxo_caixa([self.user], date(2024, 12, 1), date(2025, 12, 31), 'anual')
+        self.assertEqual(anual['saldo'].tolist(), [5000, 50000])
+
+        dados = serie_para_chartjs(mensal)
+        self.assertNotIn(', ', dados)
+        self.assertEqual(json.loads(dados)['saldo'], [50.0, 800.0, 0.0, -300.0])
+
+    def test_pagina_de_analise(self):
+        import json
+        self.client.login(username='usuariofluxo', password='123')
+        filtros = '?data_inicio=2025-01-01&data_fim=2025-03-31&agrupamento=semanal'
+        resposta = self.client.get(reverse('analise_gastos') + filtros)
+        self.assertEqual(resposta.status_code, 200)
+        # A página só traz os filtros; os dados vêm do endpoint JSON
+        self.assertIn('agrupamento=semanal', resposta.context['query_graficos'])
+        resposta = self.client.get(reverse('api_grafico_fluxo_caixa') + filtros)
+        self.assertEqual(len(json.loads(resposta.content)['labels']), 14)
+
+    @override_settings(SINCRONIZACAO_JANELA_SEGUNDOS=0)
+    def test_etag_dos_graficos(self):
+        import json
+        self.client.login(username='usuariofluxo', password='123')
+        url = reverse('api_grafico_gastos_categoria') + '?data_inicio=2025-01-01&data_fim=2025-03-31'
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(json.loads(resposta.content), {'labels': ['Geral'], 'data': [1499.0]})
+        etag = resposta['ETag']
+
+        # Mesmos dados: 304 sem consultar os lançamentos
+        with self.assertNumQueries(5):  # sessão, usuário, perfil, última alteração da família e membros
+            resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+
+        # Outros filtros geram outro ETag
+        self.assertNotEqual(self.client.get(url + '&visao=conjunto')['ETag'], etag)
+
+        # Um novo lançamento muda o ETag mesmo sem invalidar o cache deste processo
+        # (como quando a escrita foi atendida por outro worker)
+        with patch('core.signals.invalidar_familia'):
+            Despesa.objects.create(user=self.user, descricao="Farmácia", valor=Decimal('1.00'), data=date(2025, 2, 1), categoria=Categoria.objects.get(nome="Geral", familia=self.familia), conta=self.conta)
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+        self.assertEqual(json.loads(resposta.content)['data'], [1500.0])
+
+    def test_lttb_preserva_picos_e_limita_os_pontos(self):
+        import json
+        import numpy as np
+        from core.services.amostragem import limite_pontos, lttb
+        valores = np.sin(np.arange(3000) / 50)
+        valores[1234] = 40
+        indices = lttb(valores, 100)
+        self.assertEqual(len(indices), 100)
+        self.assertIn(1234, indices)
+        self.assertEqual((indices[0], indices[-1]), (0, 2999))
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertEqual(lttb(valores[:50], 100).tolist(), list(range(50)))
+        self.assertEqual((limite_pontos('abc'), limite_pontos('5'), limite_pontos('999999')), (400, 20, 2000))
+
+        self.client.login(username='usuariofluxo', password='123')
+        resposta = self.client.get(reverse('api_grafico_fluxo_caixa') + '?data_inicio=2022-01-01&data_fim=2025-12-31&agrupamento=diario&pontos=60')
+        fluxo = json.loads(resposta.content)
+        self.assertLessEqual(len(fluxo['labels']), 60)
+        self.assertEqual(len(fluxo['labels']), len(fluxo['saldo']))
+        # Os dias com movimento (picos) continuam na série reduzida
+        self.assertIn('06/01/2025', fluxo['labels'])
+        self.assertIn('10/03/2025', fluxo['labels'])
+
+
+class OpcoesFormulariosTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='usuarioopcoes', password='123')
+        # A criação da família gera as categorias padrão (com subcategorias)
+        self.familia = Familia.objects.create(nome="Família Opções")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.conta = Conta.objects.create(familia=self.familia, nome="Corrente")
+
+    def test_render_e_validacao_sem_consultas_depois_do_cache(self):
+        from core.forms import DespesaForm
+        from core.services.opcoes import opcoes_familia
+        opcoes_familia(self.familia.id)
+        farmacia = Categoria.objects.get(familia=self.familia, nome="Farmácia")
+
+        with self.assertNumQueries(0):
+            html = str(DespesaForm(user=self.user)['categoria'])
+        form = DespesaForm({
+            'descricao': 'Remédio', 'valor': '25.00', 'data': '2025-03-01',
+            'categoria': farmacia.id, 'conta': self.conta.id, 'numero_parcelas': 1,
+        }, user=self.user)
+        with self.assertNumQueries(2):  # a validação do modelo confirma a categoria e a conta
+            self.assertTrue(form.is_valid(), form.errors)
+        self.assertIn("Saúde -&gt; Farmácia", html)
+        self.assertEqual(form.cleaned_data['categoria'].id, farmacia.id)
+
+    def test_lista_desatualizada_de_outro_worker(self):
+        from core.forms import DespesaForm, DespesaLoteFormSet
+        from core.services.opcoes import opcoes_familia
+        antiga = Categoria.objects.create(familia=self.familia, nome="Revistas")
+        opcoes_familia(self.familia.id)
+        # Sem invalidar o cache deste processo, como se outro worker atendesse as escritas
+        with patch('core.signals.invalidar_familia'):
+            nova = Categoria.objects.create(familia=self.familia, nome="Pets")
+            Categoria.objects.filter(pk=antiga.pk).delete()
+        categorias = opcoes_familia(self.familia.id)['categorias']
+        self.assertIn(antiga, categorias)
+        self.assertNotIn(nova, categorias)
+
+        def dados(categoria):
+            return {'descricao': 'Ração', 'valor': '80.00', 'data': '2025-03-01', 'categoria': categoria.id, 'conta': self.conta.id, 'numero_parcelas': 1}
+
+        # A opção nova, fora da lista, é encontrada no banco
+        form = DespesaForm(dados(nova), user=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+        # A excluída, ainda na lista, vira erro do formulário em vez de IntegrityError
+        form = DespesaForm(dados(antiga), user=self.user)
+        self.assertFalse(form.is_valid())
+        self.assertIn('categoria', form.errors)
+
+        linhas = {'form-TOTAL_FORMS': 2, 'form-INITIAL_FORMS': 0}
+        for indice, categoria in enumerate([nova, antiga]):
+            linhas.update({f'form-{indice}-{campo}': valor for campo, valor in dados(categoria).items() if campo != 'numero_parcelas'})
+        formset = DespesaLoteFormSet(linhas, user=self.user)
+        self.assertFalse(formset.is_valid())
+        self.assertEqual([bool(erros) for erros in formset.errors], [False, True])
+
+    def test_opcoes_de_outra_familia_sao_rejeitadas_e_cache_invalidado(self):
+        from core.forms import DespesaForm
+        outra_familia = Familia.objects.create(nome="Outra")
+        intrusa = Categoria.objects.filter(familia=outra_familia).first()
+        form = DespesaForm({
+            'descricao': 'X', 'valor': '1.00', 'data': '2025-03-01', 'categoria': intrusa.id, 'numero_parcelas': 1,
+        }, user=self.user)
+        self.assertFalse(form.is_valid())
+        self.assertIn('categoria', form.errors)
+
+        Categoria.objects.create(familia=self.familia, nome="Pets")
+        self.assertIn("Pets", str(DespesaForm(user=self.user)['categoria']))
+
+
+@override_settings(CACHE_RENOVAR_EM_SEGUNDO_PLANO=False)
+class ObterOuCalcularTest(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        self.addCleanup(cache.clear)
+        self.chamadas = 0
+
+    def calcular(self):
+        self.chamadas += 1
+        return self.chamadas
+
+    def test_acertos_falhas_e_ttl_suave(self):
+        from core.services.cache import contadores_cache, obter_ou_calcular
+        self.assertEqual(obter_ou_calcular('teste:a', self.calcular, nome='teste_a'), 1)
+        self.assertEqual(obter_ou_calcular('teste:a', self.calcular, nome='teste_a'), 1)
+        self.assertEqual(contadores_cache(['teste_a'])['teste_a'], {'acertos': 1, 'falhas': 1, 'vencidos': 0, 'esperas': 0})
+
+        # Vencido pelo prazo suave: serve o valor antigo e renova uma vez
+        obter_ou_calcular('teste:b', self.calcular, ttl_suave=0, nome='teste_b')
+        self.assertEqual(obter_ou_calcular('teste:b', self.calcular, ttl_suave=0, nome='teste_b'), 2)
+        self.assertEqual(obter_ou_calcular('teste:b', self.calcular, ttl_suave=0, nome='teste_b'), 3)
+        self.assertEqual(contadores_cache(['teste_b'])['teste_b']['vencidos'], 2)
+
+    def test_espera_o_calculo_de_outro_worker(self):
+        import threading
+        from django.core.cache import cache
+        from core.services.cache import contadores_cache, obter_ou_calcular
+        # Outro worker está com a trava e grava o valor logo depois
+        cache.add('teste:c:trava', 1)
+        threading.Timer(0.1, lambda: cache.set('teste:c', ('do outro', None))).start()
+        self.assertEqual(obter_ou_calcular('teste:c', self.calcular, nome='teste_c'), 'do outro')
+        self.assertEqual(self.chamadas, 0)
+        self.assertEqual(contadores_cache(['teste_c'])['teste_c']['esperas'], 1)
+
+        # Se o outro worker não termina a tempo, calcula aqui mesmo
+        cache.add('teste:d:trava', 1)
+        with patch('core.services.cache.ESPERA_MAXIMA', 0.1):
+            self.assertEqual(obter_ou_calcular('teste:d', self.calcular, nome='teste_d'), 1)
+
+
+@override_settings(SINCRONIZACAO_JANELA_SEGUNDOS=0)
+class SincronizacaoTest(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='usuariosync', password='123')
+        self.familia = Familia.objects.create(nome="Família Sync")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.conta = Conta.objects.create(familia=self.familia, nome="Corrente")
+        self.categoria = Categoria.objects.create(familia=self.familia, nome="Geral")
+        self.mercado = Despesa.objects.create(user=self.user, descricao="Mercado", valor=Decimal('50.00'), data=date(2025, 1, 8), categoria=self.categoria, conta=self.conta)
+        resposta = self.client.post(reverse('api_sync_token'), {'username': 'usuariosync', 'password': '123'})
+        self.assertEqual(resposta.status_code, 201)
+        self.cabecalho = {'HTTP_AUTHORIZATION': f"Token {resposta.json()['token']}"}
+
+    def sincronizar(self, cursor=0, **extra):
+        import json
+        resposta = self.client.get(reverse('api_sync'), {'cursor': cursor, **extra}, **self.cabecalho)
+        self.assertEqual(resposta.status_code, 200)
+        linhas = [json.loads(linha) for linha in b''.join(resposta.streaming_content).decode().splitlines()]
+        return linhas[:-1], linhas[-1]
+
+    def test_token_obrigatorio(self):
+        self.assertEqual(self.client.get(reverse('api_sync')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('api_sync'), HTTP_AUTHORIZATION='Token errado').status_code, 401)
+        resposta = self.client.post(reverse('api_sync_token'), {'username': 'usuariosync', 'password': 'x'})
+        self.assertEqual(resposta.status_code, 401)
+
+    def test_primeira_sincronizacao_e_depois_so_as_alteracoes(self):
+        registros, fim = self.sincronizar()
+        modelos = {(r['modelo'], r['id']) for r in registros}
+        self.assertIn(('despesa', self.mercado.id), modelos)
+        self.assertIn(('conta', self.conta.id), modelos)
+        self.assertFalse(fim['mais'])
+
+        # Nada mudou: só a linha final, com o mesmo cursor
+        self.assertEqual(self.sincronizar(fim['cursor']), ([], fim))
+
+        farmacia = Despesa.objects.create(user=self.user, descricao="Farmácia", valor=Decimal('10.00'), data=date(2025, 1, 9), categoria=self.categoria, conta=self.conta)
+        farmacia.valor = Decimal('12.00')
+        farmacia.save()
+        mercado_id = self.mercado.id
+        self.mercado.delete()
+        registros, novo_fim = self.sincronizar(fim['cursor'])
+        # Cada registro aparece uma vez, com a alteração mais recente
+        self.assertEqual([(r['modelo'], r['id'], r['excluido']) for r in registros], [
+            ('despesa', farmacia.id, False), ('despesa', mercado_id, True),
+        ])
+        self.assertEqual(registros[0]['dados']['valor'], '12.00')
+        self.assertGreater(novo_fim['cursor'], fim['cursor'])
+
+    def test_operacoes_em_massa_paginas_e_gzip(self):
+        from core.services.parcelamento import criar_compra_parcelada
+        from core.services.series import ESCOPO_SERIE, excluir_serie
+        _, fim = self.sincronizar()
+        parcelas = criar_compra_parcelada(self.user, self.familia.id, "TV", Decimal('300.00'), date(2025, 2, 1), 3, self.categoria, conta=self.conta)
+        registros, pagina = self.sincronizar(fim['cursor'], limite=2)
+        self.assertEqual(len(registros), 2)
+        self.assertTrue(pagina['mais'])
+        registros, pagina = self.sincronizar(pagina['cursor'], limite=2)
+        self.assertEqual([r['id'] for r in registros], [parcelas[2].id])
+        self.assertFalse(pagina['mais'])
+
+        excluir_serie(parcelas[0], ESCOPO_SERIE)
+        registros, _ = self.sincronizar(pagina['cursor'])
+        self.assertEqual({(r['id'], r['excluido']) for r in registros}, {(p.id, True) for p in parcelas})
+
+        resposta = self.client.get(reverse('api_sync'), HTTP_ACCEPT_ENCODING='gzip', **self.cabecalho)
+        self.assertEqual(resposta['Content-Encoding'], 'gzip')
+
+    @override_settings(SINCRONIZACAO_JANELA_SEGUNDOS=30)
+    def test_cursor_nao_passa_de_alteracao_recente(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from core.models import AlteracaoSincronizacao
+        AlteracaoSincronizacao.objects.update(momento=timezone.now() - timedelta(hours=1))
+        _, fim = self.sincronizar()
+
+        # Duas despesas gravadas em transações concorrentes; a do id menor é confirmada
+        # por último (aqui, a linha dela só é inserida depois)
+        novas = [
+            Despesa.objects.create(user=self.user, descricao=descricao, valor=Decimal('5.00'), data=date(2025, 1, 10), categoria=self.categoria, conta=self.conta)
+            for descricao in ("Padaria", "Banca")
+        ]
+        primeira, segunda = AlteracaoSincronizacao.objects.filter(id__gt=fim['cursor']).order_by('id')
+        AlteracaoSincronizacao.objects.filter(id=primeira.id).delete()
+
+        # A alteração visível ainda está na janela: o cursor não passa dela, nem na
+        # primeira sincronização
+        self.assertEqual(self.sincronizar(fim['cursor']), ([], fim))
+        self.assertEqual(self.sincronizar()[1]['cursor'], fim['cursor'])
+
+        primeira.save(force_insert=True)
+        AlteracaoSincronizacao.objects.update(momento=timezone.now() - timedelta(hours=1))
+        registros, novo_fim = self.sincronizar(fim['cursor'])
+        self.assertEqual([r['id'] for r in registros], [despesa.id for despesa in novas])
+        self.assertEqual(novo_fim['cursor'], segunda.id)
+
+    def test_familia_resolvida_uma_vez_por_gravacao(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as consultas:
+            Despesa.objects.create(user=self.user, descricao="Feira", valor=Decimal('20.00'), data=date(2025, 1, 11), categoria=self.categoria, conta=self.conta)
+        self.assertEqual(sum('core_perfil' in consulta['sql'] for consulta in consultas.captured_queries), 1)
+
+    def test_token_expira_sem_uso(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from core.models import TokenSincronizacao
+        self.assertEqual(self.client.get(reverse('api_sync'), **self.cabecalho).status_code, 200)
+        TokenSincronizacao.objects.filter(user=self.user).update(ultimo_uso=timezone.now() - timedelta(days=91))
+        self.assertEqual(self.client.get(reverse('api_sync'), **self.cabecalho).status_code, 401)
+        self.assertFalse(TokenSincronizacao.objects.filter(user=self.user).exists())
+
+    @override_settings(SINCRONIZACAO_TENTATIVAS_TOKEN=3)
+    def test_limite_de_pedidos_de_token(self):
+        # O setUp já fez um pedido; este IP e este usuário têm mais dois
+        for senha, status in (('x', 401), ('123', 201), ('123', 429)):
+            resposta = self.client.post(reverse('api_sync_token'), {'username': 'usuariosync', 'password': senha})
+            self.assertEqual(resposta.status_code, status)
+        self.assertIn('Retry-After', resposta)
+        # O limite por usuário vale também de outro IP
+        resposta = self.client.post(reverse('api_sync_token'), {'username': 'usuariosync', 'password': '123'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(resposta.status_code, 429)
+
+
+class LancamentoEmLoteTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='usuariolote', password='123')
+        self.familia = Familia.objects.create(nome="Família Lote")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.conta = Conta.objects.create(familia=self.familia, nome="Corrente")
+        self.categoria = Categoria.objects.get(familia=self.familia, nome="Farmácia")
+        self.client.login(username='usuariolote', password='123')
+
+    def dados(self, linhas):
+        dados = {'form-TOTAL_FORMS': len(linhas), 'form-INITIAL_FORMS': 0}
+        for indice, linha in enumerate(linhas):
+            dados.update({f'form-{indice}-{campo}': valor for campo, valor in linha.items()})
+        return dados
+
+    def linha(self, numero):
+        return {'descricao': f'Recibo {numero}', 'valor': '10.00', 'data': '2025-03-01', 'categoria': self.categoria.id, 'conta': self.conta.id}
+
+    def test_linhas_em_um_insert(self):
+        from core.forms import DespesaLoteFormSet
+        from core.services.lote import criar_despesas_em_lote
+        from core.services.opcoes import opcoes_familia
+        opcoes_familia(self.familia.id)
+        # 60 linhas cabem em um INSERT mesmo no limite de parâmetros do SQLite
+        dados = self.dados([self.linha(i) for i in range(60)] + [{}])  # a última linha fica em branco
+        with self.assertNumQueries(2):  # a existência das categorias e das contas, para todas as linhas
+            formset = DespesaLoteFormSet(dados, user=self.user)
+            self.assertTrue(formset.is_valid(), formset.errors)
+        linhas = [form.cleaned_data for form in formset if form.has_changed()]
+        with self.assertNumQueries(4):  # savepoint, INSERT das despesas, INSERT do registro de alterações, release
+            criar_despesas_em_lote(self.user, self.familia.id, linhas)
+        self.assertEqual(Despesa.objects.filter(user=self.user, descricao__startswith='Recibo').count(), 60)
+
+    def test_erros_por_linha_e_nada_gravado(self):
+        outra_familia = Familia.objects.create(nome="Outra")
+        intrusa = Categoria.objects.filter(familia=outra_familia).first()
+        linhas = [self.linha(1), {**self.linha(2), 'categoria': intrusa.id}, {**self.linha(3), 'valor': ''}]
+        resposta = self.client.post(reverse('lancar_despesas_em_lote'), self.dados(linhas), HTTP_ACCEPT='application/json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(set(resposta.json()['erros']), {'1', '2'})
+        self.assertIn('categoria', resposta.json()['erros']['1'])
+        self.assertFalse(Despesa.objects.filter(descricao__startswith='Recibo').exists())
+
+        resposta = self.client.post(reverse('lancar_despesas_em_lote'), self.dados([self.linha(1), self.linha(2)]))
+        self.assertRedirects(resposta, reverse('lista_despesas'))
+        self.assertEqual(Despesa.objects.filter(descricao__startswith='Recibo').count(), 2)
+        self.assertEqual(self.client.get(reverse('lancar_despesas_em_lote')).status_code, 200)
+
+
+@override_settings(EXCLUSOES_EM_SEGUNDO_PLANO=False)
+class ExclusaoEmLotesTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='usuarioexclusao', password='123')
+        self.familia = Familia.objects.create(nome="Família Exclusão")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.conta = Conta.objects.create(familia=self.familia, nome="Corrente")
+        self.categoria = Categoria.objects.get(familia=self.familia, nome="Farmácia")
+        Despesa.objects.bulk_create([
+            Despesa(user=self.user, descricao=f'Gasto {i}', valor=Decimal('5.00'), data=date(2024, 1, 1), categoria=self.categoria, conta=self.conta)
+            for i in range(25)
+        ])
+        self.client.login(username='usuarioexclusao', password='123')
+
+    def test_exclui_familia_em_lotes_apesar_do_protect(self):
+        from core.models import TarefaExclusao
+        from core.services.exclusao import agendar_exclusao
+        with patch('core.services.exclusao.LOTE_EXCLUSAO', 10):
+            tarefa, criada = agendar_exclusao(TarefaExclusao.Alvo.FAMILIA, self.familia)
+        self.assertTrue(criada)
+        tarefa.refresh_from_db()
+        self.assertEqual(tarefa.status, TarefaExclusao.Status.CONCLUIDA)
+        self.assertEqual(tarefa.progresso_percentual, 100)
+        self.assertEqual(tarefa.removidos, tarefa.total)
+        self.assertFalse(Familia.objects.filter(id=self.familia.id).exists())
+        self.assertFalse(Despesa.objects.filter(user=self.user).exists())
+        self.assertFalse(Categoria.objects.filter(familia_id=self.familia.id).exists())
+        self.user.perfil.refresh_from_db()
+        self.assertIsNone(self.user.perfil.familia_id)
+
+    def test_exclui_investimento_pela_view(self):
+        from core.models import AlteracaoSincronizacao, AporteInvestimento, Investimento, TarefaExclusao
+        investimento = Investimento.objects.create(familia=self.familia, nome="Tesouro", tipo='RF', taxa_rendimento_anual=Decimal('10'))
+        AporteInvestimento.objects.bulk_create([
+            AporteInvestimento(user=self.user, investimento=investimento, conta_origem=self.conta, data=date(2024, 1, 1), valor=Decimal('100'))
+            for _ in range(15)
+        ])
+        resposta = self.client.get(reverse('excluir_investimento', args=[investimento.id]))
+        self.assertRedirects(resposta, reverse('lista_investimentos'))
+        self.assertFalse(Investimento.objects.filter(id=investimento.id).exists())
+        self.assertFalse(AporteInvestimento.objects.filter(investimento_id=investimento.id).exists())
+        self.assertTrue(AlteracaoSincronizacao.objects.filter(modelo='investimento', objeto_id=investimento.id, excluido=True).exists())
+
+        tarefa = TarefaExclusao.objects.get(alvo=TarefaExclusao.Alvo.INVESTIMENTO, objeto_id=investimento.id)
+        status = self.client.get(reverse('status_exclusao', args=[tarefa.id])).json()
+        self.assertEqual((status['status'], status['removidos'], status['progresso']), ('concluida', 15, 100))
+
+    @override_settings(EXCLUSOES_EM_SEGUNDO_PLANO=True)
+    def test_investimento_em_exclusao_some_e_nao_ganha_segunda_tarefa(self):
+        from core.models import Investimento, TarefaExclusao
+        investimento = Investimento.objects.create(familia=self.familia, nome="Tesouro", tipo='RF', taxa_rendimento_anual=Decimal('10'))
+        # Em segundo plano a tarefa só começa após o commit, que o TestCase não faz
+        for _ in range(2):
+            self.client.get(reverse('excluir_investimento', args=[investimento.id]))
+        self.assertEqual(TarefaExclusao.objects.filter(objeto_id=investimento.id).count(), 1)
+        self.assertTrue(Investimento.objects.filter(id=investimento.id).exists())
+        self.assertQuerySetEqual(self.client.get(reverse('lista_investimentos')).context['investimentos'], [])
+        self.assertEqual(self.client.get(reverse('detalhe_investimento', args=[investimento.id])).status_code, 404)
+
+    def test_admin_exclui_usuario_e_familia_em_lotes(self):
+        from core.models import TarefaExclusao
+        User.objects.create_superuser(username='adminexclusao', password='123')
+        self.client.login(username='adminexclusao', password='123')
+        # Sem percorrer as despesas, categorias e contas da família
+        with self.assertNumQueries(3):
+            confirmacao = self.client.get(reverse('admin:core_familia_delete', args=[self.familia.id]))
+        self.assertEqual(confirmacao.status_code, 200)
+
+        resposta = self.client.post(reverse('admin:core_familia_delete', args=[self.familia.id]), {'post': 'yes'})
+        self.assertRedirects(resposta, reverse('admin:core_familia_changelist'))
+        self.assertFalse(Familia.objects.filter(id=self.familia.id).exists())
+        self.client.post(reverse('admin:auth_user_changelist'), {
+            'action': 'delete_selected', 'post': 'yes', '_selected_action': [self.user.id],
+        })
+        self.assertFalse(User.objects.filter(id=self.user.id).exists())
+        self.assertEqual(
+            set(TarefaExclusao.objects.values_list('alvo', 'status')),
+            {(TarefaExclusao.Alvo.FAMILIA, 'concluida'), (TarefaExclusao.Alvo.USUARIO, 'concluida')},
+        )
+
+
+class MesclagemTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='usuariomescla', password='123')
+        self.familia = Familia.objects.create(nome="Família Mescla")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.conta = Conta.objects.create(familia=self.familia, nome="Corrente")
+        self.origem = Categoria.objects.create(familia=self.familia, nome="Mercado", orcamento_mensal=Decimal('300'))
+        self.destino = Categoria.objects.create(familia=self.familia, nome="Alimentação", orcamento_mensal=Decimal('200'))
+        self.sub = Categoria.objects.create(familia=self.familia, nome="Feira", categoria_mae=self.origem)
+        Despesa.objects.bulk_create([
+            Despesa(user=self.user, descricao=f'Compra {i}', valor=Decimal('10.00'), data=date(2024, 5, 1),
+                    categoria=self.origem if i % 2 else self.destino, conta=self.conta)
+            for i in range(10)
+        ])
+        for categoria in (self.origem, self.destino):
+            ResumoMensalArquivado.objects.create(
+                user=self.user, tipo='D', mes=date(2020, 1, 1), conta=self.conta, categoria=categoria,
+                total=Decimal('50.00'), quantidade=2,
+            )
+        self.client.login(username='usuariomescla', password='123')
+
+    def test_excluir_categoria_em_uso_leva_a_mesclagem(self):
+        resposta = self.client.get(reverse('excluir_categoria', args=[self.origem.id]))
+        self.assertRedirects(resposta, reverse('mesclar_cadastro', args=['categoria', self.origem.id]))
+        self.assertTrue(Categoria.objects.filter(id=self.origem.id).exists())
+        self.assertContains(self.client.get(resposta.url), 'Alimentação')
+        self.assertContains(self.client.get(reverse('configuracoes')), reverse('mesclar_cadastro', args=['conta', self.conta.id]))
+
+    def test_mescla_categoria(self):
+        from core.models import AlteracaoSincronizacao
+        resposta = self.client.post(
+            reverse('mesclar_cadastro', args=['categoria', self.origem.id]), {'destino': self.destino.id}
+        )
+        self.assertRedirects(resposta, f"{reverse('configuracoes')}?active_tab=cat-despesas")
+        self.assertFalse(Categoria.objects.filter(id=self.origem.id).exists())
+        self.assertEqual(Despesa.objects.filter(categoria=self.destino).count(), 10)
+        self.sub.refresh_from_db()
+        self.assertEqual(self.sub.categoria_mae_id, self.destino.id)
+        self.destino.refresh_from_db()
+        self.assertEqual(self.destino.orcamento_mensal, Decimal('500'))
+        self.assertEqual(list(self.destino.historico_orcamento.values_list('valor', flat=True)), [Decimal('500')])
+        # Os dois resumos do mesmo mês viram um só
+        resumo = ResumoMensalArquivado.objects.get(categoria=self.destino)
+        self.assertEqual((resumo.total, resumo.quantidade), (Decimal('100.00'), 4))
+        self.assertEqual(AlteracaoSincronizacao.objects.filter(modelo='despesa', familia=self.familia).count(), 5)
+
+    def test_mescla_conta(self):
+        from core.services.mesclagem import mesclar
+        Conta.objects.filter(id=self.conta.id).update(saldo_inicial=Decimal('1000.00'))
+        self.conta.refresh_from_db()
+        outra = Conta.objects.create(familia=self.familia, nome="Poupança", saldo_inicial=Decimal('25.00'))
+        # 1000 + 25 de saldo inicial, menos 100 em despesas e 100 em resumos arquivados
+        saldo_total = self.conta.get_saldo_atual([self.user]) + outra.get_saldo_atual([self.user])
+        self.assertEqual(saldo_total, Decimal('825.00'))
+        self.assertEqual(mesclar(self.conta, outra), 10)
+        self.assertFalse(Conta.objects.filter(id=self.conta.id).exists())
+        outra.refresh_from_db()
+        self.assertEqual(outra.saldo_inicial, Decimal('1025.00'))
+        self.assertEqual(outra.get_saldo_atual([self.user]), saldo_total)
+        self.assertEqual(ResumoMensalArquivado.objects.filter(conta=outra).count(), 2)
+        with self.assertRaises(ValueError):
+            mesclar(outra, self.destino)
+
+
+class RazaoTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='usuariorazao', password='123')
+        self.familia = Familia.objects.create(nome="Família Razão")
+        self.user.perfil.familia = self.familia
+        self.user.perfil.save()
+        self.conta = Conta.objects.create(familia=self.familia, nome="Corrente", saldo_inicial=Decimal('100.00'))
+        self.categoria = Categoria.objects.get(familia=self.familia, nome="Farmácia")
+        self.categoria_receita = CategoriaReceita.objects.filter(familia=self.familia).first()
+        self.client.login(username='usuariorazao', password='123')
+
+    def test_triggers_espelham_gravacoes_em_massa(self):
+        from django.db import connection
+        from core.models import Lancamento
+        despesa = Despesa.objects.create(user=self.user, descricao='Remédio', valor=Decimal('30.00'), data=date(2025, 1, 5), categoria=self.categoria, conta=self.conta)
+        Receita.objects.bulk_create([
+            Receita(user=self.user, descricao=f'Salário {i}', valor=Decimal('1000.00'), data=date(2025, 1, i + 1), categoria=self.categoria_receita, conta=self.conta)
+            for i in range(3)
+        ])
+        lancamento = Lancamento.objects.get(tipo='D', objeto_id=despesa.id)
+        self.assertEqual((lancamento.valor, lancamento.familia_id, lancamento.conta_id), (Decimal('-30.00'), self.familia.id, self.conta.id))
+        self.assertEqual(Lancamento.objects.filter(tipo='R').count(), 3)
+
+        Despesa.objects.filter(id=despesa.id).update(valor=Decimal('45.00'))
+        self.assertEqual(Lancamento.objects.get(tipo='D', objeto_id=despesa.id).valor, Decimal('-45.00'))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {Receita._meta.db_table}")
+        self.assertFalse(Lancamento.objects.filter(tipo='R').exists())
+
+    def test_saldos_e_relatorio_leem_o_razao(self):
+        from core.services.razao import saldos_contas
+        Despesa.objects.create(user=self.user, descricao='Remédio', valor=Decimal('30.00'), data=date(2025, 1, 5), categoria=self.categoria, conta=self.conta)
+        Receita.objects.create(user=self.user, descricao='Salário', valor=Decimal('1000.00'), data=date(2025, 1, 6), categoria=self.categoria_receita, conta=self.conta)
+        poupanca = Conta.objects.create(familia=self.familia, nome="Poupança", saldo_inicial=Decimal("0.00"))
+        with self.assertNumQueries(2):  # razão e resumos arquivados
+            self.assertEqual(self.conta.get_saldo_atual([self.user]), Decimal('1070.00'))
+        with self.assertNumQueries(2):  # as mesmas duas consultas para todas as contas
+            self.assertEqual(saldos_contas([self.conta, poupanca], [self.user]), {self.conta.id: Decimal('1070.00'), poupanca.id: Decimal('0.00')})
+
+        resposta = self.client.get(reverse('relatorio_transacoes'), {'data_inicio': '2025-01-01', 'data_fim': '2025-01-31'})
+        self.assertEqual(resposta.context['saldo_periodo'], Decimal('970.00'))
+        self.assertEqual([str(t) for t in resposta.context['page_obj']], ['Salário', 'Remédio'])
+        self.assertContains(resposta, 'text-success')
+
+    def test_medir_razao_compara_consultas_agrupadas(self):
+        from io import StringIO
+        from django.core.management import call_command
+        Despesa.objects.create(user=self.user, descricao='Remédio', valor=Decimal('30.00'), data=date(2025, 1, 5), categoria=self.categoria, conta=self.conta)
+        ResumoMensalArquivado.objects.create(user=self.user, tipo='R', mes=date(2020, 1, 1), conta=self.conta, total=Decimal('200.00'), quantidade=1)
+        saida = StringIO()
+        # Falharia (CommandError) se os dois cálculos não dessem os mesmos saldos
+        call_command('medir_razao', self.familia.id, repeticoes=1, stdout=saida)
+        self.assertIn('Razão:', saida.getvalue())
+
+
+class MetricasTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username='usuariometricas', password='123')
+        self.client.login(username='usuariometricas', password='123')
+
+    def test_endpoint_exige_token(self):
+        with self.settings(METRICAS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with self.settings(METRICAS_TOKEN='segredo'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo').status_code, 200)
+            # Não aceita o token na query string, e um token fora do ASCII é só inválido
+            self.assertEqual(self.client.get('/metrics', {'token': 'segredo'}).status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer é').status_code, 401)
+
+    def test_expoe_requisicoes_consultas_e_tarefas(self):
+        from core.models import TarefaExclusao
+        from django.core.cache import cache
+        from core.services.cache import obter_ou_calcular
+        TarefaExclusao.objects.create(alvo=TarefaExclusao.Alvo.FAMILIA, objeto_id=1)
+        self.client.get(reverse('lista_contas'))
+        self.addCleanup(cache.clear)
+        for _ in range(2):
+            obter_ou_calcular('teste:metricas', lambda: 1, nome='teste_metricas')
+        with self.settings(METRICAS_TOKEN='segredo'):
+            texto = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo').content.decode()
+        self.assertIn('http_requisicoes_total{metodo="GET",status="200",view="lista_contas"}', texto)
+        self.assertIn('http_requisicao_segundos_bucket{view="lista_contas",le="+Inf"}', texto)
+        self.assertIn('db_consultas_por_requisicao_count{view="lista_contas"}', texto)
+        self.assertIn('db_consulta_segundos_sum{banco="default"}', texto)
+        self.assertIn('tarefas_exclusao{status="pendente"} 1', texto)
+        self.assertIn('processo_rss_bytes{pid=', texto)
+        self.assertIn('cache_eventos_total{cache="teste_metricas",evento="acertos"} 1', texto)
+        self.assertIn('cache_taxa_acerto{cache="teste_metricas"} 0.5', texto)
+
+    def test_soma_os_arquivos_dos_outros_workers(self):
+        import json
+        import os
+        import tempfile
+        from core import metricas
+        with tempfile.TemporaryDirectory() as diretorio:
+            # Um worker que já terminou (pid inexistente) deixou seu arquivo
+            with open(os.path.join(diretorio, 'metricas_999999999.json'), 'w') as arquivo:
+                json.dump({'pid': 999999999, 'rss': 1, 'histogramas': [], 'contadores': [
+                    ['http_requisicoes_total', [['metodo', 'GET'], ['status', 200], ['view', 'outro_worker']], 7],
+                ]}, arquivo)
+            with self.settings(METRICAS_DIR=diretorio):
+                metricas.gravar_arquivo(forcar=True)
+                self.assertTrue(os.path.exists(os.path.join(diretorio, f'metricas_{os.getpid()}.json')))
+                texto = metricas.exportar()
+        self.assertIn('http_requisicoes_total{metodo="GET",status="200",view="outro_worker"} 7', texto)
+        self.assertNotIn('pid="999999999"', texto)
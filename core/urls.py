@@ -19,12 +19,15 @@ urlpatterns = [
     path('despesas/', views.lista_despesas, name='lista_despesas'), 
     path('despesas/editar/<int:id>/', views.editar_despesa, name='editar_despesa'),
     path('despesas/excluir/<int:id>/', views.excluir_despesa, name='excluir_despesa'),
+    path('despesas/lote/', views.lancar_despesas_em_lote, name='lancar_despesas_em_lote'),
     path('despesas/recorrente/adicionar/', views.adicionar_despesa_recorrente, name='adicionar_despesa_recorrente'),
+    path('despesas/sugerir-categoria/', views.sugerir_categoria_despesa, name='sugerir_categoria_despesa'),
     
     path('receitas/', views.lista_receitas, name='lista_receitas'),
     path('receitas/editar/<int:id>/', views.editar_receita, name='editar_receita'),
     path('receitas/excluir/<int:id>/', views.excluir_receita, name='excluir_receita'),
     path('receitas/recorrente/adicionar/', views.adicionar_receita_recorrente, name='adicionar_receita_recorrente'),
+    path('transacoes/busca/', views.busca_transacoes, name='busca_transacoes'),
 
     # --- URLs de Contas e Cartões ---
     path('contas/', views.lista_contas, name='lista_contas'),
@@ -40,8 +43,16 @@ urlpatterns = [
     path('analise/', views.analise_gastos, name='analise_gastos'),
     path('analise/drilldown_categoria/', views.analise_drilldown_categoria, name='analise_drilldown_categoria'),
     path('orcamento/', views.orcamento_mensal, name='orcamento_mensal'),
+    path('orcamento/historico/', views.orcamento_historico, name='orcamento_historico'),
     path('orcamento-50-30-20/', views.orcamento_50_30_20, name='orcamento_50_30_20'),
     path('patrimonio/', views.evolucao_patrimonio, name='evolucao_patrimonio'),
+
+    # Dados dos gráficos em JSON (com ETag)
+    path('api/graficos/gastos-categoria/', views.api_grafico_gastos_categoria, name='api_grafico_gastos_categoria'),
+    path('api/graficos/drilldown/', views.api_grafico_drilldown, name='api_grafico_drilldown'),
+    path('api/graficos/fluxo-caixa/', views.api_grafico_fluxo_caixa, name='api_grafico_fluxo_caixa'),
+    path('api/graficos/patrimonio/', views.api_grafico_patrimonio, name='api_grafico_patrimonio'),
+    path('api/graficos/orcamento/', views.api_grafico_orcamento, name='api_grafico_orcamento'),
     path('relatorio/', views.relatorio_transacoes, name='relatorio_transacoes'),
     path('metas/', views.lista_metas, name='lista_metas'),
     path('metas/<int:id>/aporte/', views.adicionar_aporte, name='adicionar_aporte'),
@@ -49,6 +60,7 @@ urlpatterns = [
     # --- URLs de Investimentos ---
     path('investimentos/', views.lista_investimentos, name='lista_investimentos'),
     path('investimentos/excluir/<int:id>/', views.excluir_investimento, name='excluir_investimento'),
+    path('exclusoes/<int:id>/', views.status_exclusao, name='status_exclusao'),
     path('investimentos/<int:id>/', views.detalhe_investimento, name='detalhe_investimento'),
     path('investimentos/aporte/<int:investimento_id>/', views.adicionar_aporte_investimento, name='adicionar_aporte_investimento'),
 
@@ -59,7 +71,13 @@ urlpatterns = [
     path('configuracoes/categoria_receita/excluir/<int:id>/', views.excluir_categoria_receita, name='excluir_categoria_receita'),
     path('configuracoes/conta/excluir/<int:id>/', views.excluir_conta, name='excluir_conta'),
     path('configuracoes/cartao/excluir/<int:id>/', views.excluir_cartao, name='excluir_cartao'),
+    path('configuracoes/<str:tipo>/mesclar/<int:id>/', views.mesclar_cadastro, name='mesclar_cadastro'),
     path('planos/', views.pagina_planos, name='pagina_planos'),
     path('planos/criar-checkout-session/<int:plano_id>/', views.criar_checkout_session, name='criar_checkout_session'),
     path('stripe/webhook/', views.stripe_webhook, name='stripe_webhook'),
+
+    # --- API de sincronização do aplicativo ---
+    path('api/sync/token/', views.api_sync_token, name='api_sync_token'),
+    path('api/sync/', views.api_sync, name='api_sync'),
+    path('metrics', views.metricas_prometheus, name='metricas'),
 ]
\ No newline at end of file
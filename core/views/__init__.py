@@ -4,6 +4,9 @@ from .transacoes import *
 from .contas import *
 from .cartoes import *
 from .planejamento import * # Verifique se esta linha está presente
+from .graficos import *
 from .investimentos import *
 from .configuracoes import *
-from .pagamentos import * # Adicione esta linha
\ No newline at end of file
+from .pagamentos import * # Adicione esta linha
+from .sincronizacao import *
+from .metricas import *
@@ -2,18 +2,28 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.db.models import Sum
-from datetime import date
-from dateutil.relativedelta import relativedelta
+from django.utils import timezone
 
 from core.models import CartaoDeCredito, Despesa, Categoria, Conta
-from core.forms import PagamentoFaturaForm
+from core.forms import PagamentoFaturaForm, CartaoDeCreditoForm
+from core.services import sincronizacao
+from core.services.cache import invalidar_familia
+from core.services.faturas import calendario_faturas, resumo_cartoes
 
 @login_required
 def lista_cartoes(request):
-    familia = request.user.perfil.familia
-    cartoes = CartaoDeCredito.objects.filter(familia=familia) if familia else []
-    contexto = {'cartoes': cartoes}
+    user = request.user
+    familia = user.perfil.familia
+
+    visao = request.GET.get('visao', 'conjunto')
+    if visao == 'individual' or not familia:
+        usuarios_a_filtrar = [user]
+    else:
+        usuarios_a_filtrar = User.objects.filter(perfil__familia=familia)
+
+    # Fatura aberta, limite disponível e vencimento de todos os cartões em uma consulta
+    resumo = resumo_cartoes(familia, usuarios_a_filtrar)
+    contexto = {'resumo_cartoes': resumo, 'visao': visao}
     return render(request, 'core/lista_cartoes.html', contexto)
 
 @login_required
@@ -33,6 +43,9 @@ def fatura_cartao(request, id):
 
     form_pagamento = PagamentoFaturaForm(familia=familia)
 
+    # Próximas 12 faturas deste cartão (parcelas e lançamentos futuros)
+    calendario = calendario_faturas(familia, usuarios_a_filtrar, cartoes=[cartao])
+
     contexto = {
         'cartao': cartao,
         'despesas_abertas': fatura['despesas'],
@@ -40,6 +53,8 @@ def fatura_cartao(request, id):
         'data_inicio': fatura['data_inicio'],
         'data_fechamento': fatura['data_fechamento'],
         'form_pagamento': form_pagamento,
+        'proximas_faturas': calendario['linhas'][0]['faturas'],
+        'visao': visao,
     }
     return render(request, 'core/fatura_cartao.html', contexto)
 
@@ -55,17 +70,11 @@ def pagar_fatura(request, cartao_id):
             conta_pagamento = form.cleaned_data['conta_pagamento']
             data_pagamento = form.cleaned_data['data_pagamento']
             
-            hoje = date.today()
-            if hoje.day <= cartao.dia_fechamento: data_fechamento = hoje.replace(day=cartao.dia_fechamento)
-            else: data_fechamento = (hoje + relativedelta(months=1)).replace(day=cartao.dia_fechamento)
-            data_inicio = (data_fechamento - relativedelta(months=1)) + relativedelta(days=1)
-            
+            # Mesmo período da tela da fatura (evita o ValueError de replace(day=31) em meses curtos)
             usuarios_familia = User.objects.filter(perfil__familia=familia)
-            despesas_fatura = Despesa.objects.filter(
-                user__in=usuarios_familia,
-                cartao=cartao, data__gte=data_inicio, data__lte=data_fechamento, fatura_paga=False
-            )
-            total_a_pagar = despesas_fatura.aggregate(Sum('valor'))['valor__sum'] or 0
+            fatura = cartao.get_fatura_aberta(usuarios=usuarios_familia)
+            despesas_fatura = fatura['despesas']
+            total_a_pagar = fatura['total']
             
             if total_a_pagar > 0:
                 categoria_pagamento, _ = Categoria.objects.get_or_create(familia=familia, nome__iexact="Pagamento de Fatura", defaults={'nome': "Pagamento de Fatura"})
@@ -77,7 +86,9 @@ def pagar_fatura(request, cartao_id):
                     categoria=categoria_pagamento,
                     conta=conta_pagamento
                 )
-                despesas_fatura.update(fatura_paga=True)
+                sincronizacao.registrar_queryset(despesas_fatura)
+                despesas_fatura.update(fatura_paga=True, atualizado_em=timezone.now())
+                invalidar_familia(familia.id)
                 messages.success(request, f'Pagamento da fatura de R$ {total_a_pagar} registrado com sucesso!')
             else:
                 messages.warning(request, 'Não havia saldo em aberto para pagar nesta fatura.')
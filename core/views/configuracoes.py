@@ -3,11 +3,13 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
 from django.db.utils import IntegrityError
+from django.http import Http404
 
 from core.models import Categoria, CategoriaReceita, Conta, CartaoDeCredito, Familia, Perfil
 from core.forms import (
-    CategoriaForm, CategoriaReceitaForm, ContaForm, CartaoDeCreditoForm, EntrarFamiliaForm
+    CategoriaForm, CategoriaReceitaForm, ContaForm, CartaoDeCreditoForm, EntrarFamiliaForm, MesclarForm
 )
+from core.services.mesclagem import mesclar
 
 @login_required
 def configuracoes(request):
@@ -86,7 +88,8 @@ def excluir_categoria(request, id):
         categoria.delete()
         messages.success(request, 'Categoria de despesa excluída!')
     except IntegrityError:
-        messages.error(request, 'Esta categoria não pode ser excluída pois está em uso.')
+        messages.warning(request, 'Esta categoria está em uso. Escolha para qual categoria mover os lançamentos antes de excluí-la.')
+        return redirect('mesclar_cadastro', tipo='categoria', id=categoria.id)
     return redirect(f"{reverse('configuracoes')}?active_tab=cat-despesas")
 
 @login_required
@@ -97,7 +100,8 @@ def excluir_categoria_receita(request, id):
         categoria.delete()
         messages.success(request, 'Categoria de receita excluída!')
     except IntegrityError:
-        messages.error(request, 'Esta categoria não pode ser excluída pois está em uso.')
+        messages.warning(request, 'Esta categoria está em uso. Escolha para qual categoria mover os lançamentos antes de excluí-la.')
+        return redirect('mesclar_cadastro', tipo='categoria_receita', id=categoria.id)
     return redirect(f"{reverse('configuracoes')}?active_tab=cat-receitas")
 
 @login_required
@@ -108,7 +112,8 @@ def excluir_conta(request, id):
         conta.delete()
         messages.success(request, 'Conta excluída com sucesso!')
     except IntegrityError:
-        messages.error(request, 'Esta conta não pode ser excluída pois possui transações.')
+        messages.warning(request, 'Esta conta possui transações. Escolha para qual conta movê-las antes de excluí-la.')
+        return redirect('mesclar_cadastro', tipo='conta', id=conta.id)
     return redirect(f"{reverse('configuracoes')}?active_tab=contas")
 
 @login_required
@@ -122,6 +127,32 @@ def excluir_cartao(request, id):
         messages.error(request, 'Este cartão não pode ser excluído pois está em uso.')
     return redirect(f"{reverse('configuracoes')}?active_tab=cartoes")
 
+# Cadastros que podem ser mesclados: tipo na URL -> (modelo, aba das configurações)
+MESCLAVEIS = {
+    'categoria': (Categoria, 'cat-despesas'),
+    'categoria_receita': (CategoriaReceita, 'cat-receitas'),
+    'conta': (Conta, 'contas'),
+}
+
+@login_required
+def mesclar_cadastro(request, tipo, id):
+    """Move as transações de uma categoria ou conta para outra e exclui a original."""
+    if tipo not in MESCLAVEIS:
+        raise Http404
+    modelo, aba = MESCLAVEIS[tipo]
+    origem = get_object_or_404(modelo, id=id, familia=request.user.perfil.familia)
+    if request.method == 'POST':
+        form = MesclarForm(request.POST, origem=origem)
+        if form.is_valid():
+            destino = form.cleaned_data['destino']
+            movidas = mesclar(origem, destino)
+            messages.success(request, f'"{origem}" foi mesclada em "{destino}": {movidas} lançamentos movidos.')
+            return redirect(f"{reverse('configuracoes')}?active_tab={aba}")
+    else:
+        form = MesclarForm(origem=origem)
+    contexto = {'form': form, 'instance': origem, 'aba': aba}
+    return render(request, 'core/mesclar_cadastro.html', contexto)
+
 @login_required
 def gerenciar_familia(request):
     perfil = request.user.perfil
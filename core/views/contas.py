@@ -3,10 +3,14 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.db.models import Sum
 from datetime import date
+from dateutil.relativedelta import relativedelta
 from django.contrib import messages
 
 from core.models import Conta, Receita, Despesa
 from core.forms import ContaForm # <<< IMPORTAÇÃO ADICIONADA
+from core.services.projecao import projetar_saldos
+from core.services.extrato import extrato_conta
+from core.services.razao import saldos_contas
 
 @login_required
 def lista_contas(request):
@@ -18,7 +22,14 @@ def lista_contas(request):
     
     data_limite = (date.today() + relativedelta(months=6)) if periodo == 'projetado' else date.today()
 
-    saldos = [{'conta': c, 'saldo_atual': c.get_saldo_atual(usuarios=usuarios_familia, data_base=data_limite)} for c in contas]
+    saldos_por_conta = saldos_contas(contas, usuarios_familia, data_base=data_limite)
+    saldos = [{'conta': c, 'saldo_atual': saldos_por_conta[c.id]} for c in contas]
+
+    if periodo == 'projetado' and familia:
+        # Menor saldo previsto de cada conta no horizonte da projeção
+        minimos = {m['conta'].id: m for m in projetar_saldos(familia, usuarios_familia, meses=6)['minimos']}
+        for item in saldos:
+            item['minimo_projetado'] = minimos.get(item['conta'].id)
         
     contexto = {'contas_com_saldo': saldos, 'periodo': periodo, 'visao': 'conjunto', 'familia': familia, 'data_projecao': data_limite}
     return render(request, 'core/lista_contas.html', contexto)
@@ -29,7 +40,6 @@ def detalhe_conta(request, id):
     familia = user.perfil.familia
     conta = get_object_or_404(Conta, id=id, familia=familia)
     
-    has_premium_access = familia.has_premium() if familia else False
     visao = request.GET.get('visao', 'individual')
     periodo = request.GET.get('periodo', 'realizado')
     if visao == 'individual' or not familia:
@@ -38,16 +48,22 @@ def detalhe_conta(request, id):
         usuarios_a_filtrar = User.objects.filter(perfil__familia=familia)
     
     data_limite = (date.today() + relativedelta(months=6)) if periodo == 'projetado' else date.today()
-    saldo_atual = conta.get_saldo_atual(usuarios=usuarios_a_filtrar, data_base=data_limite)
-    
-    despesas = Despesa.objects.filter(user__in=usuarios_a_filtrar, conta=conta).order_by('-data')
-    receitas = Receita.objects.filter(user__in=usuarios_a_filtrar, conta=conta).order_by('-data')
+
+    # --- Extrato unificado, paginado por cursor ---
+    linhas, proximo_cursor = extrato_conta(conta, usuarios_a_filtrar, data_limite, cursor=request.GET.get('cursor'))
     contexto = {
-        'has_premium_access': has_premium_access,
-        'conta': conta, 'saldo_atual': saldo_atual,
-        'despesas': despesas, 'receitas': receitas,
-        'visao': visao, 'periodo': periodo, 'familia': familia, 'data_projecao': data_limite
+        'conta': conta, 'linhas': linhas, 'proximo_cursor': proximo_cursor,
+        'visao': visao, 'periodo': periodo,
     }
+    if request.htmx:
+        # Rolagem infinita: devolve apenas as próximas linhas do extrato
+        return render(request, 'core/partials/extrato_linhas.html', contexto)
+
+    contexto.update({
+        'has_premium_access': familia.has_premium() if familia else False,
+        'saldo_atual': conta.get_saldo_atual(usuarios=usuarios_a_filtrar, data_base=data_limite),
+        'familia': familia, 'data_projecao': data_limite,
+    })
     return render(request, 'core/detalhe_conta.html', contexto)
 
 @login_required
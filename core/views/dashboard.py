@@ -1,7 +1,7 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.db.models import Sum
+from django.db.models import F, Q, Sum
 from datetime import date
 from dateutil.relativedelta import relativedelta
 from itertools import chain
@@ -9,7 +9,11 @@ from operator import attrgetter
 from django.contrib import messages
 from django.urls import reverse
 
-from core.models import Conta, Receita, Despesa, CartaoDeCredito, MetaFinanceira, Investimento
+from core.models import Conta, Despesa, Lancamento, MetaFinanceira, Investimento, TarefaExclusao
+from core.services.exclusao import ids_em_exclusao
+from core.services.faturas import calendario_faturas, resumo_cartoes
+from core.services.projecao import projetar_saldos
+from core.services.razao import saldos_contas
 
 @login_required
 def dashboard(request):
@@ -32,33 +36,45 @@ def dashboard(request):
     # --- CORREÇÃO: Usando .none() para evitar o erro com listas vazias ---
     if familia:
         contas = Conta.objects.filter(familia=familia)
-        cartoes = CartaoDeCredito.objects.filter(familia=familia)
-        investimentos = Investimento.objects.filter(familia=familia)
+        investimentos = Investimento.objects.filter(familia=familia).exclude(
+            id__in=ids_em_exclusao(TarefaExclusao.Alvo.INVESTIMENTO)
+        )
         metas = MetaFinanceira.objects.filter(familia=familia).order_by('-valor_atual')[:3]
     else:
         contas = Conta.objects.none()
-        cartoes = CartaoDeCredito.objects.none()
         investimentos = Investimento.objects.none()
         metas = MetaFinanceira.objects.none()
     
     data_limite = (hoje + relativedelta(months=6)) if periodo == 'projetado' else hoje
 
     # --- Cálculos para os Cards ---
-    saldo_total_contas = sum(c.get_saldo_atual(usuarios=usuarios_a_filtrar, data_base=data_limite) for c in contas)
+    saldo_total_contas = sum(saldos_contas(contas, usuarios_a_filtrar, data_base=data_limite).values())
     
-    receitas_mes = Receita.objects.filter(user__in=usuarios_a_filtrar, data__year=hoje.year, data__month=hoje.month, data__lte=hoje).aggregate(Sum('valor'))['valor__sum'] or 0
-    despesas_caixa_mes = Despesa.objects.filter(user__in=usuarios_a_filtrar, conta__isnull=False, data__year=hoje.year, data__month=hoje.month, data__lte=hoje).aggregate(Sum('valor'))['valor__sum'] or 0
-    despesas_cartao_mes = Despesa.objects.filter(user__in=usuarios_a_filtrar, cartao__isnull=False, data__year=hoje.year, data__month=hoje.month, data__lte=hoje).aggregate(Sum('valor'))['valor__sum'] or 0
+    # Receitas e despesas do mês numa única leitura do razão
+    mes = Lancamento.objects.filter(user__in=usuarios_a_filtrar, data__gte=hoje.replace(day=1), data__lte=hoje).aggregate(
+        receitas=Sum('valor', filter=Q(tipo=Lancamento.Tipo.RECEITA)),
+        despesas_caixa=Sum(-F('valor'), filter=Q(tipo=Lancamento.Tipo.DESPESA, conta__isnull=False)),
+        despesas_cartao=Sum(-F('valor'), filter=Q(tipo=Lancamento.Tipo.DESPESA, cartao__isnull=False)),
+    )
+    receitas_mes = mes['receitas'] or 0
+    despesas_caixa_mes = mes['despesas_caixa'] or 0
+    despesas_cartao_mes = mes['despesas_cartao'] or 0
     gastos_totais_mes = despesas_caixa_mes + despesas_cartao_mes
     balanco_caixa_mes = receitas_mes - despesas_caixa_mes
 
-    faturas_abertas = [{'cartao': c, 'total': c.get_fatura_aberta(usuarios=usuarios_a_filtrar)['total']} for c in cartoes]
+    # Todas as faturas abertas em uma única consulta agrupada
+    faturas_abertas = resumo_cartoes(familia, usuarios_a_filtrar)
 
     valor_investido = investimentos.aggregate(total=Sum('valor_atual'))['total'] or 0
     divida_cartoes = sum(f['total'] for f in faturas_abertas)
-    saldo_contas_realizado = sum(c.get_saldo_atual(usuarios=usuarios_a_filtrar) for c in contas)
+    saldo_contas_realizado = sum(saldos_contas(contas, usuarios_a_filtrar).values())
     patrimonio_liquido = (saldo_contas_realizado + valor_investido) - divida_cartoes
 
+    # --- Projeção diária de saldos (menor saldo previsto por conta) ---
+    projecao = projetar_saldos(familia, usuarios_a_filtrar, meses=6, data_base=hoje) if periodo == 'projetado' and familia else None
+    # Faturas que fecham do mês atual até o mês da data projetada, por cartão
+    calendario = calendario_faturas(familia, usuarios_a_filtrar, meses=7, data_base=hoje) if periodo == 'projetado' and familia else None
+
     gastos_mes_categoria = Despesa.objects.filter(user__in=usuarios_a_filtrar, data__year=hoje.year, data__month=hoje.month).values('categoria__nome').annotate(total=Sum('valor')).order_by('-total')[:5]
     labels_gastos_pie = [g['categoria__nome'] for g in gastos_mes_categoria]
     data_gastos_pie = [float(g['total']) for g in gastos_mes_categoria]
@@ -70,7 +86,7 @@ def dashboard(request):
         'faturas': faturas_abertas, 'patrimonio_liquido': patrimonio_liquido,
         'labels_gastos_pie': labels_gastos_pie, 'data_gastos_pie': data_gastos_pie,
         'metas': metas, 'visao': visao, 'periodo': periodo, 'familia': familia,
-        'data_projecao': data_limite,
+        'data_projecao': data_limite, 'projecao': projecao, 'calendario_faturas': calendario,
         'has_premium_access': familia.has_premium() if familia else False
     }
     return render(request, 'core/dashboard.html', contexto)
\ No newline at end of file
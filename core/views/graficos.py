@@ -0,0 +1,175 @@
+import hashlib
+from datetime import date, datetime
+from urllib.parse import urlencode
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from core.models import Perfil
+from core.routers import usar_replica
+from core.services.amostragem import limite_pontos, reduzir_series
+from core.services.fluxo import serie_fluxo_caixa, serie_para_chartjs
+from core.services.graficos import gastos_por_categoria_principal, gastos_por_subcategoria, serie_patrimonio
+from core.services.orcamento import orcamento_por_mes
+from core.services.sincronizacao import marcador_alteracoes
+
+# --- Endpoints JSON dos gráficos ---
+# As páginas de análise carregam só os filtros e buscam os dados de cada gráfico
+# aqui, via fetch. O ETag de cada resposta é derivado do estado dos dados da família
+# no banco, do usuário, da URL com os filtros e do dia atual; se o navegador já tem
+# aquela versão, o decorator 'condition' responde 304 antes de a view rodar, sem
+# calcular nada.
+#
+# O estado é o marcador do registro de alterações da sincronização
+# (marcador_alteracoes: a última linha da família, uma por gravação ou exclusão de
+# transação, conta, cartão, categoria ou investimento), lido com uma consulta ao
+# índice (familia, id). Não vem da versão em cache (versao_familia), que com o cache
+# locmem é de cada processo: um worker que não recebeu a escrita continuaria
+# respondendo 304. Transações confirmadas fora da ordem dos ids são cobertas pela
+# janela de segurança do marcador.
+
+
+def filtros_analise(request):
+    """Filtros comuns das páginas e dos endpoints de análise, lidos da query string."""
+    user = request.user
+    familia = user.perfil.familia
+    hoje = date.today()
+
+    has_premium_access = familia.has_premium() if familia else False
+    visao = request.GET.get('visao', 'individual')
+    if visao == 'conjunto' and not has_premium_access:
+        visao = 'individual'
+
+    data_inicio_str = request.GET.get('data_inicio')
+    data_fim_str = request.GET.get('data_fim')
+    try:
+        data_inicio = datetime.strptime(data_inicio_str, '%Y-%m-%d').date()
+        data_fim = datetime.strptime(data_fim_str, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        data_inicio = (hoje - relativedelta(months=5)).replace(day=1)
+        data_fim = hoje
+
+    if visao == 'individual' or not familia:
+        usuarios_a_filtrar = [user]
+    else:
+        usuarios_a_filtrar = User.objects.filter(perfil__familia=familia)
+
+    filtros = {
+        'familia': familia,
+        'has_premium_access': has_premium_access,
+        'visao': visao,
+        'usuarios': usuarios_a_filtrar,
+        'data_inicio': data_inicio,
+        'data_fim': data_fim,
+        'periodo': request.GET.get('periodo', 'realizado'),
+        'agrupamento': request.GET.get('agrupamento', 'mensal'),
+        'pontos': limite_pontos(request.GET.get('pontos')),
+    }
+    # Query string já resolvida, repassada pelas páginas aos endpoints
+    filtros['query_graficos'] = urlencode({
+        'visao': visao, 'periodo': filtros['periodo'], 'data_inicio': data_inicio.isoformat(),
+        'data_fim': data_fim.isoformat(), 'agrupamento': filtros['agrupamento'], 'pontos': filtros['pontos'],
+    })
+    return filtros
+
+
+def etag_grafico(request, *args, **kwargs):
+    familia_id = request.user.perfil.familia_id
+    if not familia_id:
+        # Sem família não há registro de alterações: sempre calcula
+        return None
+    membros = sorted(Perfil.objects.filter(familia_id=familia_id).values_list('user_id', flat=True))
+    partes = [
+        request.user.id, familia_id, marcador_alteracoes(familia_id), membros,
+        request.path, sorted(request.GET.lists()), date.today().isoformat(),
+    ]
+    return hashlib.sha1(repr(partes).encode()).hexdigest()
+
+
+def _resposta_json(dados):
+    if isinstance(dados, str):
+        resposta = HttpResponse(dados, content_type='application/json')
+    else:
+        resposta = JsonResponse(dados, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+    # Sempre revalida com o ETag; a resposta é só do próprio usuário
+    patch_cache_control(resposta, private=True, no_cache=True)
+    return resposta
+
+
+@login_required
+@condition(etag_func=etag_grafico)
+@usar_replica
+def api_grafico_gastos_categoria(request):
+    filtros = filtros_analise(request)
+    gastos = gastos_por_categoria_principal(filtros['familia'], filtros['usuarios'], filtros['data_inicio'], filtros['data_fim'])
+    return _resposta_json({
+        'labels': [g['categoria__nome'] for g in gastos],
+        'data': [float(g['total']) for g in gastos],
+    })
+
+
+@login_required
+@condition(etag_func=etag_grafico)
+@usar_replica
+def api_grafico_drilldown(request):
+    filtros = filtros_analise(request)
+    categoria_mae_nome = request.GET.get('categoria_mae')
+    gastos = gastos_por_subcategoria(
+        filtros['familia'], filtros['usuarios'], categoria_mae_nome, filtros['data_inicio'], filtros['data_fim']
+    )
+    if gastos is None:
+        return JsonResponse({'erro': 'Categoria não encontrada.'}, status=404)
+    return _resposta_json({
+        'categoria': categoria_mae_nome,
+        'labels': [g['categoria__nome'] for g in gastos],
+        'data': [float(g['total']) for g in gastos],
+    })
+
+
+@login_required
+@condition(etag_func=etag_grafico)
+@usar_replica
+def api_grafico_fluxo_caixa(request):
+    filtros = filtros_analise(request)
+    serie = serie_fluxo_caixa(filtros['usuarios'], filtros['data_inicio'], filtros['data_fim'], filtros['agrupamento'])
+    serie = reduzir_series(serie, ['receitas', 'despesas', 'saldo'], filtros['pontos'])
+    return _resposta_json(serie_para_chartjs(serie))
+
+
+@login_required
+@condition(etag_func=etag_grafico)
+@usar_replica
+def api_grafico_patrimonio(request):
+    filtros = filtros_analise(request)
+    patrimonio = serie_patrimonio(filtros['familia'], filtros['usuarios'], filtros['periodo'], date.today())
+    serie = reduzir_series(
+        {'labels': [item['mes'] for item in patrimonio], 'data': [item['valor'] for item in patrimonio]},
+        ['data'], filtros['pontos'],
+    )
+    return _resposta_json({
+        'labels': serie['labels'],
+        'data': serie['data'],
+        'atual': patrimonio[-1]['valor'] if patrimonio else 0,
+    })
+
+
+@login_required
+@condition(etag_func=etag_grafico)
+@usar_replica
+def api_grafico_orcamento(request):
+    """Orçado x gasto por categoria nos últimos 12 meses (valores em reais)."""
+    filtros = filtros_analise(request)
+    if not filtros['familia']:
+        return _resposta_json({'meses': [], 'categorias': [], 'orcado': [], 'gasto': []})
+    inicio = date.today().replace(day=1) - relativedelta(months=11)
+    orcamento = orcamento_por_mes(filtros['familia'], filtros['usuarios'], inicio=inicio, meses=12)
+    return _resposta_json({
+        'meses': [mes.strftime('%Y-%m') for mes in orcamento['meses']],
+        'categorias': [categoria.nome for categoria in orcamento['categorias']],
+        'orcado': (orcamento['disponivel'] / 100).round(2).tolist(),
+        'gasto': (orcamento['gasto'] / 100).round(2).tolist(),
+    })
@@ -3,9 +3,16 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Sum
 from django.contrib.auth.models import User
+from django.http import JsonResponse
 
-from core.models import Investimento, AporteInvestimento, Categoria, Despesa, Conta
+from core.models import Investimento, AporteInvestimento, Categoria, Despesa, Conta, TarefaExclusao
 from core.forms import InvestimentoForm, AporteInvestimentoForm
+from core.services.exclusao import agendar_exclusao, ids_em_exclusao
+
+
+def _investimentos_da_familia(familia):
+    """Investimentos da família, sem os que estão sendo excluídos em segundo plano."""
+    return Investimento.objects.filter(familia=familia).exclude(id__in=ids_em_exclusao(TarefaExclusao.Alvo.INVESTIMENTO))
 
 @login_required
 def lista_investimentos(request):
@@ -28,7 +35,7 @@ def lista_investimentos(request):
 
     # CORREÇÃO: Usamos .none() para retornar um QuerySet vazio se não houver família
     if familia:
-        investimentos = Investimento.objects.filter(familia=familia)
+        investimentos = _investimentos_da_familia(familia)
     else:
         investimentos = Investimento.objects.none()
     
@@ -47,7 +54,7 @@ def lista_investimentos(request):
 def detalhe_investimento(request, id):
     user = request.user
     familia = user.perfil.familia
-    investimento = get_object_or_404(Investimento, id=id, familia=familia)
+    investimento = get_object_or_404(_investimentos_da_familia(familia), id=id)
     
     # --- LÓGICA DE VISÃO ADICIONADA ---
     visao = request.GET.get('visao', 'conjunto')
@@ -76,7 +83,7 @@ def detalhe_investimento(request, id):
 @login_required
 def adicionar_aporte_investimento(request, investimento_id):
     familia = request.user.perfil.familia
-    investimento = get_object_or_404(Investimento, id=investimento_id, familia=familia)
+    investimento = get_object_or_404(_investimentos_da_familia(familia), id=investimento_id)
 
     if request.method == 'POST':
         form = AporteInvestimentoForm(request.POST, user=request.user)
@@ -115,14 +122,30 @@ def excluir_investimento(request, id):
     familia = request.user.perfil.familia
     # Garante que o usuário só pode excluir investimentos da sua própria família
     investimento = get_object_or_404(Investimento, id=id, familia=familia)
-    
-    # Antes de excluir o investimento, subtrai seu valor do saldo das contas
-    # para manter a consistência do patrimônio total.
-    # Esta lógica pode ser ajustada conforme a necessidade de relatórios futuros.
-    
-    # Exclui o investimento. O Django automaticamente excluirá todos os
-    # AporteInvestimento associados a ele (efeito cascata).
-    investimento.delete()
-    
-    messages.success(request, f'O investimento "{investimento.nome}" e seu histórico de aportes foram excluídos com sucesso.')
-    return redirect('lista_investimentos')
\ No newline at end of file
+
+    # Investimentos antigos podem ter milhares de aportes: a exclusão é feita em
+    # lotes, em segundo plano (core/services/exclusao.py), e o progresso pode ser
+    # acompanhado em /exclusoes/<id>/. Enquanto isso ele some das telas, e um segundo
+    # pedido não cria outra tarefa.
+    _, criada = agendar_exclusao(TarefaExclusao.Alvo.INVESTIMENTO, investimento, solicitado_por=request.user)
+
+    if criada:
+        messages.success(request, f'A exclusão do investimento "{investimento.nome}" e do seu histórico de aportes foi iniciada.')
+    else:
+        messages.info(request, f'A exclusão do investimento "{investimento.nome}" já está em andamento.')
+    return redirect('lista_investimentos')
+
+
+@login_required
+def status_exclusao(request, id):
+    """Progresso de uma exclusão em lotes pedida pelo usuário, em JSON."""
+    tarefa = get_object_or_404(TarefaExclusao, id=id, solicitado_por=request.user)
+    return JsonResponse({
+        'alvo': tarefa.alvo,
+        'descricao': tarefa.descricao,
+        'status': tarefa.status,
+        'etapa': tarefa.etapa,
+        'removidos': tarefa.removidos,
+        'total': tarefa.total,
+        'progresso': tarefa.progresso_percentual,
+    })
@@ -0,0 +1,27 @@
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+from core.metricas import exportar
+
+# --- Endpoint do Prometheus ---
+# Protegido por token, só no cabeçalho "Authorization: Bearer <METRICAS_TOKEN>" (na
+# query string ele iria parar nos logs de acesso e dos proxies); sem token
+# configurado o endpoint não existe.
+
+
+def _token_da_requisicao(request):
+    tipo, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return token.strip() if tipo == 'Bearer' else ''
+
+
+@require_GET
+def metricas_prometheus(request):
+    if not settings.METRICAS_TOKEN:
+        raise Http404
+    # Em bytes: com str, compare_digest recusa (TypeError) caracteres fora do ASCII
+    if not hmac.compare_digest(_token_da_requisicao(request).encode(), settings.METRICAS_TOKEN.encode()):
+        return HttpResponse('Token inválido.', status=401, content_type='text/plain; charset=utf-8')
+    return HttpResponse(exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,7 +1,10 @@
+import time
+
 import stripe
 from django.conf import settings
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from core.metricas import observar
 from core.models import Plano, Assinatura, Familia
 
 @csrf_exempt
@@ -17,6 +20,8 @@ def stripe_webhook(request):
             payload, sig_header, webhook_secret
         )
         print(f"Evento construído com sucesso. Tipo: {event['type']}")
+        # Atraso entre a criação do evento no Stripe e a chegada aqui (core/metricas.py)
+        observar('webhook_atraso_segundos', max(time.time() - event['created'], 0), tipo=event['type'])
     except Exception as e:
         print(f"ERRO ao construir evento: {e}")
         return HttpResponse(status=400)
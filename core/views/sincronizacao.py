@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET, require_http_methods
+
+from core.services.sincronizacao import (
+    criar_token, gerar_alteracoes, limite_alteracoes, revogar_token, tentativa_permitida, usuario_do_token
+)
+
+# --- API de sincronização do aplicativo ---
+# Autenticada por token (cabeçalho "Authorization: Token <chave>"), sem sessão nem
+# CSRF. O token é obtido com usuário e senha em POST /api/sync/token/, com um limite
+# de pedidos por IP e por usuário, e expira depois de um tempo sem uso.
+
+
+def _chave_do_cabecalho(request):
+    tipo, _, chave = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return chave.strip() if tipo == 'Token' else ''
+
+
+@csrf_exempt
+@require_http_methods(['POST', 'DELETE'])
+def api_sync_token(request):
+    if request.method == 'DELETE':
+        if not revogar_token(_chave_do_cabecalho(request)):
+            return JsonResponse({'erro': 'Token inválido.'}, status=401)
+        return JsonResponse({'revogado': True})
+
+    username = request.POST.get('username') or ''
+    if not tentativa_permitida(f"ip:{request.META.get('REMOTE_ADDR')}", f"usuario:{username.lower()}"):
+        resposta = JsonResponse({'erro': 'Muitas tentativas. Tente novamente mais tarde.'}, status=429)
+        resposta['Retry-After'] = str(settings.SINCRONIZACAO_INTERVALO_TENTATIVAS)
+        return resposta
+    user = authenticate(request, username=username, password=request.POST.get('password'))
+    if user is None:
+        return JsonResponse({'erro': 'Usuário ou senha inválidos.'}, status=401)
+    return JsonResponse({'token': criar_token(user, request.POST.get('dispositivo', ''))}, status=201)
+
+
+@csrf_exempt
+@require_GET
+@gzip_page
+def api_sync(request):
+    """
+    Alterações desde '?cursor=' (0 ou ausente: todos os registros), em NDJSON.
+    A última linha traz o próximo cursor e se ainda há alterações ('mais').
+    """
+    user = usuario_do_token(_chave_do_cabecalho(request))
+    if user is None:
+        return JsonResponse({'erro': 'Token inválido.'}, status=401)
+    familia_id = user.perfil.familia_id
+    if not familia_id:
+        return JsonResponse({'erro': 'Usuário sem família.'}, status=409)
+    try:
+        cursor = max(int(request.GET.get('cursor', 0)), 0)
+    except ValueError:
+        return JsonResponse({'erro': 'Cursor inválido.'}, status=400)
+
+    resposta = StreamingHttpResponse(
+        gerar_alteracoes(familia_id, cursor, limite_alteracoes(request.GET.get('limite'))),
+        content_type='application/x-ndjson; charset=utf-8',
+    )
+    resposta['Cache-Control'] = 'no-store'
+    return resposta
@@ -1,20 +1,60 @@
 import uuid
+from copy import copy
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.db.models import Sum
+from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
-from django.core.paginator import Paginator
 
 from core.models import Despesa, Receita
-from core.forms import DespesaForm, ReceitaForm, RecorrenteDespesaForm, RecorrenteReceitaForm
+from core.forms import DespesaForm, DespesaLoteFormSet, ReceitaForm, RecorrenteDespesaForm, RecorrenteReceitaForm
+from core.services.paginacao import paginar_por_cursor
+from core.services.busca import buscar_transacoes
+from core.services.categorizador import sugerir_categoria
+from core.services.lote import criar_despesas_em_lote
+from core.services.parcelamento import criar_compra_parcelada
+from core.services.series import (
+    ESCOPO_CHOICES, ESCOPO_ESTA, CAMPOS_SERIE, campo_da_serie, atualizar_serie, excluir_serie
+)
+
+ITENS_POR_PAGINA = 20
+
+def _total_mes(modelo, usuarios):
+    hoje = date.today()
+    return modelo.objects.filter(user__in=usuarios, data__year=hoje.year, data__month=hoje.month).aggregate(total=Sum('valor'))['total'] or 0
+
+def _data_do_filtro(valor):
+    """Data de um filtro da query string; uma data malformada é ignorada (None)."""
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+def _escopo(dados):
+    escopo = dados.get('escopo', ESCOPO_ESTA)
+    return escopo if escopo in dict(ESCOPO_CHOICES) else ESCOPO_ESTA
+
+def _salvar_edicao(form, original, escopo):
+    """
+    Salva a edição de uma despesa/receita. Em séries, com escopo diferente de 'esta',
+    replica os campos alterados (e o deslocamento da data) para as demais ocorrências.
+    Retorna quantas transações foram alteradas.
+    """
+    if escopo == ESCOPO_ESTA or not campo_da_serie(original):
+        form.save()
+        return 1
+    campos = {campo: form.cleaned_data[campo] for campo in form.changed_data if campo in CAMPOS_SERIE}
+    dias = (form.cleaned_data['data'] - original.data).days
+    return atualizar_serie(original, escopo, campos, dias) or 1
 
 @login_required
 def lista_despesas(request):
     user = request.user
     familia = user.perfil.familia
     
-    has_premium_access = familia.has_premium() if familia else False
     visao = request.GET.get('visao', 'individual')
     if visao == 'individual' or not familia:
         usuarios_a_filtrar = [user]
@@ -29,25 +69,27 @@ def lista_despesas(request):
             num_parcelas = dados_despesa.get('numero_parcelas', 1)
 
             if num_parcelas > 1:
-                # ... lógica de parcelamento ...
+                novas_despesas = criar_compra_parcelada(
+                    user, familia.id if familia else None, dados_despesa['descricao'], dados_despesa['valor'],
+                    dados_despesa['data'], num_parcelas, dados_despesa['categoria'],
+                    conta=dados_despesa['conta'], cartao=dados_despesa['cartao'],
+                )
                 messages.success(request, f'{num_parcelas} parcelas foram criadas com sucesso!')
             else:
                 despesa = form.save(commit=False)
                 despesa.user = user
                 despesa.save()
+                novas_despesas = [despesa]
                 messages.success(request, 'Despesa salva com sucesso!')
             
             if request.htmx:
-                # SUCESSO HTMX: Retorna a lista ATUALIZADA E um formulário LIMPO
-                despesas_list = Despesa.objects.filter(user__in=usuarios_a_filtrar).order_by('-data', '-id')
-                paginator = Paginator(despesas_list, 20)
-                page_obj = paginator.get_page(1)
+                # SUCESSO HTMX: devolve um formulário LIMPO e, fora da área principal (OOB),
+                # apenas as linhas novas e os totais atualizados
                 contexto = {
-                    'has_premium_access': has_premium_access,
-                    'page_obj': page_obj,
-                    'form': DespesaForm(user=user), # <<< CORREÇÃO: Envia um formulário novo e limpo
-                    'visao': visao, 
-                    'familia': familia
+                    'form': DespesaForm(user=user),
+                    'novas_despesas': novas_despesas,
+                    'total_mes': _total_mes(Despesa, usuarios_a_filtrar),
+                    'visao': visao,
                 }
                 return render(request, 'core/partials/despesas_response.html', contexto)
             
@@ -56,39 +98,79 @@ def lista_despesas(request):
             if request.htmx:
                 return render(request, 'core/partials/form_despesa_partial.html', {'form': form})
     
-    # Lógica GET
-    form = DespesaForm(user=user)
-    despesas_list = Despesa.objects.filter(user__in=usuarios_a_filtrar).order_by('-data', '-id')
-    paginator = Paginator(despesas_list, 20)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
-    
-    contexto = {'page_obj': page_obj, 'form': form, 'visao': visao, 'familia': familia}
+    # Lógica GET (paginação por cursor)
+    despesas_list = Despesa.objects.filter(user__in=usuarios_a_filtrar).select_related('categoria__categoria_mae', 'user')
+    despesas, proximo_cursor = paginar_por_cursor(despesas_list, request.GET.get('cursor'), ITENS_POR_PAGINA)
+    contexto = {'despesas': despesas, 'proximo_cursor': proximo_cursor, 'visao': visao}
+    if request.htmx:
+        # Rolagem infinita: apenas as próximas linhas
+        return render(request, 'core/partials/despesas_linhas.html', contexto)
+
+    contexto.update({
+        'form': DespesaForm(user=user), 'familia': familia, 'has_premium_access': familia.has_premium() if familia else False,
+        'total_mes': _total_mes(Despesa, usuarios_a_filtrar),
+    })
     return render(request, 'core/lista_despesas.html', contexto)
 
 @login_required
 def editar_despesa(request, id):
     despesa = get_object_or_404(Despesa, id=id, user=request.user)
+    original = copy(despesa)
     if request.method == 'POST':
         form = DespesaForm(request.POST, instance=despesa, user=request.user)
         if 'numero_parcelas' in form.fields: form.fields.pop('numero_parcelas')
         if form.is_valid():
-            form.save()
-            messages.success(request, 'Despesa atualizada com sucesso!')
+            alteradas = _salvar_edicao(form, original, _escopo(request.POST))
+            if alteradas > 1:
+                messages.success(request, f'{alteradas} despesas da série foram atualizadas!')
+            else:
+                messages.success(request, 'Despesa atualizada com sucesso!')
             return redirect('lista_despesas')
     else:
         form = DespesaForm(instance=despesa, user=request.user)
         if 'numero_parcelas' in form.fields: form.fields.pop('numero_parcelas')
-    contexto = {'form': form, 'despesa': despesa}
+    contexto = {'form': form, 'despesa': despesa, 'em_serie': campo_da_serie(original) is not None, 'escopo_choices': ESCOPO_CHOICES}
     return render(request, 'core/editar_despesa.html', contexto)
 
 @login_required
 def excluir_despesa(request, id):
     despesa = get_object_or_404(Despesa, id=id, user=request.user)
-    despesa.delete()
-    messages.success(request, 'Despesa excluída com sucesso!')
+    escopo = _escopo(request.GET)
+    if escopo != ESCOPO_ESTA and campo_da_serie(despesa):
+        excluidas = excluir_serie(despesa, escopo)
+        messages.success(request, f'{excluidas} despesas da série foram excluídas!')
+    else:
+        despesa.delete()
+        messages.success(request, 'Despesa excluída com sucesso!')
     return redirect('lista_despesas')
 
+@login_required
+def lancar_despesas_em_lote(request):
+    """
+    Grade para lançar várias despesas em um só envio. Linhas em branco são ignoradas;
+    se alguma linha tiver erro, nada é gravado e os erros voltam por linha (em JSON,
+    quando o cliente pede 'Accept: application/json').
+    """
+    user = request.user
+    familia = user.perfil.familia
+    quer_json = 'application/json' in request.headers.get('Accept', '')
+
+    if request.method == 'POST':
+        formset = DespesaLoteFormSet(request.POST, user=user)
+        if formset.is_valid():
+            linhas = [form.cleaned_data for form in formset if form.has_changed()]
+            despesas = criar_despesas_em_lote(user, familia.id if familia else None, linhas)
+            if quer_json:
+                return JsonResponse({'criadas': [despesa.id for despesa in despesas]}, status=201)
+            messages.success(request, f'{len(despesas)} despesas foram lançadas com sucesso!')
+            return redirect('lista_despesas')
+        if quer_json:
+            erros = {indice: form.errors.get_json_data() for indice, form in enumerate(formset) if form.errors}
+            return JsonResponse({'erros': erros, 'erros_gerais': formset.non_form_errors().get_json_data()}, status=400)
+    else:
+        formset = DespesaLoteFormSet(user=user)
+    return render(request, 'core/lancamento_lote.html', {'formset': formset})
+
 @login_required
 def adicionar_despesa_recorrente(request):
     user = request.user
@@ -117,12 +199,33 @@ def adicionar_despesa_recorrente(request):
     contexto = {'form': form}
     return render(request, 'core/adicionar_recorrente.html', contexto)
 
+@login_required
+def sugerir_categoria_despesa(request):
+    """
+    Chamado via HTMX enquanto a descrição é digitada no formulário de despesa.
+    Devolve o <select> de categoria já com a sugestão marcada, a menos que o
+    usuário já tenha escolhido uma categoria.
+    """
+    form = DespesaForm(user=request.user)
+    familia = request.user.perfil.familia
+    categoria_id = request.GET.get('categoria')
+    descricao = request.GET.get('descricao', '').strip()
+
+    if familia and not categoria_id and descricao:
+        sugestao = sugerir_categoria(
+            familia.id, descricao, valor=request.GET.get('valor') or None,
+            conta_id=request.GET.get('conta') or None, cartao_id=request.GET.get('cartao') or None,
+        )
+        if sugestao and any(c.id == sugestao for c in form.fields['categoria'].objetos):
+            categoria_id = sugestao
+    form.initial['categoria'] = categoria_id
+    return HttpResponse(form['categoria'].as_widget(attrs={'class': 'form-select'}))
+
 @login_required
 def lista_receitas(request):
     user = request.user
     familia = user.perfil.familia
     
-    has_premium_access = familia.has_premium() if familia else False
     visao = request.GET.get('visao', 'individual')
     if visao == 'individual' or not familia:
         usuarios_a_filtrar = [user]
@@ -138,14 +241,11 @@ def lista_receitas(request):
             messages.success(request, 'Receita salva com sucesso!')
 
             if request.htmx:
-                receitas_list = Receita.objects.filter(user__in=usuarios_a_filtrar).order_by('-data')
-                paginator = Paginator(receitas_list, 20)
-                page_obj = paginator.get_page(1)
                 contexto = {
-                    'has_premium_access': has_premium_access,
-                    'page_obj': page_obj,
                     'form': ReceitaForm(user=user),
-                    'visao': visao, 'familia': familia
+                    'novas_receitas': [receita],
+                    'total_mes': _total_mes(Receita, usuarios_a_filtrar),
+                    'visao': visao,
                 }
                 return render(request, 'core/partials/receitas_response.html', contexto)
             
@@ -155,35 +255,47 @@ def lista_receitas(request):
                 contexto = {'form': form}
                 return render(request, 'core/partials/form_receita_partial.html', contexto)
     
-    form = ReceitaForm(user=user)
-    receitas_list = Receita.objects.filter(user__in=usuarios_a_filtrar).order_by('-data')
-    paginator = Paginator(receitas_list, 20)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
-    
-    contexto = {'page_obj': page_obj, 'form': form, 'visao': visao, 'familia': familia}
+    receitas_list = Receita.objects.filter(user__in=usuarios_a_filtrar).select_related('categoria', 'conta', 'user')
+    receitas, proximo_cursor = paginar_por_cursor(receitas_list, request.GET.get('cursor'), ITENS_POR_PAGINA)
+    contexto = {'receitas': receitas, 'proximo_cursor': proximo_cursor, 'visao': visao}
+    if request.htmx:
+        return render(request, 'core/partials/receitas_linhas.html', contexto)
+
+    contexto.update({
+        'form': ReceitaForm(user=user), 'familia': familia, 'has_premium_access': familia.has_premium() if familia else False,
+        'total_mes': _total_mes(Receita, usuarios_a_filtrar),
+    })
     return render(request, 'core/lista_receitas.html', contexto)
 
 @login_required
 def excluir_receita(request, id):
     receita = get_object_or_404(Receita, id=id, user=request.user)
-    receita.delete()
-    messages.success(request, 'Receita excluída com sucesso!')
+    escopo = _escopo(request.GET)
+    if escopo != ESCOPO_ESTA and campo_da_serie(receita):
+        excluidas = excluir_serie(receita, escopo)
+        messages.success(request, f'{excluidas} receitas da série foram excluídas!')
+    else:
+        receita.delete()
+        messages.success(request, 'Receita excluída com sucesso!')
     return redirect('lista_receitas')
 
 @login_required
 def editar_receita(request, id):
     receita = get_object_or_404(Receita, id=id, user=request.user)
+    original = copy(receita)
     if request.method == 'POST':
         form = ReceitaForm(request.POST, instance=receita, user=request.user)
         if form.is_valid():
-            form.save()
-            messages.success(request, 'Receita atualizada com sucesso!')
+            alteradas = _salvar_edicao(form, original, _escopo(request.POST))
+            if alteradas > 1:
+                messages.success(request, f'{alteradas} receitas da série foram atualizadas!')
+            else:
+                messages.success(request, 'Receita atualizada com sucesso!')
             return redirect('lista_receitas')
     else:
         form = ReceitaForm(instance=receita, user=request.user)
     
-    contexto = {'form': form, 'receita': receita}
+    contexto = {'form': form, 'receita': receita, 'em_serie': campo_da_serie(original) is not None, 'escopo_choices': ESCOPO_CHOICES}
     return render(request, 'core/editar_receita.html', contexto)
 
 @login_required
@@ -212,4 +324,38 @@ def adicionar_receita_recorrente(request):
     else:
         form = RecorrenteReceitaForm(user=user)
     contexto = {'form': form, 'tipo': 'Receita'}
-    return render(request, 'core/adicionar_recorrente.html', contexto)
\ No newline at end of file
+    return render(request, 'core/adicionar_recorrente.html', contexto)
+
+@login_required
+def busca_transacoes(request):
+    user = request.user
+    familia = user.perfil.familia
+
+    # --- Filtros (mesmos do relatório de transações) ---
+    termo = request.GET.get('q', '').strip()
+    visao = request.GET.get('visao', 'individual')
+    data_inicio_str = request.GET.get('data_inicio')
+    data_fim_str = request.GET.get('data_fim')
+    data_inicio = _data_do_filtro(data_inicio_str)
+    data_fim = _data_do_filtro(data_fim_str)
+
+    if visao == 'individual' or not familia:
+        usuarios_a_filtrar = [user]
+    else:
+        usuarios_a_filtrar = User.objects.filter(perfil__familia=familia)
+
+    transacoes, proximo_cursor = [], None
+    if termo:
+        transacoes, proximo_cursor = buscar_transacoes(
+            usuarios_a_filtrar, termo, data_inicio, data_fim, cursor=request.GET.get('cursor')
+        )
+
+    contexto = {
+        'transacoes': transacoes, 'proximo_cursor': proximo_cursor, 'q': termo,
+        'data_inicio': data_inicio, 'data_fim': data_fim, 'visao': visao,
+    }
+    if request.htmx and request.GET.get('cursor'):
+        return render(request, 'core/partials/busca_linhas.html', contexto)
+
+    contexto.update({'familia': familia, 'has_premium_access': familia.has_premium() if familia else False})
+    return render(request, 'core/busca_transacoes.html', contexto)
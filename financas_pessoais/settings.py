@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro, para medir o tempo de toda a pilha (core/metricas.py)
+    'core.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # Adicionado para servir estáticos em produção
     'django_htmx.middleware.HtmxMiddleware', # Adicione esta linha
@@ -60,6 +62,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.routers.LeituraAposEscritaMiddleware',
 ]
 
 ROOT_URLCONF = 'financas_pessoais.urls'
@@ -101,6 +104,67 @@ else:
         }
     }
 
+# Réplica de leitura opcional para as páginas de relatórios (ver core/routers.py).
+# Localmente dá para testar com dois arquivos SQLite, por exemplo:
+#   DATABASE_REPLICA_URL=sqlite:///db_replica.sqlite3 (uma cópia do db.sqlite3)
+# Sem a variável, tudo continua no banco 'default'. Nos testes a réplica é um
+# espelho do banco de testes do 'default', em vez de um banco de testes próprio.
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default='')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(DATABASE_REPLICA_URL, conn_max_age=600)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_SEGUNDOS_APOS_ESCRITA = config('REPLICA_SEGUNDOS_APOS_ESCRITA', default=5, cast=int)
+
+# Pacote de categorias iniciais das novas famílias (ver core/services/provisionamento.py)
+PACOTE_CATEGORIAS_PADRAO = config('PACOTE_CATEGORIAS_PADRAO', default='padrao')
+
+
+# --- CONFIGURAÇÃO DO CACHE ---
+# CACHE_BACKEND escolhe onde ficam os caches da família (ver core/services/cache.py):
+#   'locmem'  - memória do processo (padrão; cada worker tem o seu)
+#   'arquivo' - arquivos em CACHE_LOCATION, compartilhados pelos workers da máquina
+#   'banco'   - tabela CACHE_LOCATION no banco (criar com 'manage.py createcachetable')
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+_BACKENDS_CACHE = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'financas-pessoais'),
+    'arquivo': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / '.cache')),
+    'banco': ('django.core.cache.backends.db.DatabaseCache', 'cache_financas'),
+}
+CACHES = {
+    'default': {
+        'BACKEND': _BACKENDS_CACHE[CACHE_BACKEND][0],
+        'LOCATION': config('CACHE_LOCATION', default=_BACKENDS_CACHE[CACHE_BACKEND][1]),
+        'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),
+        'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=5000, cast=int)},
+    }
+}
+# Valores vencidos são renovados numa thread à parte (os testes que dependem da
+# renovação a desligam com override_settings: a thread não enxergaria os dados da
+# transação do TestCase).
+CACHE_RENOVAR_EM_SEGUNDO_PLANO = config('CACHE_RENOVAR_EM_SEGUNDO_PLANO', default=True, cast=bool)
+
+# Exclusões grandes (core/services/exclusao.py) rodam numa thread após o commit;
+# os testes as executam na hora com override_settings, pelo mesmo motivo.
+EXCLUSOES_EM_SEGUNDO_PLANO = config('EXCLUSOES_EM_SEGUNDO_PLANO', default=True, cast=bool)
+
+# --- Sincronização do aplicativo (core/services/sincronizacao.py) ---
+# O cursor não passa de alterações mais recentes que a janela (transações confirmadas
+# fora da ordem dos ids); 0 desliga a janela.
+SINCRONIZACAO_JANELA_SEGUNDOS = config('SINCRONIZACAO_JANELA_SEGUNDOS', default=30, cast=int)
+SINCRONIZACAO_TOKEN_DIAS_SEM_USO = config('SINCRONIZACAO_TOKEN_DIAS_SEM_USO', default=90, cast=int)
+# Pedidos de token por IP e por usuário a cada intervalo (em segundos)
+SINCRONIZACAO_TENTATIVAS_TOKEN = config('SINCRONIZACAO_TENTATIVAS_TOKEN', default=10, cast=int)
+SINCRONIZACAO_INTERVALO_TENTATIVAS = config('SINCRONIZACAO_INTERVALO_TENTATIVAS', default=900, cast=int)
+
+# --- Métricas (core/metricas.py) ---
+# Com vários workers do gunicorn, aponte METRICAS_DIR para um diretório comum a eles
+# (e limpe-o ao reiniciar). O /metrics só responde com o token configurado.
+METRICAS_DIR = config('METRICAS_DIR', default='')
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+METRICAS_INTERVALO_GRAVACAO = config('METRICAS_INTERVALO_GRAVACAO', default=5, cast=float)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators